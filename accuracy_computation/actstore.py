@@ -0,0 +1,167 @@
+import glob
+import json
+import os
+import re
+import sys
+import numpy as np
+
+# One append-able store for captured activations instead of a .npy per
+# sentence. A store is a directory holding
+#
+#   data.f32      every token of every sentence, raw float32, (tokens, width)
+#   offsets.npy   int64, sentence i is rows offsets[i]:offsets[i+1]
+#   meta.json     width and dtype
+#
+# The data file is memory-mapped on read, so a sentence is a slice of the
+# map and only the pages actually touched are read in; RAM stays constant
+# however many sentences are stored.
+#
+#   with ActStoreWriter("acts_BERT.store", 3072) as w:
+#       w.append(act)                           # (tokens, 3072) or (1, tokens, 3072)
+#   store = ActStore("acts_BERT.store")
+#   for acts in store: ...                      # acts (tokens, 3072), a view
+#
+# Old per-sentence files convert with
+#   python actstore.py acts_BERT.store acts_BERT_*.npy
+
+DTYPE = np.float32
+DATA_FILE = "data.f32"
+OFFSETS_FILE = "offsets.npy"
+META_FILE = "meta.json"
+
+
+class ActStoreWriter:
+    def __init__(self, path, width, chunk_rows=1 << 14, mode="a"):
+        self.path = path
+        self.width = width
+        self.chunk_rows = chunk_rows      # rows buffered before hitting the disk
+        self.chunk = []
+        self.chunk_len = 0
+        os.makedirs(path, exist_ok=True)
+
+        # Appending to an existing store carries on after its last sentence,
+        # mode "w" starts it over
+        if mode == "a" and os.path.exists(os.path.join(path, META_FILE)):
+            meta = read_meta(path)
+            if meta["width"] != width:
+                raise ValueError(f"Store {path} has width {meta['width']}, got {width}")
+            self.offsets = np.load(os.path.join(path, OFFSETS_FILE)).tolist()
+            # drop anything past the last committed sentence (interrupted run)
+            with open(os.path.join(path, DATA_FILE), "r+b") as f:
+                f.truncate(self.offsets[-1] * width * np.dtype(DTYPE).itemsize)
+        else:
+            self.offsets = [0]
+            open(os.path.join(path, DATA_FILE), "wb").close()
+            self._write_index()
+        self.data = open(os.path.join(path, DATA_FILE), "ab")
+
+    def append(self, act):
+        # one sentence, leading batch dims of size 1 are dropped
+        act = np.ascontiguousarray(act, dtype=DTYPE).reshape(-1, self.width)
+        self.chunk.append(act)
+        self.chunk_len += len(act)
+        self.offsets.append(self.offsets[-1] + len(act))
+        if self.chunk_len >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        for act in self.chunk:
+            self.data.write(act.data)
+        self.data.flush()
+        self.chunk = []
+        self.chunk_len = 0
+        self._write_index()
+
+    def _write_index(self):
+        # index written after the data it points to and swapped in whole, so
+        # a crash leaves the store at its last flush
+        tmp = os.path.join(self.path, OFFSETS_FILE + ".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, np.array(self.offsets, dtype=np.int64))
+        os.replace(tmp, os.path.join(self.path, OFFSETS_FILE))
+        tmp = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"width": self.width, "dtype": np.dtype(DTYPE).str}, f)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+    def close(self):
+        if self.data is not None:
+            self.flush()
+            self.data.close()
+            self.data = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_meta(path):
+    with open(os.path.join(path, META_FILE)) as f:
+        return json.load(f)
+
+
+class ActStore:
+    def __init__(self, path):
+        self.path = path
+        meta = read_meta(path)
+        self.width = meta["width"]
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE))
+        rows = int(self.offsets[-1])
+        if rows:
+            self.data = np.memmap(os.path.join(path, DATA_FILE), dtype=meta["dtype"],
+                                  mode="r", shape=(rows, self.width))
+        else:   # np.memmap can't map an empty file
+            self.data = np.zeros((0, self.width), dtype=meta["dtype"])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        # -> (tokens, width) view of sentence i, nothing is read until used
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Sentence {i} out of range, store has {len(self)}")
+        return self.data[self.offsets[i]:self.offsets[i+1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def tokens(self):
+        # every token of every sentence, (total tokens, width)
+        return self.data
+
+
+def _sentence_number(fname):
+    m = re.search(r"(\d+)\.npy$", fname)
+    return int(m.group(1)) if m else -1
+
+
+def from_npy(path, files, chunk_rows=1 << 14):
+    # acts_BERT_{i}.npy files -> store, in sentence order (not name order)
+    files = sorted(files, key=_sentence_number)
+    if not files:
+        raise ValueError("No .npy files to convert")
+    width = np.load(files[0], mmap_mode="r").shape[-1]
+    with ActStoreWriter(path, width, chunk_rows=chunk_rows, mode="w") as w:
+        for fname in files:
+            w.append(np.load(fname))
+    return len(files)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(f"Usage: python {sys.argv[0]} <store> <acts .npy files/globs...>")
+        sys.exit(1)
+    files = [f for pattern in sys.argv[2:] for f in glob.glob(pattern)]
+    n = from_npy(sys.argv[1], files)
+    print(f"Stored {n} sentences in {sys.argv[1]}")
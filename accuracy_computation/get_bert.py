@@ -1,63 +1,175 @@
-
 #---------------------------------------------------
 #--- !!! DISCLAIMER: THIS SCRIPT IS NOT MINE !!! ---
 #---------------------------------------------------
 
-import torch
-from torch import nn
-import torch.nn.functional as F
-from transformers import BertModel, BertConfig
+import argparse
+import fnmatch
+import re
+import zipfile
 import numpy as np
 
-# Load pre-trained BERT model (or any model variant)
-model = BertModel.from_pretrained('bert-base-uncased')
-
-# Accessing the first FFN layer in BERT (typically located in each transformer block)
-# We'll target the first layer of the first encoder block
-ffn_layer = model.encoder.layer[0].intermediate.dense
-
-# Step 1: Extract Weights
-weights = ffn_layer.weight.data.clone()
-
-# Step 2: Quantize Weights to 16-bit Integers
-# First, we scale the weights to fit into the range of 16-bit integers (-32768 to 32767)
-min_val = weights.min()
-max_val = weights.max()
-scaled_weights = 2 * (weights - min_val) / (max_val - min_val) - 1  # scale to [-1, 1]
-
-# Now quantize to 16-bit integer range
-quantized_weights = (scaled_weights * 32767).round().to(torch.int16)
-
-# Step 3: Prune 50% of the weights (based on magnitude)
-# We can prune by setting the smallest 50% of weights to 0 (magnitude-based pruning)
-
-# Convert weights to a 1D array to easily sort them by magnitude
-flattened_weights = quantized_weights.flatten()
-# Calculate magnitude (absolute value)
-weight_magnitudes = flattened_weights.abs()
-
-# Find the threshold for pruning (50% smallest values)
-threshold = torch.kthvalue(weight_magnitudes, int(flattened_weights.numel() // 2)).values.item()
-
-# Prune weights: Set weights smaller than the threshold to 0
-pruned_weights = torch.where(weight_magnitudes >= threshold, flattened_weights, torch.tensor(0, dtype=torch.int16))
-
-# Reshape the pruned weights back to the original shape of the weight matrix
-pruned_weights = pruned_weights.view(quantized_weights.shape)
-
-# Step 4: Convert the pruned quantized weights back to float32
-pruned_weights_float = pruned_weights.to(torch.float32)
-
-# Update the first FFN layer with the pruned, quantized (converted to float) weights
-ffn_layer.weight.data = pruned_weights_float
-
-# Step 5: Verify and Output the Pruned, Quantized Weights
-# print(f"Original Weights (first FFN layer):\n{weights}")
-# print(f"Quantized Weights (16-bit integers):\n{quantized_weights}")
-# print(f"Pruned Weights (after 50% pruning):\n{pruned_weights_float}")
-
-# Optionally, save the pruned model if needed
-# model.save_pretrained('pruned_bert')
-np.save("pruned_BERT.npy", pruned_weights)
-np.save("orig_BERT.npy", weights)
-
+# Quantize and prune the FFN weights of every encoder layer (or any set of
+# nn.Linear modules) in one pass over a single loaded model. Each layer is
+# processed on its own, a block of rows at a time, and written straight to
+# one compressed archive, so peak memory is about one layer's int16 copy
+# on top of the model:
+#
+#   python get_bert.py                          # all 12 intermediate.dense
+#   python get_bert.py --prune pairs --bits 8
+#
+# The archive is an .npz (np.load reads it), per layer L:
+#   orig_L    float32 weights as in the model, (out, in)
+#   pruned_L  int16 quantized + pruned weights
+#   scale_L   float32, a single value (or per output channel with
+#             --per-channel), w ~ pruned * scale
+# Layer 0 also goes to orig_BERT.npy / pruned_BERT.npy for main.py.
+#
+# Pruning:
+#   magnitude  zero the smallest --ratio of the weights of the layer
+#   pairs      keep the larger |w| of every adjacent pair of rows (2i, 2i+1)
+#              per column, ties to the even one, i.e. the columns of
+#              pruned.T that packed.pack_weights merges. Packing compares
+#              raw values by default and would drop negative survivors;
+#              main.py spots the 2:1 structure and packs by |w|
+#              (magnitude=1, same tie rule), which keeps all of them
+#   none
+
+CHUNK_ROWS = 256
+DEFAULT_MODULES = ["encoder.layer.*.intermediate.dense"]
+
+
+def channel_scales(W, bits, per_channel=1):
+    # symmetric, one scale per output row (or per tensor)
+    qmax = 2**(bits - 1) - 1
+    if per_channel:
+        amax = np.abs(W).max(axis=1)
+    else:
+        amax = np.full(1, np.abs(W).max())
+    return (np.where(amax > 0, amax, 1.0) / qmax).astype(np.float32)
+
+
+def quantize_rows(W, scale, bits, chunk_rows=CHUNK_ROWS):
+    # -> int16, only a block of rows of float temporaries at a time
+    qmax = 2**(bits - 1) - 1
+    Q = np.empty(W.shape, dtype=np.int16)
+    scale = np.broadcast_to(scale.reshape(-1, 1), (W.shape[0], 1))
+    for r in range(0, W.shape[0], chunk_rows):
+        blk = np.asarray(W[r:r + chunk_rows], dtype=np.float32) / scale[r:r + chunk_rows]
+        np.clip(np.rint(blk, out=blk), -qmax, qmax, out=blk)
+        Q[r:r + chunk_rows] = blk
+    return Q
+
+
+def magnitude_threshold(Q, ratio, chunk_rows=CHUNK_ROWS):
+    # k-th smallest |q| (k = ratio of the weights), like torch.kthvalue on
+    # the flattened magnitudes, but from a histogram: the values are
+    # integers, so counting them is exact and needs no full-size copy
+    k = int(Q.size * ratio)
+    if k <= 0:
+        return None
+    counts = np.zeros(2**15 + 1, dtype=np.int64)
+    for r in range(0, Q.shape[0], chunk_rows):
+        counts += np.bincount(np.abs(Q[r:r + chunk_rows].astype(np.int32)).ravel(), minlength=len(counts))
+    return int(np.searchsorted(np.cumsum(counts), k))
+
+
+def prune_magnitude(Q, ratio, chunk_rows=CHUNK_ROWS):
+    # in place, keeps |q| >= threshold like get_bert.py always did
+    threshold = magnitude_threshold(Q, ratio, chunk_rows)
+    if threshold is None:
+        return Q
+    for r in range(0, Q.shape[0], chunk_rows):
+        blk = Q[r:r + chunk_rows]
+        blk[np.abs(blk.astype(np.int32)) < threshold] = 0
+    return Q
+
+
+def prune_pairs(Q, chunk_rows=CHUNK_ROWS):
+    # in place, the loser of every adjacent pair of rows becomes 0
+    if Q.shape[0] % 2:
+        raise ValueError(f"Need an even number of rows to pair, got {Q.shape[0]}")
+    chunk_rows += chunk_rows % 2
+    for r in range(0, Q.shape[0], chunk_rows):
+        blk = Q[r:r + chunk_rows]
+        mag = np.abs(blk.astype(np.int32))
+        odd_wins = mag[1::2] > mag[0::2]
+        blk[0::2][odd_wins] = 0
+        blk[1::2][~odd_wins] = 0
+    return Q
+
+
+def write_array(zf, name, arr):
+    # one .npy member, streamed into the archive
+    with zf.open(name + ".npy", "w", force_zip64=True) as f:
+        np.lib.format.write_array(f, np.asanyarray(arr), allow_pickle=False)
+
+
+def select_linears(model, patterns):
+    # -> [(key, module)], key is the layer number for encoder.layer.L.* and
+    # the module name otherwise
+    from torch import nn
+    out = []
+    for name, module in model.named_modules():
+        if isinstance(module, nn.Linear) and any(fnmatch.fnmatchcase(name, p) for p in patterns):
+            m = re.fullmatch(r"encoder\.layer\.(\d+)\..*", name)
+            out.append((m.group(1) if m else name.replace(".", "_"), module))
+    return out
+
+
+def process_linear(weight, bits=16, prune="magnitude", ratio=0.5, per_channel=0):
+    # weight: (out, in) float array, not modified -> (pruned int16, scale)
+    scale = channel_scales(weight, bits, per_channel)
+    Q = quantize_rows(weight, scale, bits)
+    if prune == "magnitude":
+        prune_magnitude(Q, ratio)
+    elif prune == "pairs":
+        prune_pairs(Q)
+    elif prune != "none":
+        raise ValueError(f"Unknown pruning {prune}")
+    return Q, scale
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quantize and prune BERT linear layers into one archive")
+    parser.add_argument("--model", default="bert-base-uncased")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="module name patterns")
+    parser.add_argument("--bits", type=int, default=16)
+    parser.add_argument("--prune", choices=["magnitude", "pairs", "none"], default="magnitude")
+    parser.add_argument("--ratio", type=float, default=0.5, help="fraction pruned by magnitude")
+    parser.add_argument("--per-channel", action="store_true",
+                        help="one scale per output row instead of per layer, pruned_BERT.npy "
+                             "is then no longer comparable to orig_BERT.npy as main.py does")
+    parser.add_argument("--out", default="weights_BERT.npz")
+    args = parser.parse_args(argv)
+
+    if not 2 <= args.bits <= 16:
+        raise ValueError(f"Bit width {args.bits} not in 2..16")
+
+    import torch
+    from transformers import BertModel
+
+    # Load pre-trained BERT model (or any model variant), once
+    model = BertModel.from_pretrained(args.model).eval()
+    layers = select_linears(model, args.modules)
+    if not layers:
+        raise ValueError(f"No nn.Linear matches {args.modules}")
+
+    with torch.inference_mode(), zipfile.ZipFile(args.out, "w", zipfile.ZIP_DEFLATED) as zf:
+        for key, linear in layers:
+            weights = linear.weight.detach().numpy()    # a view, no copy
+            pruned, scale = process_linear(weights, args.bits, args.prune, args.ratio,
+                                           per_channel=args.per_channel)
+            write_array(zf, f"orig_{key}", weights)
+            write_array(zf, f"pruned_{key}", pruned)
+            write_array(zf, f"scale_{key}", scale)
+            if key == "0":
+                np.save("orig_BERT.npy", weights)
+                np.save("pruned_BERT.npy", pruned)
+            print(f"{key}: {weights.shape}, {100*np.mean(pruned == 0):.1f}% zero")
+            del pruned
+
+    print(f"Wrote {len(layers)} layers to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,85 @@
 # !!!! DISCLAIMER: NOT MY CODE !!!!!
+import argparse
 import torch
 from transformers import BertModel, BertTokenizer
-import numpy as np
+from actstore import ActStoreWriter
 
-def collect_ffn_activations(model, tokenizer, texts):
+
+class _StopForward(Exception):
+    # raised by the hook once the captured layer has run, nothing after it
+    # is needed
+    pass
+
+
+def collect_ffn_activations(model, tokenizer, texts, store, batch_size=32, layer=0):
     """
-    Runs a list of input texts through BERT and collects activation matrices
-    from the first FFN layer.
+    Runs a list of input texts through BERT in padded batches and appends
+    the activation matrix of the given layer's first FFN for each text to an
+    ActStoreWriter, in input order and with the padding tokens removed.
     """
-    ffn_layer = model.encoder.layer[0].intermediate.dense
-
-    activations = []
+    ffn_layer = model.encoder.layer[layer].intermediate.dense
+    batch_mask = None
 
-    # Hook storage
+    # Hook storage, unpadded rows go straight to the store so nothing piles
+    # up in RAM. Stops the forward pass, the remaining layers would only be
+    # thrown away
     def capture_activation(module, input, output):
-        activations.append(output.detach().clone())
+        out = output.numpy()
+        for i, keep in enumerate(batch_mask):
+            store.append(out[i][keep])
+        raise _StopForward()
 
     # Register the hook one time
     hook = ffn_layer.register_forward_hook(capture_activation)
 
     # Run all texts
-    with torch.no_grad():
-        for text in texts:
-            inputs = tokenizer(text, return_tensors="pt")
-            model(**inputs)
+    try:
+        with torch.inference_mode():
+            for lo in range(0, len(texts), batch_size):
+                inputs = tokenizer(texts[lo:lo + batch_size], padding=True, return_tensors="pt")
+                batch_mask = inputs["attention_mask"].numpy().astype(bool)
+                try:
+                    model(**inputs)
+                except _StopForward:
+                    pass
+    finally:
+        # Remove hook
+        hook.remove()
 
-    # Remove hook
-    hook.remove()
-
-    return activations
+    return len(store)
 
 
 # -----------------------------
 # Example Usage
 # -----------------------------
 
-# Load model + tokenizer
-model = BertModel.from_pretrained("bert-base-uncased")
-tokenizer = BertTokenizer.from_pretrained("bert-base-uncased")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Capture BERT FFN activations into an activation store")
+    parser.add_argument("--num", type=int, default=100, help="number of sentences")
+    parser.add_argument("--batch", type=int, default=32, help="sentences per forward pass")
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads (0 = torch default)")
+    parser.add_argument("--layer", type=int, default=0, help="encoder layer to capture")
+    parser.add_argument("--out", default="acts_BERT.store")
+    parser.add_argument("--append", action="store_true", help="add to an existing store instead of replacing it")
+    args = parser.parse_args(argv)
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    # Load model + tokenizer
+    model = BertModel.from_pretrained("bert-base-uncased").eval()
+    tokenizer = BertTokenizer.from_pretrained("bert-base-uncased")
 
-# Number of activation matrices you want
-N = 100
+    # Example generated sentences (replace with your dataset)
+    texts = [f"This is example sentence number {i}." for i in range(args.num)]
 
-# Example generated sentences (replace with your dataset)
-texts = [f"This is example sentence number {i}." for i in range(N)]
+    # Collect the activation matrices into one store (see actstore.py)
+    with ActStoreWriter(args.out, model.config.intermediate_size,
+                        mode="a" if args.append else "w") as store:
+        n = collect_ffn_activations(model, tokenizer, texts, store,
+                                    batch_size=args.batch, layer=args.layer)
+    print(f"Stored {n} activation matrices in {args.out}")
 
-# Collect N activation matrices
-activation_matrices = collect_ffn_activations(model, tokenizer, texts)
 
-# Display results
-for i, act in enumerate(activation_matrices):
-    print(f"Activation #{i} shape:", act.shape)
-    np.save(f"acts_BERT_{i}.npy", act)
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,9 @@
+import glob
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.ticker import PercentFormatter
-
-orig_weights   = np.load("orig_BERT.npy")
-pruned_weights = np.load("pruned_BERT.npy")
+from packed import pack_weights, packed_matmul, is_pair_pruned
+from actstore import ActStore, from_npy
+from metrics import percent_difference_stats
 
 def mymatmul(W, acts):
     m = len(W)
@@ -22,59 +22,80 @@ def mymatmul(W, acts):
     return y
 
 
-def percent_difference_stats(A, B):
-    pct_diff = (np.abs(A - B) / ((np.abs(A) + np.abs(B)) / 2)) * 100
-    flat = pct_diff.flatten()
-    median = np.median(flat)
-    p25 = np.percentile(flat, 25)
-    p75 = np.percentile(flat, 75)
-
-    return median, p25, p75, pct_diff
-
-
-medians = []
-p25s = []
-p75s = []
-for i in range(20):
-    print(i)
-    example_acts_mat = np.load(f"acts_BERT_{i}.npy")[0]
-
-    p50sum = 0
-    p25sum = 0
-    p75sum = 0
-    # for example_acts_vec in example_acts_mat:
-    for example_acts_vec in example_acts_mat[:1]:
-        print(orig_weights.shape, example_acts_vec.shape)
-
-        orig_res = np.matmul(orig_weights.T, example_acts_vec)
-        merge_res = mymatmul(pruned_weights.T, example_acts_vec)
-
-        p50, p25, p75, _ = percent_difference_stats(orig_res, merge_res)
-        p50sum += p50
-        p25sum += p25
-        p75sum += p75
-
-    # p50sum /= len(example_acts_mat)
-    # p25sum /= len(example_acts_mat)
-    # p75sum /= len(example_acts_mat)
-    medians.append(p50sum)
-    p25s.append(p25sum)
-    p75s.append(p75sum)
-    print(p50sum)
-
-medians = np.array(medians)
-p25s = np.array(p25s)
-p75s = np.array(p75s)
-
-yerr_low = medians - p25s
-yerr_upp = p75s - medians 
-yerr = np.vstack([yerr_low, yerr_upp])
-
-plt.figure(figsize=(8,5))
-plt.errorbar(np.arange(len(medians)), medians, yerr=yerr, fmt='r-x', capsize=5)
-plt.ylim(150,250)
-plt.gca().yaxis.set_major_formatter(PercentFormatter())
-plt.xlabel("Run")
-plt.ylabel("% difference")
-plt.title("Median % diff of sparse packed multiplication and INT16 with 25/75 percentiles")
-plt.show()
+def pack_pruned(pruned_weights):
+    # Dominance mask worked out once, every token after that is a matmul.
+    # Pair-pruned weights (get_bert.py --prune pairs) already hold at most
+    # one weight per pair, compared by |w| that one survives whatever its
+    # sign; anything else is merged by raw value like mymatmul
+    W = pruned_weights.T
+    return pack_weights(W, magnitude=is_pair_pruned(W))
+
+
+def check_packed(packed, pruned_weights, vec):
+    # the kernel against the reference loop on one token (slow, O(m*n)
+    # Python), run with CHECK_PACKED=1. mymatmul would drop the negative
+    # survivors of pair pruning, those are checked against the plain product
+    if is_pair_pruned(pruned_weights.T):
+        ref = pruned_weights.T @ vec
+    else:
+        ref = mymatmul(pruned_weights.T, vec)
+    assert np.allclose(packed_matmul(packed, vec), ref, rtol=1e-3)
+
+
+def sentence_stats(orig_weights, packed, acts, verb=1):
+    # -> medians, p25s, p75s, one per sentence of acts
+    medians = []
+    p25s = []
+    p75s = []
+    for i, example_acts_mat in enumerate(acts):    # (tokens, 3072)
+        if verb:
+            print(i)
+
+        # every token at once, rows are orig_weights.T @ example_acts_vec
+        orig_res = example_acts_mat @ orig_weights
+        merge_res = packed_matmul(packed, example_acts_mat)
+
+        # stats per token, averaged over the sentence
+        p50, p25, p75, _ = percent_difference_stats(orig_res, merge_res, axis=-1)
+        medians.append(p50.mean())
+        p25s.append(p25.mean())
+        p75s.append(p75.mean())
+        if verb:
+            print(medians[-1])
+
+    return np.array(medians), np.array(p25s), np.array(p75s)
+
+
+def plot(medians, p25s, p75s):
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import PercentFormatter
+
+    yerr_low = medians - p25s
+    yerr_upp = p75s - medians 
+    yerr = np.vstack([yerr_low, yerr_upp])
+
+    plt.figure(figsize=(8,5))
+    plt.errorbar(np.arange(len(medians)), medians, yerr=yerr, fmt='r-x', capsize=5)
+    plt.ylim(150,250)
+    plt.gca().yaxis.set_major_formatter(PercentFormatter())
+    plt.xlabel("Sentence")
+    plt.ylabel("% difference")
+    plt.title("Median % diff of sparse packed multiplication and INT16 with 25/75 percentiles")
+    plt.show()
+
+
+if __name__ == "__main__":
+    orig_weights   = np.load("orig_BERT.npy")
+    pruned_weights = np.load("pruned_BERT.npy")
+
+    # Activations as captured by get_bert_act.py, older per-sentence .npy
+    # captures are converted once
+    if not os.path.exists("acts_BERT.store"):
+        from_npy("acts_BERT.store", glob.glob("acts_BERT_*.npy"))
+    acts = ActStore("acts_BERT.store")
+
+    packed = pack_pruned(pruned_weights)
+    if os.environ.get("CHECK_PACKED"):
+        check_packed(packed, pruned_weights, acts[0][0])
+
+    plot(*sentence_stats(orig_weights, packed, acts))
@@ -0,0 +1,12 @@
+import numpy as np
+
+
+def percent_difference_stats(A, B, axis=None):
+    # axis=None => over all elements, axis=-1 => one set of stats per row
+    pct_diff = (np.abs(A - B) / ((np.abs(A) + np.abs(B)) / 2)) * 100
+    flat = pct_diff.flatten() if axis is None else pct_diff
+    median = np.median(flat, axis=axis)
+    p25 = np.percentile(flat, 25, axis=axis)
+    p75 = np.percentile(flat, 75, axis=axis)
+
+    return median, p25, p75, pct_diff
@@ -0,0 +1,53 @@
+import numpy as np
+
+# Vectorised version of mymatmul (main.py): adjacent columns 2j, 2j+1 of W
+# are merged, only the larger weight survives and it is multiplied with the
+# matching activation. The dominance mask only depends on W, so it is
+# worked out once and every product after that is two plain matmuls:
+#
+#   packed = pack_weights(pruned_weights.T)
+#   res = packed_matmul(packed, acts)      # acts (tokens, n) -> (tokens, m)
+
+
+def dominance_mask(W, magnitude=0):
+    # True where the even column wins. Same comparison as mymatmul, so on
+    # a tie the odd column is kept. magnitude=1 compares |W| instead, which
+    # is what the hardware packing (uart_comms/sparse.py) does
+    W = np.asarray(W)
+    if magnitude:
+        return np.abs(W[:, 0::2]) >= np.abs(W[:, 1::2])
+    return W[:, 0::2] > W[:, 1::2]
+
+
+def is_pair_pruned(W):
+    # at most one nonzero weight per pair of columns, as get_bert.py
+    # --prune pairs leaves them (for W = pruned.T)
+    W = np.asarray(W)
+    return W.shape[1] % 2 == 0 and bool(np.all((W[:, 0::2] == 0) | (W[:, 1::2] == 0)))
+
+
+def pack_weights(W, magnitude=0):
+    # -> (even, odd), each (m, n/2) with the losing weight of every pair zeroed
+    W = np.asarray(W, dtype=np.float64)
+    if W.shape[1] % 2:
+        raise ValueError(f"Need an even number of columns to pack, got {W.shape[1]}")
+    mask = dominance_mask(W, magnitude)
+    even = np.where(mask, W[:, 0::2], 0.0)
+    odd = np.where(mask, 0.0, W[:, 1::2])
+    return even, odd
+
+
+def packed_matmul(packed, acts):
+    # acts (n,) or (tokens, n) -> (m,) or (tokens, m)
+    even, odd = packed
+    acts = np.asarray(acts, dtype=np.float64)
+    return acts[..., 0::2] @ even.T + acts[..., 1::2] @ odd.T
+
+
+def dense_equivalent(packed):
+    # the (m, n) matrix the packed unit effectively multiplies with
+    even, odd = packed
+    W = np.empty((even.shape[0], 2*even.shape[1]), dtype=even.dtype)
+    W[:, 0::2] = even
+    W[:, 1::2] = odd
+    return W
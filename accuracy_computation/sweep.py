@@ -0,0 +1,183 @@
+import argparse
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+from actstore import ActStore
+from get_bert import channel_scales, quantize_rows
+from metrics import percent_difference_stats
+from packed import pack_weights, packed_matmul
+
+# Accuracy sweep over (layer, bit width, prune ratio, packing scheme). main.py
+# studies one point of this grid; here every configuration runs as a job on
+# a process pool and its row is printed (and appended to --out) as soon as
+# it finishes:
+#
+#   python sweep.py --bits 4 8 12 16 --prune 0 0.25 0.5 0.75 --workers 8
+#
+# The float weights of each layer are loaded once by the parent and put in
+# shared memory, workers map them instead of each getting a pickled copy.
+# Activations come from an activation store (actstore.py), which every
+# worker memory-maps, so the page cache is shared too.
+#
+# Unlike main.py the quantized weights are scaled back before comparing, so
+# the % difference is the error of quantize + prune + pack alone.
+#
+# Weights: a .npy holds layer 0 only (orig_BERT.npy from get_bert.py), an
+# .npz holds orig_{layer} arrays. Both are (intermediate, hidden) like
+# intermediate.dense.weight, results are acts @ W as in main.py.
+
+SCHEMES = {
+    "dense": None,      # quantize + prune only
+    "pairs": 0,         # adjacent-column packing, raw compare like mymatmul
+    "pairs_abs": 1,     # same, |W| compare like the hardware (sparse.py)
+}
+COLUMNS = ["layer", "bits", "prune", "sparsity", "scheme", "tokens", "median", "p25", "p75", "secs"]
+
+
+def load_layer_weights(path, layers):
+    if path.endswith(".npz"):
+        with np.load(path) as archive:
+            return {layer: np.asarray(archive[f"orig_{layer}"], dtype=np.float32) for layer in layers}
+    if list(layers) != [0]:
+        raise ValueError(f"{path} only holds layer 0, use an .npz for more layers")
+    return {0: np.asarray(np.load(path), dtype=np.float32)}
+
+
+def quantize(W, bits):
+    # symmetric, per tensor, -> (ints, scale)
+    scale = channel_scales(W, bits, per_channel=0)
+    return quantize_rows(W, scale, bits), float(scale[0])
+
+
+def prune(Q, ratio):
+    # zero exactly round(ratio * size) of the weights, smallest magnitude
+    # first. At a few bits most weights tie with the threshold, so unlike
+    # get_bert.py the ties are broken by position (lowest flat index goes
+    # first) instead of all being kept
+    out = Q.copy()
+    k = int(round(ratio * Q.size))
+    if k <= 0:
+        return out
+    key = np.abs(Q.astype(np.int64)).ravel() * Q.size + np.arange(Q.size)
+    out.ravel()[np.argpartition(key, k - 1)[:k]] = 0
+    return out
+
+
+# ---- workers ----
+
+_weights = {}       # layer -> ndarray backed by the parent's shared memory
+_shms = []
+
+
+def _attach(specs):
+    for layer, (name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _shms.append(shm)
+        _weights[layer] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def run_config(layer, bits, ratio, scheme, acts_path, num):
+    start = time.time()
+    W = _weights[layer]
+    Q, scale = quantize(W, bits)
+    Q = prune(Q, ratio)
+    if SCHEMES[scheme] is None:
+        approx = lambda acts: (acts @ Q) * scale
+    else:
+        packed = pack_weights(Q.T, SCHEMES[scheme])
+        approx = lambda acts: packed_matmul(packed, acts) * scale
+
+    store = ActStore(acts_path.format(layer=layer))
+    count = len(store) if num is None else min(num, len(store))
+    p50s, p25s, p75s = [], [], []
+    for i in range(count):
+        acts = np.asarray(store[i], dtype=np.float64)
+        p50, p25, p75, _ = percent_difference_stats(acts @ W, approx(acts), axis=-1)
+        p50s.append(p50)
+        p25s.append(p25)
+        p75s.append(p75)
+    p50s, p25s, p75s = (np.concatenate(x) for x in (p50s, p25s, p75s))
+    return {
+        "layer": layer, "bits": bits, "prune": ratio, "scheme": scheme,
+        "sparsity": float(np.mean(Q == 0)),     # achieved, quantization zeros too
+        "tokens": len(p50s),
+        "median": float(np.mean(p50s)),
+        "p25": float(np.mean(p25s)),
+        "p75": float(np.mean(p75s)),
+        "secs": time.time() - start,
+    }
+
+
+# ---- driver ----
+
+def format_row(row):
+    return "\t".join(f"{row[c]:.3f}" if isinstance(row[c], float) else str(row[c]) for c in COLUMNS)
+
+
+def sweep(weights, configs, acts_path, num=None, workers=None, out=None):
+    # weights {layer: W}, configs [(layer, bits, ratio, scheme)], yields rows
+    # in completion order
+    shms = []
+    specs = {}
+    try:
+        for layer, W in weights.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(W.nbytes, 1))
+            shms.append(shm)
+            np.ndarray(W.shape, dtype=W.dtype, buffer=shm.buf)[...] = W
+            specs[layer] = (shm.name, W.shape, W.dtype.str)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(specs,)) as pool:
+            futures = [pool.submit(run_config, *cfg, acts_path, num) for cfg in configs]
+            for fut in as_completed(futures):
+                row = fut.result()
+                if out is not None:
+                    out.write(format_row(row) + "\n")
+                    out.flush()
+                yield row
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Accuracy sweep of quantized, pruned and packed weights")
+    parser.add_argument("--weights", default="orig_BERT.npy", help=".npy (layer 0) or .npz with orig_{layer}")
+    parser.add_argument("--acts", default="acts_BERT.store", help="activation store, may contain {layer}")
+    parser.add_argument("--layers", type=int, nargs="+", default=[0])
+    parser.add_argument("--bits", type=int, nargs="+", default=[16])
+    parser.add_argument("--prune", type=float, nargs="+", default=[0.5])
+    parser.add_argument("--schemes", nargs="+", choices=list(SCHEMES), default=list(SCHEMES))
+    parser.add_argument("--num", type=int, help="sentences per configuration (default all)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--out", help="append rows to this TSV as well")
+    args = parser.parse_args(argv)
+
+    for b in args.bits:
+        if not 2 <= b <= 16:
+            raise ValueError(f"Bit width {b} not in 2..16")
+    weights = load_layer_weights(args.weights, args.layers)
+    configs = list(itertools.product(args.layers, args.bits, args.prune, args.schemes))
+
+    out = None
+    if args.out:
+        new = not os.path.exists(args.out)
+        out = open(args.out, "a")
+        if new:
+            out.write("\t".join(COLUMNS) + "\n")
+    print("\t".join(COLUMNS))
+    try:
+        for row in sweep(weights, configs, args.acts, num=args.num, workers=args.workers, out=out):
+            print(format_row(row))
+            sys.stdout.flush()
+    finally:
+        if out is not None:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
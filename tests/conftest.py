@@ -0,0 +1,29 @@
+import os
+import sys
+import pytest
+
+# The modules import each other flat (from codec import ...), as when run
+# from their own directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for sub in ("uart_comms", "accuracy_computation"):
+    sys.path.insert(0, os.path.join(ROOT, sub))
+
+
+@pytest.fixture
+def board():
+    # board(N=8, **emulator kwargs) -> (emulator, SAUnit on its pty), both
+    # closed after the test
+    from emulator import FPGAEmulator
+    from utility import SAUnit
+    opened = []
+
+    def open_board(N=8, unit_kwargs=None, **emu_kwargs):
+        emu = FPGAEmulator(N=N, **emu_kwargs)
+        unit = SAUnit(emu.start(), N=N, **(unit_kwargs or {}))
+        opened.append((emu, unit))
+        return emu, unit
+
+    yield open_board
+    for emu, unit in opened:
+        unit.close()
+        emu.stop()
@@ -0,0 +1,61 @@
+import os
+import numpy as np
+import pytest
+from actstore import ActStore, ActStoreWriter, DATA_FILE, from_npy
+
+
+def sentences(rng, n, width=6):
+    return [rng.normal(size=(3 + i % 4, width)).astype(np.float32) for i in range(n)]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "acts.store")
+    acts = sentences(np.random.default_rng(0), 7)
+    with ActStoreWriter(path, 6, chunk_rows=5) as w:
+        for act in acts:
+            w.append(act[None])             # (1, tokens, width) as BERT gives them
+    store = ActStore(path)
+    assert len(store) == 7
+    assert list(store.lengths()) == [len(a) for a in acts]
+    assert all(np.array_equal(got, want) for got, want in zip(store, acts))
+    assert np.array_equal(store[-1], acts[-1])
+    assert np.array_equal(store.tokens(), np.concatenate(acts))
+    with pytest.raises(IndexError):
+        store[7]
+
+
+def test_append_carries_on(tmp_path):
+    path = str(tmp_path / "acts.store")
+    acts = sentences(np.random.default_rng(1), 5)
+    with ActStoreWriter(path, 6) as w:
+        for act in acts[:3]:
+            w.append(act)
+    # an interrupted run leaves rows past the index, they are dropped
+    with open(os.path.join(path, DATA_FILE), "ab") as f:
+        f.write(np.ones((2, 6), dtype=np.float32).tobytes())
+    with ActStoreWriter(path, 6) as w:
+        assert len(w) == 3
+        for act in acts[3:]:
+            w.append(act)
+    store = ActStore(path)
+    assert all(np.array_equal(got, want) for got, want in zip(store, acts))
+    assert len(store) == 5
+
+    with pytest.raises(ValueError):
+        ActStoreWriter(path, 7)
+    ActStoreWriter(path, 6, mode="w").close()
+    assert len(ActStore(path)) == 0
+
+
+def test_from_npy_in_sentence_order(tmp_path):
+    acts = sentences(np.random.default_rng(2), 12)
+    files = []
+    for i, act in enumerate(acts):
+        fname = str(tmp_path / f"acts_BERT_{i}.npy")
+        np.save(fname, act[None])
+        files.append(fname)
+    path = str(tmp_path / "acts.store")
+    assert from_npy(path, sorted(files)) == 12       # name order puts 10 before 2
+    assert all(np.array_equal(got, want) for got, want in zip(ActStore(path), acts))
+    with pytest.raises(ValueError):
+        from_npy(path, [])
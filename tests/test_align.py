@@ -0,0 +1,11 @@
+import numpy as np
+
+
+def test_alignment_polls_for_the_ack(board):
+    # the 0C is picked up as soon as it is in, not after a fixed 10 ms
+    _, unit = board(vector_mode=1)
+    aligns = []
+    for _ in range(10):
+        assert unit.rand_test(vector_mode=1, bulk=1)[0]
+        aligns.append(unit.phases['align'])
+    assert np.median(aligns) < 0.005
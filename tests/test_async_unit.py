@@ -0,0 +1,79 @@
+import asyncio
+import time
+import numpy as np
+import pytest
+from emulator import FPGAEmulator
+from async_unit import AsyncSAUnit
+
+
+def wait_for(cond, timeout=2.0):
+    # the emulator counts an op once the host's 1C is in, a little after
+    # read_data returns
+    end = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.002)
+    return True
+
+
+def run_on(emus, coro):
+    # coro(units) against one AsyncSAUnit per emulator, all closed after
+    async def main():
+        units = [await AsyncSAUnit.open(emu.port, N=emu.N, settle=1) for emu in emus]
+        try:
+            return await coro(units)
+        finally:
+            for unit in units:
+                unit.close()
+    try:
+        return asyncio.run(main())
+    finally:
+        for emu in emus:
+            emu.stop()
+
+
+@pytest.mark.parametrize("vector_mode", [1, 0])
+def test_rand_test(vector_mode):
+    emu = FPGAEmulator(N=8, vector_mode=vector_mode)
+    emu.start()
+
+    async def ops(units):
+        return [await units[0].rand_test(vector_mode=vector_mode) for _ in range(5)]
+
+    results = run_on([emu], ops)
+    assert all(correct for correct, _, _ in results)
+    assert wait_for(lambda: emu.ops == 5)
+
+
+def test_boards_run_concurrently():
+    emus = [FPGAEmulator(N=8, vector_mode=1) for _ in range(3)]
+    for emu in emus:
+        emu.start()
+    rng = np.random.default_rng(0)
+    weights = rng.integers(0, 100, (3, 8, 8))
+    acts = rng.integers(0, 100, (3, 8))
+
+    async def one(unit, w, a):
+        assert (await unit.write_data(a, w, vector_mode=1))[0]
+        return (await unit.read_data(vector_mode=1, timeout=2))[0]
+
+    async def ops(units):
+        return await asyncio.gather(*(one(u, w, a) for u, w, a in zip(units, weights, acts)))
+
+    results = run_on(emus, ops)
+    for result, w, a in zip(results, weights, acts):
+        assert np.array_equal(np.asarray(result), w.T @ a)
+    assert wait_for(lambda: [emu.ops for emu in emus] == [1, 1, 1])
+
+
+def test_switch_mode():
+    emu = FPGAEmulator(N=8, vector_mode=1)
+    emu.start()
+
+    async def ops(units):
+        await units[0].switch_mode(0)
+        return await units[0].rand_test(vector_mode=0)
+
+    assert run_on([emu], ops)[0]
+    assert emu.vector_mode == 0
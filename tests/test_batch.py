@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+import codec
+from instrument import Instrument
+from sparse import prune_columns
+
+
+@pytest.mark.parametrize("B", [1, 5, codec.BATCH_MAX + 3])
+def test_mvm_batch(board, B):
+    instr = Instrument()
+    _, unit = board(vector_mode=1, unit_kwargs={"instrument": instr})
+    rng = np.random.default_rng(B)
+    acts = rng.integers(0, 100, (B, 8))
+    weights = rng.integers(0, 100, (8, 8))
+    assert np.array_equal(np.asarray(unit.mvm_batch(acts, weights)), (acts @ weights) % 65536)
+    assert instr.counters["batched_vectors"] == B
+
+
+def test_mvm_batch_sparse(board):
+    _, unit = board(vector_mode=1)
+    rng = np.random.default_rng(0)
+    acts = rng.integers(0, 100, (6, 8))
+    weights = rng.integers(-100, 100, (8, 8))
+    result = unit.mvm_batch(acts, weights, sparse=1)
+    assert np.array_equal(np.asarray(result), (acts @ prune_columns(weights)) % 65536)
+
+
+def test_mvm_batch_without_batch_cap(board):
+    # one handshake per vector, same results
+    instr = Instrument()
+    _, unit = board(vector_mode=1, caps=0, unit_kwargs={"instrument": instr})
+    rng = np.random.default_rng(1)
+    acts = rng.integers(0, 100, (4, 8))
+    weights = rng.integers(0, 100, (8, 8))
+    assert np.array_equal(np.asarray(unit.mvm_batch(acts, weights)), acts @ weights)
+    assert "batched_vectors" not in instr.counters
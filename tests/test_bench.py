@@ -0,0 +1,33 @@
+import json
+import bench
+
+KEYS = {"N", "mode", "baudrate", "batch", "batched", "ops", "correct", "elapsed_s",
+        "tiles_per_s", "tiles_per_s_p50_batch", "tx_bytes", "rx_bytes",
+        "wire_bytes_per_s", "latency_ms", "phases_ms"}
+
+
+def test_output_schema(tmp_path):
+    path = tmp_path / "res.jsonl"
+    bench.main(["--emulate", "--no-throttle", "--N", "2", "8", "--modes", "mvm", "mmm",
+                "--batch", "1", "3", "--repeats", "2", "--out", str(path)])
+    rows = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(r["N"], r["mode"], r["batch"]) for r in rows] == [
+        (N, mode, batch) for N in (2, 8) for mode in ("mvm", "mmm") for batch in (1, 3)]
+    for r in rows:
+        assert set(r) == KEYS
+        assert r["ops"] == 2 * r["batch"] and r["correct"] == r["ops"]
+        assert r["batched"] == (r["mode"] == "mvm" and r["batch"] > 1)
+        assert r["baudrate"] == 921600
+        assert r["tx_bytes"] > 0 and r["rx_bytes"] > 0
+        assert set(r["latency_ms"]) == {"p50", "p95", "p99"}
+        assert set(r["phases_ms"]) == set(bench.PHASES)
+        assert all(set(p) == {"p50", "p95", "p99"} for p in r["phases_ms"].values())
+
+
+def test_stdout_is_json_only(capsys, tmp_path):
+    trace = tmp_path / "trace.jsonl"
+    bench.main(["--emulate", "--no-throttle", "--N", "4", "--modes", "mvm", "--batch", "1",
+                "--repeats", "1", "--trace", str(trace)])
+    out = capsys.readouterr().out
+    assert set(json.loads(out)) == KEYS
+    assert any("phase" in json.loads(line) for line in trace.read_text().splitlines())
@@ -0,0 +1,57 @@
+import numpy as np
+import codec
+from utility import SAUnit
+
+
+def reference_unit(N):
+    # pack_matrix/pack_vector as they were, one build_dataframe per value
+    unit = SAUnit.__new__(SAUnit)
+    unit.N = N
+
+    def pack_matrix(mat, is_weights=1):
+        ret = b""
+        for y_ix in range(N):
+            for x_ix in range(N):
+                ret += unit.build_dataframe(0, is_weights, x_ix, y_ix, int(mat[x_ix][y_ix]))
+        return ret
+
+    def pack_vector(vec):
+        ret = b""
+        for y_ix in range(N):
+            ret += unit.build_dataframe(0, 0, 0, y_ix, int(vec[y_ix]))
+        return ret
+
+    return unit, pack_matrix, pack_vector
+
+
+def test_pack_matches_build_dataframe():
+    rng = np.random.default_rng(0)
+    for N in (2, 4, 8, 16):
+        unit, ref_matrix, ref_vector = reference_unit(N)
+        mat = rng.integers(0, 1 << 16, (N, N))
+        vec = rng.integers(0, 1 << 16, N)
+        assert unit.pack_matrix(mat) == ref_matrix(mat)
+        assert unit.pack_matrix(mat, is_weights=0) == ref_matrix(mat, is_weights=0)
+        assert unit.pack_vector(vec) == ref_vector(vec)
+
+
+def test_pack_wraps_like_build_dataframe():
+    unit, ref_matrix, ref_vector = reference_unit(4)
+    mat = np.array([[-1, 1 << 16, 70000, 5]] * 4)
+    assert unit.pack_matrix(mat) == ref_matrix(mat)
+    assert unit.pack_vector(mat[0]) == ref_vector(mat[0])
+
+
+def test_decode_inverts_encode():
+    rng = np.random.default_rng(1)
+    fields = [rng.integers(0, 2, 50), rng.integers(0, 2, 50), rng.integers(0, 128, 50),
+              rng.integers(0, 128, 50), rng.integers(0, 1 << 16, 50)]
+    for dtype in (codec.TX_DTYPE, codec.RX_DTYPE):
+        buf = codec.frames_to_bytes(codec.encode_frames(*fields), dtype)
+        decoded = codec.decode_frames(codec.bytes_to_frames(buf, dtype))
+        for got, want in zip(decoded, fields):
+            assert np.array_equal(got, want)
+
+
+def test_to_signed():
+    assert list(codec.to_signed(np.array([0, 1, 0x7FFF, 0x8000, 0xFFFF]))) == [0, 1, 32767, -32768, -1]
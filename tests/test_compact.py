@@ -0,0 +1,81 @@
+import time
+import numpy as np
+import pytest
+import codec
+from compact import pack_blocks, parse_block, block_words, CONTROL_WORDS
+
+
+def unpack(wire):
+    # -> [(aw, x, y)] of each block's first value, all values in order
+    blocks = codec.bytes_to_frames(wire, codec.TX_DTYPE)
+    heads, values = [], []
+    while len(blocks):
+        consumed, block = parse_block(blocks)
+        assert block is not None
+        blocks = blocks[consumed:]
+        heads.append(block[:3])
+        values.append(block[3])
+    return heads, values
+
+
+def test_blocks_round_trip():
+    rng = np.random.default_rng(1)
+    payload = codec.pack_matrix(rng.integers(0, 1 << 16, (8, 8)))
+    words = codec.bytes_to_frames(payload, codec.TX_DTYPE)
+    _, aw, xix, yix, data = codec.decode_frames(words)
+    keep = np.ones(len(words), dtype=bool)
+    keep[[3, 4, 20]] = False
+    heads, values = unpack(pack_blocks(payload, keep=keep, max_count=16))
+
+    # each block starts at a kept frame and the rest follow in payload order
+    kept = np.flatnonzero(keep)
+    starts = np.concatenate([[0], np.cumsum([len(v) for v in values])[:-1]])
+    assert [(aw[kept[s]], xix[kept[s]], yix[kept[s]]) for s in starts] == heads
+    assert np.array_equal(np.concatenate(values), data[keep])
+
+
+def test_block_bad_crc():
+    payload = codec.pack_vector(np.arange(8))
+    blocks = codec.bytes_to_frames(pack_blocks(payload), codec.TX_DTYPE).copy()
+    assert len(blocks) == block_words(8)
+    blocks[1] ^= 1
+    assert parse_block(blocks)[1] is None
+
+
+@pytest.mark.parametrize("value", [0xFFFF, 0xFEFE, 0xFDFD])
+def test_no_control_words_in_blocks(value):
+    rng = np.random.default_rng(value)
+    mat = rng.choice([value, value, 7], (8, 8))
+    payload = codec.pack_matrix(mat)
+    wire = pack_blocks(payload)
+    assert not np.isin(codec.bytes_to_frames(wire, codec.TX_DTYPE), CONTROL_WORDS).any()
+    _, values = unpack(wire)
+    assert np.array_equal(np.concatenate(values), codec.decode_frames(
+        codec.bytes_to_frames(payload, codec.TX_DTYPE))[4])
+
+
+def test_minus_one_pairs_on_the_emulator(board):
+    # (-1, -1) would pack to FFFFFFFF and reset the board mid transfer
+    emu, unit = board(vector_mode=1, unit_kwargs={"compact": 1})
+    acts = np.full(8, -1)
+    weights = np.arange(64).reshape(8, 8)
+    for _ in range(3):
+        succ, _ = unit.write_data(acts, weights, vector_mode=1)
+        assert succ
+        result, _ = unit.read_data(vector_mode=1, bulk=1)
+        assert np.array_equal(np.asarray(result), (weights.T @ acts) % 65536)
+    assert emu.blocks_rx > 0
+    assert emu.resets == 0
+
+
+def test_emulator_resets_inside_a_block(board):
+    emu, unit = board(vector_mode=1, unit_kwargs={"compact": 1})
+    assert unit.rand_test(vector_mode=1, bulk=1)[0]
+    # a block cut short by a reset, the way the RTL would take it
+    block = pack_blocks(codec.pack_matrix(np.ones((8, 8), dtype=np.int64)))
+    unit.ser.write(codec.DEADBEEF_TX)
+    unit.ser.write(codec.COMPACT_PREFIX + codec.MAGIC_TX + block[:12] + codec.RESET)
+    end = time.monotonic() + 2
+    while emu.resets == 0 and time.monotonic() < end:
+        time.sleep(0.005)
+    assert emu.resets == 1
@@ -0,0 +1,82 @@
+import math
+import numpy as np
+import pytest
+from bench import CountingSerial
+from costmodel import CostModel
+from residency import ResidencyCache
+
+
+@pytest.mark.parametrize("mode,vector_mode", [("mvm", 1), ("mmm", 0)])
+def test_wire_bytes_match_emulator(board, mode, vector_mode):
+    _, unit = board(vector_mode=vector_mode)
+    unit.ser = CountingSerial(unit.ser)
+    unit.rx.attach(unit.ser)
+    unit.rand_test(vector_mode=vector_mode, bulk=1)     # alignment and CAPS probe out of the way
+    model = CostModel(N=8)
+    for _ in range(5):
+        tx, rx = unit.ser.tx_bytes, unit.ser.rx_bytes
+        assert unit.rand_test(vector_mode=vector_mode, bulk=1)[0]
+        assert (unit.ser.tx_bytes - tx, unit.ser.rx_bytes - rx) == model.wire_bytes(mode)
+
+
+@pytest.mark.parametrize("P,batch", [(1, 1), (20, 1), (20, 8), (20, 20), (300, 128)])
+def test_problem_handshakes(P, batch):
+    model = CostModel(N=8)
+    M, K = 24, 40
+    Mt, Kt = 3, 5
+    costs = model.problem(M, K, P, batch=batch, modes=('mvm',))
+    assert costs['mvm']['handshakes'] == Mt * Kt * math.ceil(P / batch)
+    assert costs['mvm']['ops'] == Mt * Kt * P
+
+
+
+def counted(unit):
+    unit.ser = CountingSerial(unit.ser)
+    unit.rx.attach(unit.ser)
+    unit.rand_test(vector_mode=1, bulk=1)   # alignment and CAPS probe out of the way
+    return unit.ser
+
+
+def delta(ser, op):
+    tx, rx = ser.tx_bytes, ser.rx_bytes
+    op()
+    return (ser.tx_bytes - tx, ser.rx_bytes - rx)
+
+
+def test_wire_bytes_resident_compact_batch(board):
+    model = CostModel(N=8)
+    rng = np.random.default_rng(0)
+    weights = rng.integers(0, 100, (8, 8))
+
+    _, unit = board(vector_mode=1, unit_kwargs={"residency": ResidencyCache()})
+    ser = counted(unit)
+
+    def mvm(sparse=0):
+        assert unit.write_data(rng.integers(0, 100, 8), weights, vector_mode=1, sparse=sparse)[0]
+        unit.read_data(vector_mode=1, bulk=1)
+    assert delta(ser, mvm) == model.wire_bytes('mvm')
+    assert delta(ser, mvm) == model.wire_bytes('mvm', resident=1)
+    assert delta(ser, lambda: mvm(sparse=1)) == model.wire_bytes('sparse')
+    unit.residency = None
+    assert delta(ser, lambda: unit.mvm_batch(rng.integers(0, 100, (5, 8)), weights)) \
+        == model.wire_bytes('mvm', batch=5)
+
+    _, unit = board(vector_mode=1, unit_kwargs={"compact": 1})
+    ser = counted(unit)
+    assert delta(ser, mvm) == model.wire_bytes('mvm', compact=1)
+
+
+def test_fit_recovers_overheads():
+    truth = CostModel(N=8, host_overhead=0.002, link_factor=1.5, device_overhead=0.0003)
+    samples = []
+    for mode in ('mvm', 'mmm'):
+        est = truth.estimate(mode)
+        fpga = est["device_s"] + truth.device_overhead + 4 * 11 / truth.baudrate
+        samples += [(mode, fpga, est["latency_s"])] * 3
+    model = CostModel(N=8).fit(samples)
+    assert model.host_overhead == pytest.approx(truth.host_overhead)
+    assert model.link_factor == pytest.approx(truth.link_factor)
+    assert model.device_overhead == pytest.approx(truth.device_overhead)
+    assert model.best_mode(64, 64, P=64) == 'mmm'
+    with pytest.raises(ValueError):
+        model.fit([])
@@ -0,0 +1,84 @@
+import time
+import numpy as np
+import pytest
+import serial
+import codec
+import emulator
+from emulator import FPGAEmulator
+
+
+def wait_for(cond, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.002)
+    return True
+
+
+def drive(ser, emu, state):
+    # walk a fresh N=2 board in vector mode up to state
+    if state == emulator.IDLE:
+        return
+    ser.write(codec.DEADBEEF_TX)
+    assert wait_for(lambda: emu.state == emulator.WAIT_MAGIC)
+    if state == emulator.WAIT_MAGIC:
+        return
+    if state == emulator.WAIT_HEADER:
+        ser.write(codec.MAGIC_BATCH)
+        assert wait_for(lambda: emu.state == emulator.WAIT_HEADER)
+        return
+    ser.write(codec.MAGIC_TX)
+    assert wait_for(lambda: emu.state == emulator.RECV)
+    weights = codec.pack_matrix(np.ones((2, 2), dtype=np.int64))
+    if state == emulator.RECV:
+        ser.write(weights)
+        assert wait_for(lambda: emu.weights_filled.all())
+        return
+    ser.write(weights + codec.pack_vector(np.arange(2)))
+    if state == emulator.TX_RESULTS:
+        assert wait_for(lambda: emu.state == emulator.TX_ALIGN)
+        ser.write(codec.OK1)
+    assert wait_for(lambda: emu.state == state)
+
+
+@pytest.mark.parametrize("state", [emulator.IDLE, emulator.WAIT_MAGIC, emulator.WAIT_HEADER,
+                                   emulator.RECV, emulator.COMPUTE, emulator.TX_ALIGN,
+                                   emulator.TX_RESULTS])
+def test_reset_in_every_state(state):
+    emu = FPGAEmulator(N=2, compute_latency=10.0 if state == emulator.COMPUTE else 0.0)
+    ser = serial.Serial(emu.start(), timeout=0.1)
+    try:
+        drive(ser, emu, state)
+        ser.write(codec.RESET)
+        assert wait_for(lambda: emu.resets == 1 and emu.state == emulator.IDLE)
+        assert not emu.weights_filled.any()
+    finally:
+        ser.close()
+        emu.stop()
+
+
+def test_mode_words_follow_hsa_wrapper():
+    # Hsa_Wrapper.sv: FEFEFEFE -> hsa_mode 1 (matrix), FDFDFDFD -> vector
+    assert codec.TO_MATRIX == bytes([0xFE] * 4)
+    assert codec.TO_VECTOR == bytes([0xFD] * 4)
+    emu = FPGAEmulator(N=2, vector_mode=1)
+    ser = serial.Serial(emu.start(), timeout=0.1)
+    try:
+        ser.write(bytes([0xFE] * 4))
+        assert wait_for(lambda: emu.resets == 1)
+        assert emu.vector_mode == 0
+        ser.write(bytes([0xFD] * 4))
+        assert wait_for(lambda: emu.resets == 2)
+        assert emu.vector_mode == 1
+    finally:
+        ser.close()
+        emu.stop()
+
+
+@pytest.mark.parametrize("vector_mode", [0, 1])
+def test_switch_mode_reaches_the_board(board, vector_mode):
+    emu, unit = board(vector_mode=1 - vector_mode)
+    unit.switch_mode(vector_mode)
+    assert unit.rand_test(vector_mode=vector_mode, bulk=1)[0]
+    assert emu.vector_mode == vector_mode
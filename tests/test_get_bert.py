@@ -0,0 +1,70 @@
+import importlib.util
+import os
+import numpy as np
+import pytest
+from get_bert import channel_scales, quantize_rows, prune_pairs, process_linear
+from packed import pack_weights, packed_matmul, dense_equivalent, is_pair_pruned
+from actstore import ActStore, ActStoreWriter
+from conftest import ROOT
+
+# uart_comms has a main.py too, so load this one by path
+_spec = importlib.util.spec_from_file_location(
+    "accuracy_main", os.path.join(ROOT, "accuracy_computation", "main.py"))
+main = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(main)
+
+
+def test_prune_pairs_is_lossless_when_packed():
+    rng = np.random.default_rng(0)
+    W = rng.normal(size=(64, 32)).astype(np.float32)
+    Q = prune_pairs(quantize_rows(W, channel_scales(W, 8), 8))
+    assert np.all((Q[0::2] == 0) | (Q[1::2] == 0))
+    assert is_pair_pruned(Q.T)
+    # the kernel packs adjacent columns of Q.T, i.e. the rows pruned here
+    assert np.array_equal(dense_equivalent(pack_weights(Q.T, magnitude=1)), Q.T)
+
+
+def write_store(path, width, rng, sentences=3):
+    with ActStoreWriter(path, width) as w:
+        for n in range(sentences):
+            w.append(rng.normal(size=(4 + n, width)).astype(np.float32))
+    return ActStore(path)
+
+
+def test_main_path_pair_pruned(tmp_path):
+    # get_bert.py --prune pairs -> main.py, no survivor may get lost
+    rng = np.random.default_rng(1)
+    orig = rng.normal(size=(64, 16)).astype(np.float32)     # (intermediate, hidden)
+    pruned, _ = process_linear(orig, bits=8, prune="pairs")
+    assert np.any(pruned < 0)
+    acts = write_store(str(tmp_path / "acts.store"), 64, rng)
+
+    packed = main.pack_pruned(pruned)
+    assert np.array_equal(dense_equivalent(packed), pruned.T)
+    main.check_packed(packed, pruned, acts[0][0])
+    for sentence in acts:
+        assert np.allclose(packed_matmul(packed, sentence), sentence.astype(np.float64) @ pruned)
+    medians, p25s, p75s = main.sentence_stats(orig, packed, acts, verb=0)
+    assert len(medians) == len(acts)
+    assert np.all(np.isfinite(medians)) and np.all(p25s <= p75s)
+
+
+def test_main_path_magnitude_pruned(tmp_path):
+    # not 2:1 yet, merged like mymatmul
+    rng = np.random.default_rng(2)
+    orig = rng.normal(size=(32, 8)).astype(np.float32)
+    pruned, _ = process_linear(orig, bits=8, prune="magnitude", ratio=0.5)
+    assert not is_pair_pruned(pruned.T)
+    acts = write_store(str(tmp_path / "acts.store"), 32, rng)
+    packed = main.pack_pruned(pruned)
+    main.check_packed(packed, pruned, acts[1][0])
+    assert len(main.sentence_stats(orig, packed, acts, verb=0)[0]) == len(acts)
+
+
+@pytest.mark.parametrize("per_channel", [0, 1])
+def test_process_linear_scale(per_channel):
+    rng = np.random.default_rng(3)
+    W = rng.normal(size=(16, 8)).astype(np.float32)
+    Q, scale = process_linear(W, bits=16, prune="none", per_channel=per_channel)
+    assert len(scale) == (16 if per_channel else 1)
+    assert np.allclose(Q * scale.reshape(-1, 1), W, atol=np.max(scale))
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from hsa_sim import Hsa, SpVpu, cycles, unit_result
+from sparse import prune_columns
+
+
+def test_sim_matches_numpy():
+    rng = np.random.default_rng(0)
+    weights = rng.integers(0, 1 << 16, (8, 8))
+    vec = rng.integers(0, 1 << 16, 8)
+    mat = rng.integers(0, 1 << 16, (8, 8))
+    assert np.array_equal(unit_result(vec, weights, vector_mode=1), (weights.T @ vec) % 65536)
+    assert np.array_equal(unit_result(mat, weights, vector_mode=0), (weights.T @ mat) % 65536)
+
+
+@pytest.mark.parametrize("N", [2, 4, 8, 16])
+def test_batched_cycle_counts(N):
+    rng = np.random.default_rng(N)
+    acts = rng.integers(0, 1 << 8, (5, N, N))
+    weights = rng.integers(0, 1 << 8, (5, N, N))
+    for mvm in (0, 1):
+        sim = Hsa(acts, weights, mvm=mvm, bits=16)
+        n = 0
+        while not sim.ready():
+            sim.clock()
+            n += 1
+        assert n == cycles(N, mvm=mvm)
+        want = acts @ weights if not mvm else weights @ acts[:, :, -1:]
+        assert np.array_equal(sim.result(), want.reshape(sim.result().shape) % 65536)
+
+
+def test_sparse_unit():
+    rng = np.random.default_rng(1)
+    weights = rng.integers(0, 1 << 16, (8, 8))
+    vec = rng.integers(0, 1 << 16, 8)
+    assert np.array_equal(unit_result(vec, weights, sparse=1), (prune_columns(weights).T @ vec) % 65536)
+    sim = SpVpu.from_dense(vec, weights.T)
+    sim.run()
+    assert sim.counter == cycles(8, sparse=1)
+    with pytest.raises(ValueError):
+        unit_result(np.zeros((8, 8)), weights, vector_mode=0, sparse=1)
+
+
+def test_wraps_at_bits():
+    acts = np.full(4, 255)
+    weights = np.full((4, 4), 255)
+    assert np.array_equal(unit_result(acts, weights, bits=8), (weights.T @ acts) % 256)
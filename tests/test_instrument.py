@@ -0,0 +1,66 @@
+import io
+import json
+from instrument import NULL_INSTRUMENT, Instrument, JsonLinesSink, MemorySink, PrintSink
+
+
+def test_verb_without_instrument_prints(board, capsys):
+    _, unit = board()
+    assert unit.instr is NULL_INSTRUMENT
+    assert unit.rand_test(vector_mode=1, verb=1, bulk=1)[0]
+    out = capsys.readouterr().out
+    assert "Received 1st acknowledgement" in out
+    assert "Finished receiving" in out
+
+
+def test_quiet_without_verb(board, capsys):
+    _, unit = board()
+    assert unit.rand_test(vector_mode=1, bulk=1)[0]
+    assert capsys.readouterr().out == ""
+
+
+def test_verb_goes_to_the_sinks(board, capsys):
+    mem = MemorySink()
+    _, unit = board(unit_kwargs={"instrument": Instrument(sinks=[mem], name="u0")})
+    assert unit.rand_test(vector_mode=1, verb=1, bulk=1)[0]
+    assert capsys.readouterr().out == ""
+    logs = [e["log"] for e in mem.events if "log" in e]
+    assert "Received 1st acknowledgement" in logs
+    assert any(e.get("phase") == "transmit" for e in mem.events)
+
+
+def test_instrument_counts_and_report():
+    mem = MemorySink()
+    instr = Instrument(sinks=[mem], name="u1")
+    instr.count("resends")
+    instr.count("resends", 2)
+    for s in (0.001, 0.002, 0.004):
+        instr.observe("compute", s)
+    snap = instr.snapshot()
+    assert snap["counters"] == {"resends": 3}
+    assert snap["phases"]["compute"]["count"] == 3
+    assert abs(snap["phases"]["compute"]["max_ms"] - 4.0) < 1e-9
+    assert "resends: 3" in instr.report()
+    assert [e["n"] for e in mem.events if e.get("counter") == "resends"] == [1, 2]
+
+
+def test_print_sink():
+    stream = io.StringIO()
+    instr = Instrument(sinks=[PrintSink(stream)], name="u2")
+    instr.log("hello", 1)
+    instr.count("x")
+    assert stream.getvalue() == "[u2] hello 1\n"
+    everything = io.StringIO()
+    Instrument(sinks=[PrintSink(everything, everything=True)]).count("x")
+    assert json.loads(everything.getvalue())["counter"] == "x"
+
+
+def test_json_lines_sink(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    sink = JsonLinesSink(str(path))
+    instr = Instrument(sinks=[sink], name="u3")
+    instr.observe("readback", 0.5)
+    instr.flush()
+    sink.close()
+    events = [json.loads(line) for line in path.read_text().splitlines()]
+    assert events[0]["phase"] == "readback" and events[0]["s"] == 0.5
+    assert events[-1]["snapshot"]["unit"] == "u3"
@@ -0,0 +1,43 @@
+import importlib.util
+import os
+import numpy as np
+import pytest
+from packed import pack_weights, packed_matmul, dense_equivalent, is_pair_pruned
+from sparse import prune_columns
+from conftest import ROOT
+
+# uart_comms has a main.py too, so load this one by path
+_spec = importlib.util.spec_from_file_location(
+    "accuracy_main", os.path.join(ROOT, "accuracy_computation", "main.py"))
+main = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(main)
+
+
+def test_matches_mymatmul():
+    rng = np.random.default_rng(0)
+    W = rng.integers(-3, 4, (6, 10))         # plenty of ties
+    acts = rng.integers(-5, 6, 10)
+    assert np.array_equal(packed_matmul(pack_weights(W), acts), main.mymatmul(W.tolist(), acts.tolist()))
+
+
+def test_packed_matmul_matches_dense():
+    rng = np.random.default_rng(1)
+    W = rng.normal(size=(12, 16))
+    acts = rng.normal(size=(5, 16))
+    packed = pack_weights(W)
+    assert np.allclose(packed_matmul(packed, acts), acts @ dense_equivalent(packed).T)
+    assert np.allclose(packed_matmul(packed, acts[0]), dense_equivalent(packed) @ acts[0])
+
+
+def test_magnitude_matches_the_hardware_packing():
+    # sparse.py pairs rows of weights, i.e. columns of W = weights.T
+    rng = np.random.default_rng(2)
+    W = rng.integers(-3, 4, (8, 8))
+    assert np.array_equal(dense_equivalent(pack_weights(W, magnitude=1)), prune_columns(W.T).T)
+    assert is_pair_pruned(dense_equivalent(pack_weights(W, magnitude=1)))
+    assert not is_pair_pruned(W)
+
+
+def test_odd_columns():
+    with pytest.raises(ValueError):
+        pack_weights(np.ones((2, 3)))
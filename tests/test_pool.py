@@ -0,0 +1,63 @@
+import time
+import numpy as np
+import pytest
+from emulator import FPGAEmulator
+from utility import SAUnit
+from pool import DevicePool, PooledEngine
+
+
+def problem(seed, M=32, K=32, P=16):
+    # small values, no 16 bit wraparound
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 10, (M, K)), rng.integers(0, 10, (K, P))
+
+
+def test_pooled_engine():
+    emus = [FPGAEmulator(N=8, vector_mode=0) for _ in range(2)]
+    units = [SAUnit(emu.start(), N=8) for emu in emus]
+    try:
+        for unit in units:
+            unit.switch_mode(0)
+        W, X = problem(2)
+        pool = DevicePool(units=units)
+        assert np.array_equal(PooledEngine(pool).gemm(W, X), W @ X)
+        assert sum(s.tasks for s in pool.stats) == 4 * 4 * 2
+    finally:
+        for unit, emu in zip(units, emus):
+            unit.close()
+            emu.stop()
+
+
+class StubUnit:
+    def __init__(self, port, bad):
+        self.port = port
+        self.N = 8
+        self.bad = bad
+        self.calls = 0
+
+    def reset(self, fpga=False):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_pool_retired_board_stays_out():
+    units = [StubUnit("good", 0), StubUnit("bad", 1)]
+    pool = DevicePool(units=units, retire_after=2)
+
+    def attempt(unit, item):
+        unit.calls += 1
+        time.sleep(0.01)
+        return (not unit.bad, item * 2, 0.0)
+
+    assert pool.run(list(range(20)), attempt) == [i * 2 for i in range(20)]
+    assert pool.stats[1].retired and not pool.stats[0].retired
+    for unit in units:
+        unit.calls = 0
+    assert pool.run(list(range(10)), attempt) == [i * 2 for i in range(10)]
+    assert units[1].calls == 0
+
+    units[0].bad = 1
+    with pytest.raises(Exception):
+        pool.run([1, 2], attempt)
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("vector_mode", [1, 0])
+def test_bulk_matches_per_word(board, vector_mode):
+    # both read paths, same results
+    _, unit = board(vector_mode=vector_mode)
+    rng = np.random.default_rng(vector_mode)
+    for bulk in (0, 1, 0, 1):
+        weights = rng.integers(0, 1 << 16, (8, 8))
+        acts = rng.integers(0, 1 << 16, 8 if vector_mode else (8, 8))
+        assert unit.write_data(acts, weights, vector_mode=vector_mode)[0]
+        result, _ = unit.read_data(vector_mode=vector_mode, bulk=bulk)
+        assert np.array_equal(np.asarray(result), (weights.T @ acts) % 65536)
+
+
+@pytest.mark.parametrize("N", [2, 4, 16])
+def test_bulk_other_sizes(board, N):
+    _, unit = board(N=N, vector_mode=1)
+    for _ in range(3):
+        assert unit.rand_test(vector_mode=1, bulk=1)[0]
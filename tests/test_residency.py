@@ -0,0 +1,64 @@
+import time
+import numpy as np
+import codec
+from residency import ResidencyCache
+
+
+def op(unit, acts, weights):
+    assert unit.write_data(acts, weights, vector_mode=1)[0]
+    result, _ = unit.read_data(vector_mode=1, bulk=1)
+    assert np.array_equal(np.asarray(result), (weights.T @ acts) % 65536)
+
+
+def test_hits_send_acts_only(board):
+    cache = ResidencyCache()
+    emu, unit = board(vector_mode=1, unit_kwargs={"residency": cache})
+    rng = np.random.default_rng(0)
+    weights = rng.integers(0, 100, (8, 8))
+    for _ in range(4):
+        op(unit, rng.integers(0, 100, 8), weights)
+    assert (cache.hits, cache.misses, emu.acts_only_ops) == (3, 1, 3)
+    assert cache.bytes_saved == 3 * len(codec.pack_matrix(weights))
+
+    op(unit, rng.integers(0, 100, 8), weights + 1)      # new tile, sent in full
+    assert (cache.hits, cache.misses, emu.acts_only_ops) == (3, 2, 3)
+
+
+def test_stale_after_board_reset(board):
+    # a reset the host did not send drops the weights, the board answers
+    # the acts-only magic with WEIGHTS_STALE and gets the full payload
+    cache = ResidencyCache()
+    emu, unit = board(vector_mode=1, unit_kwargs={"residency": cache})
+    rng = np.random.default_rng(1)
+    weights = rng.integers(0, 100, (8, 8))
+    op(unit, rng.integers(0, 100, 8), weights)
+    unit.ser.write(codec.RESET)
+    end = time.monotonic() + 2
+    while emu.resets == 0 and time.monotonic() < end:
+        time.sleep(0.005)
+    assert emu.resets == 1
+
+    op(unit, rng.integers(0, 100, 8), weights)
+    assert cache.stale == 1
+    assert (cache.hits, cache.misses, emu.acts_only_ops) == (0, 2, 0)
+    op(unit, rng.integers(0, 100, 8), weights)          # resident again
+    assert (cache.hits, emu.acts_only_ops) == (1, 1)
+
+
+def test_switch_mode_forgets_the_weights(board):
+    cache = ResidencyCache()
+    emu, unit = board(vector_mode=1, unit_kwargs={"residency": cache})
+    weights = np.arange(64).reshape(8, 8)
+    op(unit, np.ones(8, dtype=np.int64), weights)
+    unit.switch_mode(1)
+    op(unit, np.ones(8, dtype=np.int64), weights)
+    assert cache.stale == 0 and emu.acts_only_ops == 0
+
+
+def test_board_without_resident_cap(board):
+    cache = ResidencyCache()
+    emu, unit = board(vector_mode=1, caps=0, unit_kwargs={"residency": cache})
+    weights = np.arange(64).reshape(8, 8)
+    for _ in range(2):
+        op(unit, np.ones(8, dtype=np.int64), weights)
+    assert cache.hits == 0 and emu.acts_only_ops == 0
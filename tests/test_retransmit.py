@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import codec
+from retransmit import RttEstimator, missing_mask, select_frames, missing_report, resend_requests, \
+    is_resend_request
+from sparse import pack_sparse_matrix
+
+
+@pytest.mark.parametrize("compact", [0, 1])
+def test_nack_under_frame_loss(board, compact):
+    emu, unit = board(frame_loss=0.05, seed=2, unit_kwargs={"compact": compact})
+    for vector_mode in (1, 0):
+        unit.switch_mode(vector_mode)
+        for _ in range(10):
+            assert unit.rand_test(vector_mode=vector_mode, bulk=1)[0]
+    assert emu.frames_dropped > 0
+    assert emu.missing_reports > 0
+    assert emu.frames_resent > 0 if not compact else emu.blocks_rx > 0
+
+
+def test_select_frames_matches_mask():
+    rng = np.random.default_rng(0)
+    payload = codec.pack_matrix(rng.integers(0, 1 << 16, (8, 8)))
+    words = codec.bytes_to_frames(payload, codec.TX_DTYPE)
+    missing = words[rng.choice(len(words), 10, replace=False)]
+    mask = missing_mask(payload, missing)
+    assert mask.sum() == 10
+    assert select_frames(payload, missing) == codec.frames_to_bytes(words[mask])
+
+
+def test_rtt_backoff():
+    rtt = RttEstimator(min_rto=0.02)
+    for _ in range(50):
+        rtt.sample(0.01)
+    assert rtt.rto() == pytest.approx(0.02)
+    rtt.timeout()
+    rtt.timeout()
+    assert rtt.rto() == pytest.approx(0.08)
+    rtt.sample(0.01)
+    assert rtt.rto() == pytest.approx(0.02)
+
+
+def test_sparse_frames_match_by_pair():
+    # the board tracks packed weights per pair, it reports x = 2j
+    rng = np.random.default_rng(1)
+    payload = pack_sparse_matrix(rng.integers(0, 1 << 16, (8, 8)))
+    words = codec.bytes_to_frames(payload, codec.TX_DTYPE)
+    _, aw, xix, yix, _ = codec.decode_frames(words[[0, 5, 9]])
+    missing = codec.encode_frames(1, aw, xix & 0x7E, yix, 0)
+    assert not missing_mask(payload, missing).all()
+    assert np.array_equal(np.flatnonzero(missing_mask(payload, missing, sparse=1)), [0, 5, 9])
+
+
+def test_report_and_requests():
+    report = missing_report(np.array([1, 0]), np.array([3, 0]), np.array([2, 7]))
+    assert report[:2] == codec.MISSING_REPLY
+    assert int.from_bytes(report[2:4], byteorder='big') == 2
+    _, aw, xix, yix, _ = codec.decode_frames(codec.bytes_to_frames(report[4:], codec.RX_DTYPE))
+    assert (aw.tolist(), xix.tolist(), yix.tolist()) == ([1, 0], [3, 0], [2, 7])
+
+    requests = codec.bytes_to_frames(resend_requests(np.array([1, 4]), np.array([0, 6])), codec.TX_DTYPE)
+    assert all(is_resend_request(int(w)) for w in requests)
+    assert not is_resend_request(int(codec.encode_frames(1, 1, 1, 0, 5)))
@@ -0,0 +1,93 @@
+import os
+import tty
+import numpy as np
+import pytest
+import serial
+import codec
+from bench import CountingSerial
+from rxbuf import RxBuffer
+
+
+class Trickle:
+    # a port that has at most a few bytes waiting at a time
+    def __init__(self, data, chunk=5):
+        self.data = bytearray(data)
+        self.chunk = chunk
+
+    @property
+    def in_waiting(self):
+        return min(len(self.data), self.chunk)
+
+    def readinto(self, b):
+        n = min(len(b), len(self.data))
+        b[:n] = self.data[:n]
+        del self.data[:n]
+        return n
+
+
+PAYLOAD = codec.frames_to_bytes(
+    codec.encode_frames(0, 0, np.arange(20) % 8, np.arange(20) // 8, np.arange(20) * 3), codec.RX_DTYPE)
+
+
+@pytest.mark.parametrize("offset", range(9))
+def test_sync_at_any_offset(offset):
+    # a 16 byte buffer, so reading the payload has to compact it
+    junk = (b'\x01\xde\xad\xbe' * 3)[:offset]
+    rx = RxBuffer(Trickle(junk + codec.DEADBEEF_RX + PAYLOAD), size=16)
+    skipped = 0
+    while True:
+        rx.fill(4)
+        buffered = len(rx)
+        at = rx.sync(codec.DEADBEEF_RX)
+        if at is not None:
+            skipped += at
+            break
+        skipped += buffered - len(rx)
+    assert skipped == offset
+    got = b''
+    while len(got) < len(PAYLOAD):
+        rx.fill(4)
+        got += bytes(rx.frames())
+    assert got == PAYLOAD
+
+
+def test_frames_keeps_partial_word():
+    rx = RxBuffer(Trickle(PAYLOAD[:10], chunk=10))
+    rx.fill(10)
+    assert bytes(rx.frames()) == PAYLOAD[:8]
+    assert len(rx) == 2
+
+
+def test_buffer_full():
+    rx = RxBuffer(Trickle(PAYLOAD, chunk=len(PAYLOAD)), size=16)
+    rx.fill(16)
+    with pytest.raises(Exception):
+        rx.fill(4)
+
+
+def test_reads_a_pty_directly():
+    # bytes already waiting on a POSIX port go through os.readv, a wrapper
+    # with its own readinto (bench.CountingSerial) is read through that
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    ser = serial.Serial(os.ttyname(slave), timeout=1)
+    try:
+        rx = RxBuffer(ser)
+        assert rx.fd is not None
+        os.write(master, codec.DEADBEEF_RX + PAYLOAD)
+        while len(rx) < 4 + len(PAYLOAD):
+            rx.fill(4)
+        assert rx.sync(codec.DEADBEEF_RX) == 0
+        assert bytes(rx.frames()) == PAYLOAD
+
+        counter = CountingSerial(ser)
+        rx.attach(counter)
+        assert rx.fd is None
+        os.write(master, PAYLOAD[:8])
+        rx.fill(8)
+        assert bytes(rx.frames()) == PAYLOAD[:8]
+        assert counter.rx_bytes == 8
+    finally:
+        ser.close()
+        os.close(master)
+        os.close(slave)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from scheduler import ModeScheduler
+
+
+def test_scheduler_keeps_submission_order(board):
+    _, unit = board(vector_mode=1)
+    rng = np.random.default_rng(4)
+    sched = ModeScheduler(unit)
+    expected = []
+    for vector_mode in (1, 0, 1, 0, 1):
+        weights = rng.integers(0, 100, (8, 8))
+        acts = rng.integers(0, 100, 8 if vector_mode else (8, 8))
+        sched.submit(acts, weights, vector_mode=vector_mode)
+        expected.append(weights.T @ acts)
+    results = sched.run()
+    assert all(np.array_equal(np.asarray(r), e) for r, e in zip(results, expected))
+    assert sched.stats.switches < sched.stats.naive_switches
+
+
+class IdleUnit:
+    N = 8
+    baudrate = 921600
+    port = "idle"
+
+
+def test_next_mode_waits_for_the_budget():
+    sched = ModeScheduler(IdleUnit(), budget=0.05, mode=1)
+    old = sched.submit(None, None, vector_mode=0)
+    sched.submit(None, None, vector_mode=1)
+    # the MMM op came first but still has time, the unit stays in MVM
+    assert sched.next_mode(now=old.submitted) == 1
+    assert sched.next_mode(now=old.submitted + sched.budget) == 0
+
+
+def test_only_an_older_op_forces_a_switch():
+    sched = ModeScheduler(IdleUnit(), budget=0.0, mode=1)
+    sched.submit(None, None, vector_mode=1)
+    late = sched.submit(None, None, vector_mode=0)
+    assert sched.next_mode(now=late.submitted + 1) == 1
+    assert sched.stats.naive_switches == 1     # already in MVM
+
+
+def test_sparse_needs_mvm():
+    with pytest.raises(ValueError):
+        ModeScheduler(IdleUnit()).submit(None, None, vector_mode=0, sparse=1)
@@ -0,0 +1,41 @@
+import time
+import pytest
+from emulator import FPGAEmulator
+from utility import SAUnit, get_unit, close_units
+
+
+@pytest.fixture
+def emu():
+    emu = FPGAEmulator(N=8)
+    emu.start()
+    yield emu
+    close_units()
+    emu.stop()
+
+
+def test_open_is_quick_and_aligned(emu):
+    start = time.perf_counter()
+    with SAUnit(emu.port, N=8) as unit:
+        assert time.perf_counter() - start < 0.5
+        assert unit.aligned and unit.caps == emu.caps
+        # the first op uses that alignment, the next one aligns again
+        assert unit.rand_test(vector_mode=1, bulk=1)[0]
+        assert not unit.aligned
+        assert unit.rand_test(vector_mode=1, bulk=1)[0]
+    assert emu.resets == 0
+
+
+def test_registry_keeps_one_unit_per_port(emu):
+    other = FPGAEmulator(N=8)
+    other.start()
+    try:
+        unit = get_unit(emu.port, N=8)
+        assert get_unit(emu.port, N=8) is unit
+        assert get_unit(other.port, N=8) is not unit
+        with pytest.raises(ValueError):
+            get_unit(emu.port, N=4)
+        units = [unit, get_unit(other.port, N=8)]
+        close_units()
+        assert not any(u.ser.is_open for u in units)
+    finally:
+        other.stop()
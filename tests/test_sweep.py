@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+import sweep
+from sweep import quantize, prune
+from actstore import ActStoreWriter
+
+
+@pytest.mark.parametrize("bits", [3, 4, 6, 8, 12, 16])
+@pytest.mark.parametrize("ratio", [0.25, 0.5, 0.75])
+def test_prune_ratio_at_low_bits(bits, ratio):
+    # at few bits most weights tie with the threshold, still exactly
+    # round(ratio * size) of them go (or the quantization zeros, if more)
+    rng = np.random.default_rng(bits)
+    W = rng.normal(size=(256, 128)).astype(np.float32)
+    Q, _ = quantize(W, bits)
+    k = round(ratio * Q.size)
+    P = prune(Q, ratio)
+    assert np.count_nonzero(P == 0) == max(k, np.count_nonzero(Q == 0))
+    # only the smallest went, and the rest is untouched
+    assert np.abs(Q[(P == 0) & (Q != 0)]).max(initial=0) <= np.abs(P[P != 0]).min()
+    assert np.array_equal(P[P != 0], Q[P != 0])
+    assert np.array_equal(prune(Q, ratio), P)
+
+
+def test_prune_ratios_differ_at_3_bits():
+    W = np.random.default_rng(0).normal(size=(128, 64)).astype(np.float32)
+    Q, _ = quantize(W, 3)
+    zeros = [np.mean(prune(Q, r) == 0) for r in (0.0, 0.5, 0.75)]
+    assert zeros[0] < zeros[1] < zeros[2]
+    assert zeros[2] == 0.75
+
+
+def test_prune_leaves_input():
+    Q, _ = quantize(np.arange(-8, 8, dtype=np.float32).reshape(4, 4), 8)
+    before = Q.copy()
+    prune(Q, 0.5)
+    assert np.array_equal(Q, before)
+
+
+def test_quantize_zeros():
+    Q, scale = quantize(np.zeros((4, 4), dtype=np.float32), 8)
+    assert np.isfinite(scale)
+    assert not np.any(Q)
+
+
+def test_run_config_reports_sparsity(tmp_path):
+    rng = np.random.default_rng(2)
+    W = rng.normal(size=(32, 8)).astype(np.float32)
+    with ActStoreWriter(str(tmp_path / "acts.store"), 32) as w:
+        w.append(rng.normal(size=(5, 32)).astype(np.float32))
+    sweep._weights[0] = W
+    try:
+        row = sweep.run_config(0, 4, 0.5, "dense", str(tmp_path / "acts.store"), None)
+    finally:
+        del sweep._weights[0]
+    assert set(row) == set(sweep.COLUMNS)
+    assert row["sparsity"] == 0.5
+    assert row["tokens"] == 5
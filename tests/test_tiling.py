@@ -0,0 +1,24 @@
+import numpy as np
+from tiling import TiledEngine
+
+# Values stay small so the 16 bit accumulators never wrap and the results
+# can be compared to W @ X exactly
+
+
+def problem(seed, M=20, K=24, P=12):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 10, (M, K)), rng.integers(0, 10, (K, P))
+
+
+def test_gemm(board):
+    _, unit = board(vector_mode=0)
+    unit.switch_mode(0)
+    W, X = problem(0)
+    assert np.array_equal(TiledEngine(unit).gemm(W, X), W @ X)
+
+
+def test_gemv(board):
+    _, unit = board(vector_mode=1)
+    W, X = problem(1)
+    x = X[:, 0]
+    assert np.array_equal(TiledEngine(unit).gemv(W, x), W @ x)
@@ -0,0 +1,113 @@
+import threading
+import numpy as np
+import pytest
+from verify import VerifiedEngine, freivalds_check
+
+
+def test_freivalds():
+    rng = np.random.default_rng(0)
+    W = rng.integers(-5000, 5000, (8, 8))
+    A = rng.integers(-5000, 5000, (8, 8))
+    R = (W.T @ A) & 0xFFFF
+    assert freivalds_check(W, A, R)
+    assert freivalds_check(W, A[:, 0], R[:, 0])
+    bad = R.copy()
+    bad[1, 2] += 7
+    assert not freivalds_check(W, A, bad, rounds=8, rng=rng)
+
+
+def test_gemm(board):
+    # small values, the 16 bit accumulators never wrap
+    _, unit = board(vector_mode=0)
+    unit.switch_mode(0)
+    rng = np.random.default_rng(5)
+    W, X = rng.integers(0, 10, (20, 24)), rng.integers(0, 10, (24, 12))
+    with VerifiedEngine(unit, rate=1.0, seed=6) as eng:
+        assert np.array_equal(eng.gemm(W, X), W @ X)
+        assert eng.vstats.checked == 3 * 3 * 2
+
+
+def test_gemv(board):
+    _, unit = board(vector_mode=1)
+    rng = np.random.default_rng(7)
+    W, x = rng.integers(0, 10, (20, 24)), rng.integers(0, 10, 24)
+    with VerifiedEngine(unit, seed=8) as eng:
+        assert np.array_equal(eng.gemv(W, x), W @ x)
+
+
+class Corrupting:
+    # passes everything through to the unit but flips bits in every other
+    # result it reads back
+    def __init__(self, unit):
+        self.unit = unit
+        self.reads = 0
+        self.corrupted = 0
+
+    def __getattr__(self, name):
+        return getattr(self.unit, name)
+
+    def read_data(self, *args, **kwargs):
+        result, t = self.unit.read_data(*args, **kwargs)
+        self.reads += 1
+        if self.reads % 2:
+            result = np.array(result)
+            result.flat[self.reads % result.size] ^= 0x1234
+            result = result.tolist()
+            self.corrupted += 1
+        return result, t
+
+
+def test_verified_engine_recovers(board):
+    _, unit = board(vector_mode=0)
+    unit.switch_mode(0)
+    rng = np.random.default_rng(1)
+    W = rng.integers(0, 10, (16, 24))
+    X = rng.integers(0, 10, (24, 16))
+    flaky = Corrupting(unit)
+    eng = VerifiedEngine(flaky, rate=1.0, max_requeues=8, seed=2)
+    try:
+        assert np.array_equal(eng.gemm(W, X), W @ X)
+    finally:
+        eng.close()
+    assert flaky.corrupted > 0
+    assert eng.vstats.requeued > 0
+
+
+def test_no_worker_left_after_run(board):
+    _, unit = board(vector_mode=1)
+    rng = np.random.default_rng(3)
+    W = rng.integers(0, 10, (16, 16))
+    before = threading.active_count()
+    eng = VerifiedEngine(unit, rate=1.0, seed=4)
+    for _ in range(2):
+        x = rng.integers(0, 10, 16)
+        assert np.array_equal(eng.gemv(W, x), W @ x)
+        assert eng.verifier.thread is None
+        assert threading.active_count() == before
+    assert eng.vstats.checked == 2 * 4
+
+
+def test_no_worker_left_after_failed_run():
+    class Broken(VerifiedEngine):
+        def send_tile(self, payload, vector_mode, unit=None):
+            self.sent = getattr(self, "sent", 0) + 1
+            if self.sent == 3:
+                raise IOError("link down")
+            return [0] * 8
+
+    class Unit:
+        N = 8
+        port = "fake"
+
+        def pack_vector(self, vec):
+            return b""
+
+        def pack_matrix(self, mat, is_weights=1):
+            return b""
+
+    before = threading.active_count()
+    with Broken(Unit()) as eng:
+        with pytest.raises(IOError):
+            eng.gemv(np.ones((16, 16), dtype=np.int64), np.ones(16, dtype=np.int64))
+        assert eng.verifier.thread is None
+    assert threading.active_count() == before
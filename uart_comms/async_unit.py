@@ -0,0 +1,242 @@
+import asyncio
+import os
+import random
+import time
+import numpy as np
+import serial
+import codec
+from codec import DEADBEEF_TX, DEADBEEF_RX, MAGIC_TX, OK1, OK2
+
+# asyncio flavour of SAUnit. The serial file descriptor is registered with
+# the event loop, so handshakes and result frames are awaited instead of
+# polled with in_waiting and fixed sleeps, and one process can drive many
+# boards concurrently. Needs a selector event loop and a real fd, i.e. a
+# POSIX tty (not supported on Windows COM ports).
+
+
+class AsyncSAUnit:
+    def __init__(self, port, N=8, baudrate=921600):
+        self.port = port
+        self.N = N
+        self.baudrate = baudrate
+        self.ser = None
+        self.fd = None
+        self.loop = None
+        self.rx = bytearray()
+        self.rx_event = None
+        self.rx_error = None
+        self.aligned = False        # board past DEADBEEF, waiting for a magic
+
+    @classmethod
+    async def open(cls, port, N=8, baudrate=921600, settle=2):
+        unit = cls(port, N=N, baudrate=baudrate)
+        await unit.connect(settle=settle)
+        return unit
+
+    async def connect(self, settle=2):
+        self.ser = serial.Serial(
+            port=self.port,
+            baudrate=self.baudrate,
+            stopbits=serial.STOPBITS_ONE,
+            bytesize=serial.EIGHTBITS,
+            parity=serial.PARITY_EVEN,
+            timeout=0
+        )
+        try:
+            self.fd = self.ser.fileno()
+        except (AttributeError, NotImplementedError):
+            self.ser.close()
+            raise Exception(f"Port {self.port} has no file descriptor, AsyncSAUnit needs a POSIX tty")
+
+        self.loop = asyncio.get_running_loop()
+        self.rx_event = asyncio.Event()
+        await self.reset()
+        self.loop.add_reader(self.fd, self._on_readable)
+        # up to settle seconds, but done as soon as the board answers
+        if not await self.wait_ready(settle):
+            print(f"WARN: no answer from {self.port} after {settle}s, carrying on")
+
+    async def wait_ready(self, timeout=2):
+        # as SAUnit.wait_ready: no resets, the board is left aligned for the
+        # first write_payload
+        if self.aligned:
+            return True
+        start = self.loop.time()
+        await self.reset()
+        while self.loop.time() - start < timeout:
+            await self.write(4*DEADBEEF_TX)
+            if await self.wait_for_word(OK1, 0.01):
+                self.aligned = True
+                return True
+        await self.reset()
+        return False
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.rx_error = e
+            data = b""
+        if data:
+            self.rx += data
+        elif self.rx_error is None:
+            self.rx_error = Exception(f"Port {self.port} closed")
+        self.rx_event.set()
+
+    async def _wait_rx(self, deadline):
+        # wait for more bytes, False once the deadline passes
+        if self.rx_error is not None:
+            raise self.rx_error
+        self.rx_event.clear()
+        timeout = None if deadline is None else deadline - self.loop.time()
+        if timeout is not None and timeout <= 0:
+            return False
+        try:
+            await asyncio.wait_for(self.rx_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        if self.rx_error is not None:
+            raise self.rx_error
+        return True
+
+    async def write(self, data):
+        view = memoryview(data)
+        while view:
+            try:
+                n = os.write(self.fd, view)
+                view = view[n:]
+            except BlockingIOError:
+                writable = self.loop.create_future()
+                self.loop.add_writer(self.fd, writable.set_result, None)
+                try:
+                    await writable
+                finally:
+                    self.loop.remove_writer(self.fd)
+
+    async def wait_for_word(self, word, timeout=None):
+        # Handshake words are the same byte x4 (or DEADBEEF), so search at
+        # any byte offset and drop everything up to and including the match
+        deadline = None if timeout is None else self.loop.time() + timeout
+        while True:
+            ix = self.rx.find(word)
+            if ix >= 0:
+                del self.rx[:ix + len(word)]
+                return True
+            # keep a possible partial match at the tail
+            if len(self.rx) > len(word):
+                del self.rx[:len(self.rx) - len(word) + 1]
+            if not await self._wait_rx(deadline):
+                return False
+
+    async def switch_mode(self, vector_mode):
+        # through write() like the payloads, the fd is non-blocking
+        self.aligned = False
+        await self.write(codec.TO_VECTOR if vector_mode else codec.TO_MATRIX)
+
+    async def reset(self, fpga=False):
+        self.ser.reset_input_buffer()
+        self.ser.reset_output_buffer()
+        self.rx.clear()
+        if fpga:
+            self.aligned = False
+            await self.write(bytes([0xFF]*4*5))
+
+    async def write_data(self, acts, weights, vector_mode=1, verb=0, max_resends=3):
+        weight_data = codec.pack_matrix(np.asarray(weights)[:self.N, :self.N])
+        if vector_mode:
+            act_data = codec.pack_vector(np.asarray(acts)[:self.N])
+        else:
+            act_data = codec.pack_matrix(np.asarray(acts)[:self.N, :self.N], is_weights=0)
+        return await self.write_payload(weight_data, act_data, verb=verb, max_resends=max_resends)
+
+    async def write_payload(self, weight_data, act_data, verb=0, max_resends=3, align_timeout=0.01):
+        if verb:
+            print(f"[{self.port}] Beginning alignment procedure for writing")
+        while not self.aligned:
+            await self.write(4*DEADBEEF_TX)
+            if await self.wait_for_word(OK1, align_timeout):
+                break
+        self.aligned = False
+        if verb:
+            print(f"[{self.port}] Received 1st acknowledgement, sending magic and payload")
+
+        payload = MAGIC_TX + weight_data + act_data
+        for attempt in range(max_resends):
+            await self.write(payload if attempt == 0 else weight_data + act_data)
+            if await self.wait_for_word(OK2, 0.1):
+                if verb:
+                    print(f"[{self.port}] Received 2nd acknowledgment")
+                return (True, time.time())
+            if verb:
+                print(f"[{self.port}] Timeout... resending")
+        if verb:
+            print(f"[{self.port}] Timeout, max resends reached. Abort.")
+        return (False, 0)
+
+    async def read_data(self, vector_mode=1, verb=0, timeout=None):
+        deadline = None if timeout is None else self.loop.time() + timeout
+        while not self.rx:
+            if not await self._wait_rx(deadline):
+                raise TimeoutError(f"No result from {self.port}")
+        ret_time = time.time()
+
+        if not await self.wait_for_word(DEADBEEF_RX, None if deadline is None else deadline - self.loop.time()):
+            raise TimeoutError(f"No alignment word from {self.port}")
+        # Send 5 to make sure FPGA catches 1
+        await self.write(OK1*5)
+        if verb:
+            print(f"[{self.port}] Aligned, sent the 1st OK (0C), waiting for valid messages...")
+
+        N = self.N
+        shape = (N,) if vector_mode else (N, N)
+        result = np.zeros(shape, dtype=np.int64)
+        filled = np.zeros(shape, dtype=bool)
+        while True:
+            n = len(self.rx) & ~3
+            if n:
+                msb, _, x_ix, y_ix, data = codec.decode_frames(codec.bytes_to_frames(self.rx[:n]))
+                del self.rx[:n]
+                valid = (msb == 0) & (y_ix < N)
+                if vector_mode:
+                    ix = (y_ix[valid],)
+                else:
+                    valid &= (x_ix < N)
+                    ix = (y_ix[valid], x_ix[valid])
+                result[ix] = data[valid]
+                filled[ix] = True
+                if filled.all():
+                    await self.write(OK2)
+                    if verb:
+                        print(f"[{self.port}] Finished receiving, sent 2nd OK (1C)")
+                    return (result.tolist(), ret_time)
+            if not await self._wait_rx(deadline):
+                raise TimeoutError(f"Incomplete result from {self.port}")
+
+    async def rand_test(self, vector_mode=1, verb=0):
+        N = self.N
+        if vector_mode:
+            acts = [random.randint(0, 100) for i in range(N)]
+        else:
+            acts = [[random.randint(0, 100) for i in range(N)] for j in range(N)]
+        weights = [[random.randint(0, 100) for i in range(N)] for j in range(N)]
+        nresult = np.matmul(np.array(weights).T, np.array(acts)) # expected result
+
+        sys_start = time.time()
+        succ, start_time = await self.write_data(acts, weights, vector_mode=vector_mode, verb=verb, max_resends=5)
+        result, end_time = await self.read_data(vector_mode=vector_mode, verb=verb)
+        sys_end = time.time()
+
+        correct = np.array_equal(np.array(result), nresult)
+        return (correct, end_time - start_time, sys_end - sys_start)
+
+    def close(self):
+        if self.loop is not None and self.fd is not None:
+            self.loop.remove_reader(self.fd)
+        if self.ser and self.ser.is_open:
+            if self.aligned:
+                # don't leave the board waiting for a magic that never comes
+                self.ser.write(codec.RESET)
+            self.ser.close()
+            print(f"\nClosed port {self.port}")
@@ -0,0 +1,181 @@
+import argparse
+import itertools
+import json
+import sys
+import time
+import numpy as np
+from utility import SAUnit
+from emulator import FPGAEmulator
+from instrument import Instrument, JsonLinesSink
+
+# Driver benchmark: sweeps N, vector/matrix mode, baud rate and batch size
+# against a real port (--port) or a local emulator (--emulate), and emits
+# one JSON line per configuration. Every op is a rand_test, so results
+# are checked too. In MVM mode a batch size above 1 goes through
+# SAUnit.mvm_batch, one handshake per batch on boards with CAP_BATCH (one
+# per vector otherwise); MMM has no batched path, there a batch is just
+# that many rand_tests back to back.
+#
+#   python bench.py --emulate --N 2 8 --modes mvm mmm --baud 115200 921600
+#   python bench.py --port COM35 --N 8 --modes mvm --batch 1 16 --out res.jsonl
+
+PHASES = ('align', 'transmit', 'resend', 'compute', 'readback')
+MODES = {'mvm': 1, 'mmm': 0}
+
+
+class CountingSerial:
+    # Wraps a pyserial port to count the bytes that go over the wire
+
+    def __init__(self, ser):
+        self.ser = ser
+        self.tx_bytes = 0
+        self.rx_bytes = 0
+
+    def write(self, data):
+        self.tx_bytes += len(data)
+        return self.ser.write(data)
+
+    def read(self, size=1):
+        data = self.ser.read(size)
+        self.rx_bytes += len(data)
+        return data
+
+    def readinto(self, b):
+        n = self.ser.readinto(b)
+        self.rx_bytes += n
+        return n
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    p50, p95, p99 = np.percentile(np.asarray(samples) * 1e3, [50, 95, 99])
+    return {"p50": round(float(p50), 4), "p95": round(float(p95), 4), "p99": round(float(p99), 4)}
+
+
+def batch_test(unit, batch):
+    # rand_test for mvm_batch: batch random vectors against one weight
+    # tile -> (vectors correct, seconds for the whole batch)
+    acts = np.random.randint(0, 101, (batch, unit.N))
+    weights = np.random.randint(0, 101, (unit.N, unit.N))
+    start = time.time()
+    result = unit.mvm_batch(acts, weights)
+    elapsed = time.time() - start
+    return int(np.sum(np.all(result == acts @ weights, axis=1))), elapsed
+
+
+def run_config(unit, mode, batch, repeats, bulk=1):
+    vector_mode = MODES[mode]
+    # no reset() after: dropping the output buffer can lose the switch word
+    unit.switch_mode(vector_mode)
+    batched = vector_mode and batch > 1
+
+    counter = unit.ser
+    tx_start, rx_start = counter.tx_bytes, counter.rx_bytes
+    latencies = []
+    phases = {p: [] for p in PHASES}
+    correct = 0
+    batch_rates = []
+
+    total_start = time.perf_counter()
+    for _ in range(repeats):
+        batch_start = time.perf_counter()
+        # batched latencies are per handshake, not per vector
+        for _ in range(1 if batched else batch):
+            if batched:
+                corr, sys_delta = batch_test(unit, batch)
+            else:
+                corr, _, sys_delta = unit.rand_test(vector_mode=vector_mode, bulk=bulk)
+            correct += corr
+            latencies.append(sys_delta)
+            for p in PHASES:
+                phases[p].append(unit.phases.get(p, 0.0))
+        batch_rates.append(batch / (time.perf_counter() - batch_start))
+    elapsed = time.perf_counter() - total_start
+
+    wire = (counter.tx_bytes - tx_start) + (counter.rx_bytes - rx_start)
+    ops = batch * repeats
+    return {
+        "N": unit.N,
+        "mode": mode,
+        "baudrate": unit.baudrate,
+        "batch": batch,
+        "batched": bool(batched),
+        "ops": ops,
+        "correct": int(correct),
+        "elapsed_s": round(elapsed, 4),
+        "tiles_per_s": round(ops / elapsed, 3),
+        "tiles_per_s_p50_batch": round(float(np.median(batch_rates)), 3),
+        "tx_bytes": counter.tx_bytes - tx_start,
+        "rx_bytes": counter.rx_bytes - rx_start,
+        "wire_bytes_per_s": round(wire / elapsed, 1),
+        "latency_ms": percentiles(latencies),
+        "phases_ms": {p: percentiles(v) for p, v in phases.items()},
+    }
+
+
+def open_unit(args, N, baudrate):
+    emu = None
+    if args.emulate:
+        emu = FPGAEmulator(N=N, compute_latency=args.latency,
+                           baudrate=None if args.no_throttle else baudrate)
+        port = emu.start()
+    else:
+        port = args.port
+    instr = None
+    if args.trace:
+        instr = Instrument(sinks=[JsonLinesSink(args.trace)], name=f"{port}/N={N}/baud={baudrate}")
+    unit = SAUnit(port, N=N, baudrate=baudrate, instrument=instr)
+    unit.ser = CountingSerial(unit.ser)
+    unit.rx.attach(unit.ser)
+    return unit, emu
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SA unit driver")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--port", help="serial port of a real board")
+    target.add_argument("--emulate", action="store_true", help="run against a local FPGAEmulator")
+    parser.add_argument("--N", type=int, nargs="+", default=[8])
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--baud", type=int, nargs="+", default=[921600])
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--repeats", type=int, default=5, help="batches per configuration")
+    parser.add_argument("--latency", type=float, default=0.0, help="emulated compute latency (s)")
+    parser.add_argument("--no-throttle", action="store_true", help="don't throttle the emulator to the baud rate")
+    parser.add_argument("--legacy-read", action="store_true", help="use the per-word read path")
+    parser.add_argument("--out", help="append JSON lines here instead of stdout")
+    parser.add_argument("--trace", help="append per-event instrumentation JSON lines here")
+    args = parser.parse_args(argv)
+
+    if args.port and (len(args.N) > 1 or len(args.baud) > 1):
+        print("WARN: the board is synthesised for one N and baud rate, sweeping anyway", file=sys.stderr)
+
+    out = open(args.out, "a") if args.out else sys.stdout
+    try:
+        for N, baudrate in itertools.product(args.N, args.baud):
+            unit, emu = open_unit(args, N, baudrate)
+            try:
+                for mode, batch in itertools.product(args.modes, args.batch):
+                    res = run_config(unit, mode, batch, args.repeats, bulk=not args.legacy_read)
+                    out.write(json.dumps(res) + "\n")
+                    out.flush()
+                    print(f"N={N} {mode} baud={baudrate} batch={batch}: "
+                          f"{res['tiles_per_s']:.1f} tiles/s, {res['wire_bytes_per_s']:.0f} B/s, "
+                          f"p50 {res['latency_ms']['p50']:.2f} ms, "
+                          f"{res['correct']}/{res['ops']} correct", file=sys.stderr)
+            finally:
+                unit.instr.flush()
+                unit.ser.close()    # quietly, stdout may be the JSON stream
+                if emu is not None:
+                    emu.stop()
+    finally:
+        if args.out:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import numpy as np
+
+# Vectorised codec for the 32 bit frame layout used by the SA units:
+#
+#   <-- 1 bit --><-- 1 bit --><-- 7 bits --><-- 7 bits --><-- 16 bits -->
+#    ^ handshake   ^ acts       ^ x coord    ^ y coord     ^ data payload
+#     vs data      or weights
+#
+# Host -> FPGA frames go out little-endian, FPGA -> host frames come back
+# big-endian (see SAUnit.bytes_to_num), so every function takes the byte
+# order as a numpy dtype string.
+
+TX_DTYPE = '<u4'
+RX_DTYPE = '>u4'
+
+# Handshake and control words as they appear on the wire
+DEADBEEF_TX = b'\xef\xbe\xad\xde'   # host -> FPGA, little end
+DEADBEEF_RX = b'\xde\xad\xbe\xef'   # FPGA -> host
+MAGIC_TX    = b'\x06\x1d\x22\xda'
+OK1 = bytes([0x0C]*4)
+OK2 = bytes([0x1C]*4)
+RESET     = bytes([0xFF]*4)
+# Hsa_Wrapper.sv: FEFEFEFE sets hsa_mode (matrix), FDFDFDFD clears it
+TO_MATRIX = bytes([0xFE]*4)
+TO_VECTOR = bytes([0xFD]*4)
+
+# Driver extensions, not implemented in the RTL. The host asks for them with
+# CAPS_QUERY right after the 1st OK, where Wrapper.sv ignores anything but
+# the magic, so a board that never answers simply has none of them.
+CAPS_QUERY = bytes([0xCA]*4)
+CAPS_REPLY = b'\xca\xfe'            # + 16 bit big endian feature mask
+CAP_RESIDENT = 0x0001               # keeps weights between ops, MAGIC_ACTS_ONLY
+CAP_SPARSE   = 0x0002               # takes N*N/2 column-packed weights, MAGIC_SPARSE
+CAP_BATCH    = 0x0004               # many act vectors per handshake, MAGIC_BATCH
+CAP_NACK     = 0x0008               # selective repeat, see retransmit.py
+CAP_COMPACT  = 0x0010               # block framed payloads, see compact.py
+
+MAGIC_ACTS_ONLY = b'\x06\x1d\x22\xdb'   # reuse resident weights, acts follow
+MAGIC_SPARSE    = b'\x06\x1d\x22\xdc'   # packed weights (see sparse.py), acts follow
+MAGIC_BATCH     = b'\x06\x1d\x22\xdd'   # batch header, weights, B act vectors follow
+WEIGHTS_STALE   = bytes([0x5E]*4)       # reply to MAGIC_ACTS_ONLY without weights
+COMPACT_PREFIX  = bytes([0xCB]*4)       # before any magic: payload comes as blocks
+
+# Selective repeat (CAP_NACK). While the board waits for the payload the host
+# may send MISSING_QUERY, answered by MISSING_REPLY + 16 bit big endian count
+# and that many frames (msb set, data 0) naming the (A/W, x, y) still
+# missing. A count of 0 means it has them all (the 1C got lost), MISSING_ALL
+# means it never saw the magic. While results are repeated the host sends
+# one RESEND_DATA tagged frame per result cell it is missing.
+MISSING_QUERY = bytes([0xC5]*4)
+MISSING_REPLY = b'\x5a\x5a'
+MISSING_ALL   = 0xFFFF
+RESEND_DATA   = 0xC6C6
+
+# Batched MVM: act and result frames carry the vector index in x, so one
+# handshake moves up to 128 vectors. The header word after MAGIC_BATCH has
+# the msb set (so RECV skips it if it is ever resent) and reads
+#   bit 30: weights resident, none follow   bit 29: weights sparse-packed
+#   bits 7..0: B
+BATCH_MAX = 128
+
+
+def encode_frames(msb, weight, xix, yix, data):
+    # Same as SAUnit.build_dataframe but over whole arrays (broadcasts)
+    msb    = np.asarray(msb,    dtype=np.int64) & 0x1
+    weight = np.asarray(weight, dtype=np.int64) & 0x1
+    xix    = np.asarray(xix,    dtype=np.int64) & 0x7F
+    yix    = np.asarray(yix,    dtype=np.int64) & 0x7F
+    data   = np.asarray(data,   dtype=np.int64) & 0xFFFF
+    ret = (msb << 31) | (weight << 30) | (xix << 23) | (yix << 16) | data
+    return ret.astype(np.uint32)
+
+
+def decode_frames(words):
+    # Inverse of encode_frames, returns (msb, weight, xix, yix, data)
+    words = np.asarray(words, dtype=np.uint32)
+    msb    = (words >> 31) & 0x1
+    weight = (words >> 30) & 0x1
+    xix    = (words >> 23) & 0x7F
+    yix    = (words >> 16) & 0x7F
+    data   = words & 0xFFFF
+    return (msb, weight, xix, yix, data)
+
+
+def frames_to_bytes(frames, dtype=TX_DTYPE):
+    return np.asarray(frames, dtype=np.uint32).astype(dtype, copy=False).tobytes()
+
+
+def bytes_to_frames(buf, dtype=RX_DTYPE):
+    # Any trailing partial word is ignored, caller keeps it for next time
+    n = len(buf) // 4
+    return np.frombuffer(buf, dtype=dtype, count=n).astype(np.uint32)
+
+
+def matrix_frames(mat, is_weights=1):
+    # Frame order matches SAUnit.pack_matrix: y outer, x inner,
+    # data = mat[x][y]
+    mat = np.asarray(mat, dtype=np.int64)
+    N = mat.shape[0]
+    yix, xix = np.divmod(np.arange(N*N), N)
+    return encode_frames(0, is_weights, xix, yix, mat.T.reshape(-1))
+
+
+def vector_frames(vec):
+    vec = np.asarray(vec, dtype=np.int64)
+    return encode_frames(0, 0, 0, np.arange(vec.shape[0]), vec)
+
+
+def pack_matrix(mat, is_weights=1):
+    return frames_to_bytes(matrix_frames(mat, is_weights))
+
+
+def pack_vector(vec):
+    return frames_to_bytes(vector_frames(vec))
+
+
+def unpack_matrix(buf, N, dtype=TX_DTYPE):
+    # Decode a matrix payload back into mat[x][y]; cells that were
+    # never sent stay 0
+    _, _, xix, yix, data = decode_frames(bytes_to_frames(buf, dtype))
+    mat = np.zeros((N, N), dtype=np.int64)
+    mat[xix, yix] = data
+    return mat
+
+
+def unpack_vector(buf, N, dtype=TX_DTYPE):
+    _, _, _, yix, data = decode_frames(bytes_to_frames(buf, dtype))
+    vec = np.zeros(N, dtype=np.int64)
+    vec[yix] = data
+    return vec
+
+
+def batch_header(B, resident=0, sparse=0):
+    if not 0 < B <= BATCH_MAX:
+        raise ValueError(f"Batch of {B} vectors, must be 1 to {BATCH_MAX}")
+    word = (1 << 31) | (resident << 30) | (sparse << 29) | B
+    return frames_to_bytes([word])
+
+
+def parse_batch_header(word):
+    # -> (B, resident, sparse)
+    word = int(word)
+    return (word & 0xFF, (word >> 30) & 1, (word >> 29) & 1)
+
+
+def batch_frames(block):
+    # (B, N) act vectors, b outer, y inner, x = b
+    block = np.asarray(block, dtype=np.int64)
+    B, N = block.shape
+    xix, yix = np.divmod(np.arange(B*N), N)
+    return encode_frames(0, 0, xix, yix, block.reshape(-1))
+
+
+def pack_batch(block):
+    return frames_to_bytes(batch_frames(block))
+
+
+def to_signed(data, bits=16):
+    # Reinterpret the unsigned payload field as two's complement
+    data = np.asarray(data, dtype=np.int64)
+    sign = 1 << (bits - 1)
+    return (data & (sign - 1)) - (data & sign)
@@ -0,0 +1,100 @@
+import zlib
+import numpy as np
+import codec
+
+# Compact framing (CAP_COMPACT), host -> FPGA payload only. A regular frame
+# spends 16 of its 32 bits on addressing; here a run of frames becomes
+#
+#   header:   1011 | A/W | x (7) | y (7) | count (13)
+#   data:     count 16 bit values, two per word, zero padded
+#   checksum: crc32 of header + data as sent
+#
+# where (x, y) is the index of the first value and the rest follow in the
+# order pack_matrix/pack_vector/pack_batch emit them, so the board only
+# needs a start and a count. A block with a bad checksum is dropped whole,
+# selective repeat (retransmit.py) then asks for its frames again. Results
+# still come back as regular frames.
+#
+# A session is compact when COMPACT_PREFIX comes right before the magic;
+# from then until the 1C the board takes blocks only, so a lost header
+# can't turn packed data into bogus frames. The RTL still checks every word
+# for RESET and the mode switches though, and a pair of equal values like
+# (0xFFFF, 0xFFFF) packs to one of them, so blocks are cut between the two
+# values of such a pair (and shortened when the checksum comes out as one).
+
+BLOCK_TAG = 0xB
+BLOCK_MAX = 64      # values per block, ~94% of the payload bits are data
+CONTROL_WORDS = codec.bytes_to_frames(codec.RESET + codec.TO_MATRIX + codec.TO_VECTOR, codec.TX_DTYPE)
+
+
+def block_header(aw, xix, yix, count):
+    return (BLOCK_TAG << 28) | (aw << 27) | (xix << 20) | (yix << 13) | count
+
+
+def is_block_header(words):
+    return (np.asarray(words, dtype=np.uint32) >> 28) == BLOCK_TAG
+
+
+def block_words(count):
+    # total words of a block holding count values
+    return 2 + (count + 1) // 2
+
+
+def pack_blocks(payload, keep=None, max_count=BLOCK_MAX):
+    # Regular frames (as built by pack_matrix etc.) -> blocks. With keep,
+    # only those frames go, a gap in keep starts a new block
+    words = codec.bytes_to_frames(payload, codec.TX_DTYPE)
+    _, aw, xix, yix, data = codec.decode_frames(words)
+    idx = np.arange(len(words)) if keep is None else np.flatnonzero(keep)
+    if len(idx) == 0:
+        return b""
+    brk = np.flatnonzero((np.diff(idx) != 1) | (np.diff(aw[idx]) != 0)) + 1
+    starts = np.concatenate([[0], brk])
+    ends = np.concatenate([brk, [len(idx)]])
+
+    out = []
+    for s, e in zip(starts, ends):
+        lo = s
+        while lo < e:
+            run = idx[lo:min(e, lo + max_count)]
+            values = data[run].astype('<u2')
+            pairs = values[:len(values) & ~1].view('<u4')
+            bad = np.flatnonzero(np.isin(pairs, CONTROL_WORDS))
+            count = 2*bad[0] + 1 if len(bad) else len(run)
+            block = _block(aw[run[0]], xix[run[0]], yix[run[0]], values[:count])
+            while block is None and count > 1:
+                count -= 1
+                block = _block(aw[run[0]], xix[run[0]], yix[run[0]], values[:count])
+            if block is None:
+                raise ValueError(f"No block framing of frame {run[0]} avoids the control words")
+            out.append(block)
+            lo += count
+    return b"".join(out)
+
+
+def _block(aw, xix, yix, values):
+    # header + values + checksum, None if the checksum reads as a control word
+    header = block_header(int(aw), int(xix), int(yix), len(values))
+    if len(values) % 2:
+        values = np.append(values, np.zeros(1, dtype='<u2'))
+    body = codec.frames_to_bytes([header]) + values.tobytes()
+    crc = zlib.crc32(body)
+    if crc in CONTROL_WORDS:
+        return None
+    return body + codec.frames_to_bytes([crc])
+
+
+def parse_block(words):
+    # Board side. words starts at a header (host byte order already
+    # applied) -> (consumed, block) where block is (aw, x, y, values) or
+    # None for a bad checksum; consumed is 0 if the block isn't all in yet
+    header = int(words[0])
+    count = header & 0x1FFF
+    n = block_words(count)
+    if len(words) < n:
+        return (0, None)
+    raw = codec.frames_to_bytes(words[:n])
+    if zlib.crc32(raw[:-4]) != int(words[n-1]):
+        return (n, None)
+    values = np.frombuffer(raw[4:4 + 2*count], dtype='<u2').astype(np.int64)
+    return (n, ((header >> 27) & 1, (header >> 20) & 0x7F, (header >> 13) & 0x7F, values))
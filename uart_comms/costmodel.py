@@ -0,0 +1,243 @@
+import argparse
+import numpy as np
+import codec
+from compact import BLOCK_MAX, block_words
+from hsa_sim import cycles
+
+# Analytical cost of an op on the SA unit, to decide between MMM tiles and
+# MVM vectors (and dense vs sparse) without running anything:
+#
+#   model = CostModel(N=8, baudrate=921600)
+#   model.calibrate(port)                       # optional, fits the overheads
+#   model.estimate('mvm')                       # one op
+#   model.problem(3072, 768, 9)                 # W (M, K) @ X (K, P), every mode
+#
+# Per op:
+#   device    compute cycles of the array (hsa_sim.cycles) at 100 MHz
+#   wire      bytes each way, from the 32 bit frame layout and the
+#             handshakes SAUnit does (a 4 word DEADBEEF burst, magic,
+#             payload, 1C, DEADBEEF burst, 5x 0C, results, 1C), at 11 bits per
+#             byte (8E1 + start). A clean run, each extra alignment attempt
+#             is another burst. problem() adds the CAPS probe of the first
+#             handshake
+#   latency   host_overhead + link_factor * wire time + device time
+#             + device_overhead
+#
+# host_overhead (pyserial/OS turnarounds, the 10 ms settle of the non-NACK
+# path...), link_factor and device_overhead default to an ideal link and
+# are fitted from rand_test timings by fit()/calibrate(): sys_delta gives
+# the first two, fpga_delta (payload ack -> first result word) the last.
+
+CLOCK_HZ = 100e6
+BITS_PER_BYTE = 11      # start + 8 data + parity + stop
+FRAME_BYTES = 4
+WORD_BYTES = 4
+ALIGN_WORDS = 4         # DEADBEEF words per alignment burst, either way
+MODES = ('mmm', 'mvm', 'sparse')
+
+
+def _compact_bytes(values):
+    # compact.pack_blocks size for one contiguous run of values
+    full, rest = divmod(values, BLOCK_MAX)
+    words = full * block_words(BLOCK_MAX) + (block_words(rest) if rest else 0)
+    return words * WORD_BYTES
+
+
+class CostModel:
+    def __init__(self, N=8, bits=16, baudrate=921600, clock_hz=CLOCK_HZ,
+                 host_overhead=0.0, link_factor=1.0, device_overhead=0.0):
+        if bits > 16:
+            raise ValueError(f"Frames carry 16 bit data, {bits} bits won't fit")
+        self.N = N
+        self.bits = bits
+        self.baudrate = baudrate
+        self.clock_hz = clock_hz
+        self.host_overhead = host_overhead
+        self.link_factor = link_factor
+        self.device_overhead = device_overhead
+
+    def device_cycles(self, mode, batch=1):
+        # a batch is one handshake but still one array pass per vector
+        return batch * cycles(self.N, mvm=mode != 'mmm', sparse=mode == 'sparse')
+
+    def wire_bytes(self, mode, batch=1, resident=0, compact=0):
+        # -> (host to board, board to host)
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode}, expected one of {MODES}")
+        N = self.N
+        weights = 0 if resident else (N*N//2 if mode == 'sparse' else N*N)
+        acts = N*N if mode == 'mmm' else batch*N
+        results = N*N if mode == 'mmm' else batch*N
+        # packed weights need their x, so SAUnit only compacts dense payloads
+        compact = compact and mode != 'sparse'
+
+        tx = ALIGN_WORDS*len(codec.DEADBEEF_TX) + len(codec.MAGIC_TX)
+        if batch > 1:
+            tx += WORD_BYTES        # batch header
+        if compact:
+            tx += len(codec.COMPACT_PREFIX) + _compact_bytes(weights) + _compact_bytes(acts)
+        else:
+            tx += (weights + acts) * FRAME_BYTES
+        tx += 5*len(codec.OK1) + len(codec.OK2)
+        # the board repeats DEADBEEF until it sees the 0C, one burst at least
+        rx = (len(codec.OK1) + len(codec.OK2) + ALIGN_WORDS*len(codec.DEADBEEF_RX)
+              + results * FRAME_BYTES)
+        return (tx, rx)
+
+    def probe_bytes(self):
+        # CAPS_QUERY and its reply, once per unit -> (tx, rx)
+        return (len(codec.CAPS_QUERY), len(codec.CAPS_REPLY) + 2)
+
+    def wire_time(self, mode, batch=1, resident=0, compact=0):
+        # half duplex worst case: the two directions don't overlap
+        return sum(self.wire_bytes(mode, batch, resident, compact)) * BITS_PER_BYTE / self.baudrate
+
+    def estimate(self, mode, batch=1, resident=0, compact=0):
+        cyc = self.device_cycles(mode, batch)
+        device = cyc / self.clock_hz
+        tx, rx = self.wire_bytes(mode, batch, resident, compact)
+        wire = self.wire_time(mode, batch, resident, compact)
+        return {
+            "mode": mode,
+            "batch": batch,
+            "cycles": cyc,
+            "device_s": device,
+            "tx_bytes": tx,
+            "rx_bytes": rx,
+            "wire_s": wire,
+            "latency_s": self.host_overhead + self.link_factor * wire + device + self.device_overhead,
+        }
+
+    def ops(self, mode, M, K, P=1):
+        # ops for W (M, K) @ X (K, P) tiled like TiledEngine, k before j so a
+        # weight tile meets all its activation tiles in a row
+        N = self.N
+        Mt, Kt, Pt = -(-M // N), -(-K // N), -(-P // N)
+        if mode == 'mmm':
+            return Mt * Kt * Pt
+        return Mt * Kt * P
+
+    def problem(self, M, K, P=1, batch=1, resident=0, compact=0, modes=MODES):
+        # -> {mode: totals} for the whole product. In MVM modes every column
+        # of X is its own vector; batch groups the P vectors of each weight
+        # tile per handshake (at most codec.BATCH_MAX, like mvm_batch)
+        probe_tx, probe_rx = self.probe_bytes()
+        probe_s = self.link_factor * (probe_tx + probe_rx) * BITS_PER_BYTE / self.baudrate
+        out = {}
+        for mode in modes:
+            if mode == 'mmm' and P == 1:
+                continue
+            if mode == 'mmm':
+                runs = [(self.ops(mode, M, K, P), 1)]
+            else:
+                b = max(1, min(batch, P, codec.BATCH_MAX))
+                tiles = self.ops(mode, M, K, 1)
+                full, rest = divmod(P, b)
+                runs = [(tiles * full, b)] + ([(tiles, rest)] if rest else [])
+            total = {
+                "ops": self.ops(mode, M, K, P),
+                "handshakes": 0,
+                "cycles": 0,
+                "tx_bytes": probe_tx,
+                "rx_bytes": probe_rx,
+                "latency_s": probe_s,
+            }
+            for count, size in runs:
+                one = self.estimate(mode, size, resident, compact)
+                total["handshakes"] += count
+                for key in ("cycles", "tx_bytes", "rx_bytes", "latency_s"):
+                    total[key] += one[key] * count
+            out[mode] = total
+        return out
+
+    def best_mode(self, M, K, P=1, sparse_ok=0, **kw):
+        modes = MODES if sparse_ok else ('mmm', 'mvm')
+        costs = self.problem(M, K, P, modes=modes, **kw)
+        return min(costs, key=lambda m: costs[m]["latency_s"])
+
+    def fit(self, samples):
+        # samples: (mode, fpga_delta, sys_delta) as returned around rand_test.
+        # Medians per mode, then sys = host_overhead + link_factor * wire
+        # (+ device) by least squares when there are two or more modes;
+        # with one mode only the overhead is fitted
+        by_mode = {}
+        for mode, fpga_delta, sys_delta in samples:
+            by_mode.setdefault(mode, []).append((fpga_delta, sys_delta))
+        if not by_mode:
+            raise ValueError("No samples to fit")
+
+        wires, syss, devs = [], [], []
+        for mode, vals in by_mode.items():
+            est = self.estimate(mode)
+            fpga_med, sys_med = np.median(np.asarray(vals), axis=0)
+            wires.append(est["wire_s"])
+            syss.append(sys_med - est["device_s"])
+            # DEADBEEF is the first result word, the rest is overhead
+            devs.append(fpga_med - est["device_s"] - len(codec.DEADBEEF_RX) * BITS_PER_BYTE / self.baudrate)
+
+        # the device overhead is in sys_delta too, keep it out of the host's
+        self.device_overhead = max(0.0, float(np.mean(devs)))
+        wires = np.asarray(wires)
+        syss = np.asarray(syss) - self.device_overhead
+        if len(set(wires)) > 1:
+            A = np.stack([np.ones_like(wires), wires], axis=1)
+            (self.host_overhead, self.link_factor), *_ = np.linalg.lstsq(A, syss, rcond=None)
+        else:
+            self.link_factor = 1.0
+            self.host_overhead = float(np.mean(syss - wires))
+        self.host_overhead = max(0.0, float(self.host_overhead))
+        self.link_factor = max(1.0, float(self.link_factor))
+        return self
+
+    def calibrate(self, unit, trials=20, modes=('mvm', 'mmm'), bulk=1):
+        # runs rand_test on the unit (switching modes), then fit()
+        samples = []
+        for mode in modes:
+            vector_mode = 0 if mode == 'mmm' else 1
+            unit.switch_mode(vector_mode)
+            for _ in range(trials):
+                correct, fpga_delta, sys_delta = unit.rand_test(vector_mode=vector_mode, bulk=bulk)
+                if correct:
+                    samples.append((mode, fpga_delta, sys_delta))
+        return self.fit(samples)
+
+    def __str__(self):
+        return (f"N={self.N}, {self.baudrate} baud, {self.clock_hz/1e6:.0f} MHz, "
+                f"host overhead {1e3*self.host_overhead:.3f} ms, link x{self.link_factor:.2f}, "
+                f"device overhead {1e3*self.device_overhead:.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate SA unit cost of W (M, K) @ X (K, P)")
+    parser.add_argument("shape", type=int, nargs="+", help="M K [P]")
+    parser.add_argument("--N", type=int, default=8)
+    parser.add_argument("--baud", type=int, default=921600)
+    parser.add_argument("--batch", type=int, default=1, help="vectors per handshake in MVM modes")
+    parser.add_argument("--resident", action="store_true", help="weights already on the board")
+    parser.add_argument("--compact", action="store_true")
+    parser.add_argument("--port", help="calibrate against this board first")
+    parser.add_argument("--emulate", action="store_true", help="calibrate against a local emulator")
+    args = parser.parse_args()
+
+    model = CostModel(N=args.N, baudrate=args.baud)
+    if args.port or args.emulate:
+        from utility import SAUnit
+        emu = None
+        if args.emulate:
+            from emulator import FPGAEmulator
+            emu = FPGAEmulator(N=args.N, baudrate=args.baud)
+        unit = SAUnit(emu.start() if emu else args.port, N=args.N, baudrate=args.baud)
+        try:
+            model.calibrate(unit)
+        finally:
+            unit.close()
+            if emu:
+                emu.stop()
+    print(model)
+
+    M, K, P = (args.shape + [1])[:3]
+    for mode, cost in model.problem(M, K, P, batch=args.batch, resident=args.resident,
+                                    compact=args.compact).items():
+        print(f"{mode:>6}: {cost['ops']} ops in {cost['handshakes']} handshakes, "
+              f"{cost['tx_bytes'] + cost['rx_bytes']} wire bytes, {cost['cycles']} cycles, "
+              f"{1e3*cost['latency_s']:.2f} ms")
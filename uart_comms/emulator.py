@@ -0,0 +1,562 @@
+import os
+import select
+import sys
+import threading
+import time
+import tty
+import numpy as np
+import codec
+from retransmit import missing_report, is_resend_request
+from compact import is_block_header, parse_block
+from codec import (DEADBEEF_TX, DEADBEEF_RX, MAGIC_TX, OK1, OK2, RESET, TO_VECTOR, TO_MATRIX,
+                   CAPS_QUERY, CAPS_REPLY, CAP_RESIDENT, CAP_SPARSE, CAP_BATCH, CAP_NACK,
+                   CAP_COMPACT, MAGIC_ACTS_ONLY, MAGIC_SPARSE, MAGIC_BATCH, WEIGHTS_STALE,
+                   MISSING_QUERY, COMPACT_PREFIX)
+
+# Software stand-in for the FPGA side of the UART protocol, served on a
+# Linux pseudo-terminal so SAUnit can open it like a real port:
+#
+#   emu = FPGAEmulator(N=8)
+#   port = SAUnit(emu.start(), N=8)
+#
+# It follows Wrapper.sv: byte-level DEADBEEF alignment -> 0C, magic, weight
+# and activation frames until every cell is filled -> 1C, compute, then
+# DEADBEEF until the host answers 0C and the result frames on repeat until
+# the host answers 1C. 0xFF x4 resets in any state; 0xFE x4 switches to
+# matrix and 0xFD x4 to vector mode and resets, as in Hsa_Wrapper.sv.
+#
+# On top of that it implements the driver extensions from codec: it answers
+# CAPS_QUERY while waiting for the magic, and with CAP_RESIDENT the weights
+# survive a completed op so MAGIC_ACTS_ONLY can reuse them (control words
+# drop them, MAGIC_ACTS_ONLY without weights gets WEIGHTS_STALE). With
+# CAP_SPARSE, MAGIC_SPARSE is followed by N*N/2 column-packed weight frames
+# (sparse.py) and the pruned tile is multiplied like SpVpu does. With
+# CAP_BATCH, MAGIC_BATCH and its header word bring up to 128 act vectors
+# (x = vector index) and the results come back indexed the same way. With
+# CAP_NACK it answers MISSING_QUERY and per-cell result resend requests.
+# With CAP_COMPACT, COMPACT_PREFIX before the magic makes it take the
+# payload as checksummed blocks (compact.py) instead of frames.
+# Pass caps=0 to behave like the plain RTL. frame_loss drops that fraction
+# of data frames each way, like the RTL discarding a frame on a parity error.
+
+CONTROL = (RESET, TO_VECTOR, TO_MATRIX)
+CONTROL_WORDS = np.array([0xFFFFFFFF, 0xFEFEFEFE, 0xFDFDFDFD], dtype=np.uint32)
+
+# FSM states
+IDLE, WAIT_MAGIC, WAIT_HEADER, RECV, COMPUTE, TX_ALIGN, TX_RESULTS = range(7)
+
+ALL_CAPS = CAP_RESIDENT | CAP_SPARSE | CAP_BATCH | CAP_NACK | CAP_COMPACT
+MISSING_QUERY_WORD = 0xC5C5C5C5
+
+BITS_PER_BYTE = 11  # start + 8 data + parity + stop
+
+
+class FPGAEmulator:
+    def __init__(self, N=8, vector_mode=1, bit_width=16, compute_latency=0.0, baudrate=None,
+                 align_interval=0.01, repeat_interval=0.05, caps=ALL_CAPS, frame_loss=0.0,
+                 seed=None, verb=0):
+        self.N = N
+        self.vector_mode = vector_mode
+        self.bit_width = bit_width
+        self.compute_latency = compute_latency
+        self.baudrate = baudrate            # None => no throttling
+        self.align_interval = align_interval
+        self.repeat_interval = repeat_interval
+        self.caps = caps
+        self.frame_loss = frame_loss
+        self.rng = np.random.default_rng(seed)
+        self.verb = verb
+
+        self.master = self.slave = None
+        self.port = None
+        self.thread = None
+        self.running = False
+
+        # counters, handy for tests
+        self.ops = 0
+        self.frames_rx = 0
+        self.bytes_rx = 0
+        self.bytes_tx = 0
+        self.resets = 0
+        self.acts_only_ops = 0
+        self.frames_dropped = 0
+        self.missing_reports = 0
+        self.frames_resent = 0
+        self.blocks_rx = 0
+        self.blocks_rejected = 0
+
+        self.weights_valid = False
+        self._reset_fsm()
+
+    # ---- plumbing ----
+
+    def start(self):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+        return self.port
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                os.close(fd)
+        self.master = self.slave = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _serve(self):
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        self.rx_pending = []     # (time the last byte would have landed, bytes)
+        self.rx_free_at = self.tx_free_at = 0.0
+        while self.running:
+            now = time.monotonic()
+            want_write = bool(self.outbuf) and now >= self.tx_free_at
+            wait = self._next_deadline(now)
+            r, w, _ = select.select([self.master], [self.master] if want_write else [], [], wait)
+            now = time.monotonic()
+            if r:
+                self._read_master(now)
+            self._deliver(now)
+            self._tick(now)
+            if self.outbuf and time.monotonic() >= self.tx_free_at:
+                self._write_master()
+
+    def _next_deadline(self, now):
+        times = [now + 0.05]
+        if self.rx_pending:
+            times.append(self.rx_pending[0][0])
+        if self.outbuf:
+            times.append(self.tx_free_at)
+        if self.timer is not None:
+            times.append(self.timer)
+        return max(0.0, min(times) - now)
+
+    def _byte_time(self, n):
+        return n * BITS_PER_BYTE / self.baudrate if self.baudrate else 0.0
+
+    def _read_master(self, now):
+        try:
+            data = os.read(self.master, 65536)
+        except (BlockingIOError, OSError):
+            return
+        self.bytes_rx += len(data)
+        if self.baudrate:
+            self.rx_free_at = max(self.rx_free_at, now) + self._byte_time(len(data))
+            self.rx_pending.append((self.rx_free_at, data))
+        else:
+            self.inbuf += data
+
+    def _deliver(self, now):
+        while self.rx_pending and self.rx_pending[0][0] <= now:
+            self.inbuf += self.rx_pending.pop(0)[1]
+        self._process()
+
+    def _write_master(self):
+        chunk = self.outbuf
+        if self.baudrate:
+            # roughly one ms worth of bytes at a time
+            chunk = self.outbuf[:max(4, int(self.baudrate / BITS_PER_BYTE / 1000))]
+        try:
+            n = os.write(self.master, chunk)
+        except (BlockingIOError, OSError):
+            return
+        del self.outbuf[:n]
+        self.bytes_tx += n
+        self.tx_free_at = time.monotonic() + self._byte_time(n)
+
+    def send(self, data):
+        self.outbuf += data
+
+    # ---- FSM ----
+
+    def _reset_fsm(self, keep_weights=False):
+        N = self.N
+        self.state = IDLE
+        self.timer = None
+        self.last_ack = 0.0
+        if not (keep_weights and self.caps & CAP_RESIDENT):
+            self.weights = np.zeros((N, N), dtype=np.int64)
+            self.weights_valid = False
+        self.sparse = False
+        self.batch = 0
+        self.compact = False
+        self.acts = np.zeros((N,) if self.vector_mode else (N, N), dtype=np.int64)
+        self.weights_filled = np.zeros((N, N), dtype=bool)
+        self.acts_filled = np.zeros(self.acts.shape, dtype=bool)
+        self.result_bytes = b""
+
+    def _control(self, word):
+        self.resets += 1
+        if word == TO_VECTOR:
+            self.vector_mode = 1
+        elif word == TO_MATRIX:
+            self.vector_mode = 0
+        if self.verb:
+            print("EMU: control word", word.hex())
+        self._reset_fsm()
+
+    def _find_first(self, patterns):
+        # earliest match of any pattern at any byte offset
+        best = (-1, None)
+        for p in patterns:
+            ix = self.inbuf.find(p)
+            if ix >= 0 and (best[0] < 0 or ix < best[0]):
+                best = (ix, p)
+        return best
+
+    def _process(self):
+        while self.inbuf:
+            before = (self.state, len(self.inbuf))
+            if self.state in (WAIT_MAGIC, WAIT_HEADER, RECV):
+                self._process_words()
+            else:
+                self._process_bytes()
+            if (self.state, len(self.inbuf)) == before:
+                break
+
+    def _process_bytes(self):
+        # Unaligned states: only look for handshake and control words
+        if self.state == TX_RESULTS and self.caps & CAP_NACK:
+            self._take_resend_requests()
+        if self.state == IDLE:
+            expect = (DEADBEEF_TX,)
+        elif self.state == TX_ALIGN:
+            expect = (OK1, OK2)
+        elif self.state == TX_RESULTS:
+            expect = (OK2,)
+        else:
+            expect = ()
+        if self.state in (COMPUTE, TX_ALIGN) and self.caps & CAP_NACK:
+            expect += (MISSING_QUERY,)
+        ix, word = self._find_first(CONTROL + expect)
+        if ix < 0:
+            # keep a possible partial match
+            del self.inbuf[:max(0, len(self.inbuf) - 3)]
+            return
+        del self.inbuf[:ix + 4]
+        if word in CONTROL:
+            self._control(word)
+        elif word == DEADBEEF_TX:
+            if self.verb:
+                print("EMU: aligned, sending 0C")
+            self.send(OK1)
+            self.last_ack = time.monotonic()
+            self.state = WAIT_MAGIC
+        elif word == OK1:
+            self.state = TX_RESULTS
+            self.timer = time.monotonic()
+        elif word == MISSING_QUERY:
+            self.send(missing_report([], [], []))   # 1C got lost, we have it all
+        elif word == OK2:
+            if self.verb:
+                print("EMU: host acknowledged results")
+            self.ops += 1
+            self._reset_fsm(keep_weights=True)
+
+    def _process_words(self):
+        # Aligned states: 32 bit words from here on
+        n = len(self.inbuf) & ~3
+        if n == 0:
+            return
+        if self.state == WAIT_MAGIC:
+            word = bytes(self.inbuf[:4])
+            del self.inbuf[:4]
+            if word in CONTROL:
+                self._control(word)
+            elif word == COMPACT_PREFIX and self.caps & CAP_COMPACT:
+                self.compact = True
+            elif word == MAGIC_TX:
+                self.weights_valid = False
+                self.state = RECV
+            elif word == MAGIC_SPARSE and self.caps & CAP_SPARSE:
+                self._start_sparse()
+                self.state = RECV
+            elif word == MAGIC_BATCH and self.caps & CAP_BATCH:
+                self.state = WAIT_HEADER
+            elif word == MISSING_QUERY and self.caps & CAP_NACK:
+                # magic got lost, have the host start over
+                self.send(codec.MISSING_REPLY + codec.MISSING_ALL.to_bytes(2, byteorder='big'))
+            elif word == CAPS_QUERY and self.caps:
+                self.send(CAPS_REPLY + self.caps.to_bytes(2, byteorder='big'))
+            elif word == MAGIC_ACTS_ONLY and self.caps & CAP_RESIDENT:
+                self._reuse_weights()
+            elif word == DEADBEEF_TX and time.monotonic() - self.last_ack > self.align_interval:
+                self.send(OK1)  # host missed our ack
+                self.last_ack = time.monotonic()
+            return
+
+        if self.state == WAIT_HEADER:
+            word = bytes(self.inbuf[:4])
+            del self.inbuf[:4]
+            if word in CONTROL:
+                self._control(word)
+                return
+            B, resident, sparse = codec.parse_batch_header(codec.bytes_to_frames(word, codec.TX_DTYPE)[0])
+            if B == 0 or B > codec.BATCH_MAX:
+                self.state = WAIT_MAGIC     # garbled header, wait for the host to retry
+                return
+            self.state = WAIT_MAGIC
+            if resident and self.caps & CAP_RESIDENT:
+                self._reuse_weights()
+                if self.state != RECV:
+                    return
+            elif sparse and self.caps & CAP_SPARSE:
+                self._start_sparse()
+            self.weights_valid &= bool(resident)
+            self.batch = B
+            self.acts = np.zeros((B, self.N), dtype=np.int64)
+            self.acts_filled = np.zeros((B, self.N), dtype=bool)
+            self.state = RECV
+            return
+
+        # RECV: decode everything up to the first control word in bulk
+        words = np.frombuffer(bytes(self.inbuf[:n]), dtype=codec.TX_DTYPE).astype(np.uint32)
+        if self.compact:
+            self._process_blocks(words)
+            return
+        stop = np.isin(words, CONTROL_WORDS)
+        if self.caps & CAP_NACK:
+            stop |= (words == MISSING_QUERY_WORD)
+        ctrl = np.flatnonzero(stop)
+        cut = ctrl[0] if len(ctrl) else len(words)
+        del self.inbuf[:4*cut]
+        self._fill(words[:cut])
+        if len(ctrl) and self.state == RECV:
+            word = bytes(self.inbuf[:4])
+            del self.inbuf[:4]
+            if word == MISSING_QUERY:
+                self._report_missing()
+            else:
+                self._control(word)
+
+    def _process_blocks(self, words):
+        # Compact session: blocks only, anything else between them is noise.
+        # Control words count wherever they are, inside a block too
+        N = self.N
+        most = N * max(N, codec.BATCH_MAX)
+        ctrl = np.flatnonzero(np.isin(words, CONTROL_WORDS))
+        end = ctrl[0] if len(ctrl) else len(words)
+        i = 0
+        while i < end and self.state == RECV:
+            word = int(words[i])
+            if word == MISSING_QUERY_WORD and self.caps & CAP_NACK:
+                self._report_missing()
+            elif is_block_header(word) and (word & 0x1FFF) <= most:
+                used, block = parse_block(words[i:end])
+                if used == 0:
+                    break   # rest of the block still on its way
+                i += used
+                if block is None:
+                    self.blocks_rejected += 1
+                elif self.frame_loss and self.rng.random() < 1 - (1 - self.frame_loss)**used:
+                    self.frames_dropped += len(block[3])
+                else:
+                    self.blocks_rx += 1
+                    self._store(self._block_frames(*block))
+                continue
+            i += 1
+        if len(ctrl) and self.state == RECV:
+            del self.inbuf[:4*end + 4]
+            self._control(codec.frames_to_bytes([words[end]]))
+            return
+        del self.inbuf[:4*i]
+
+    def _block_frames(self, aw, x0, y0, values):
+        # a block's values follow the host's frame order from (x0, y0)
+        N = self.N
+        step = np.arange(len(values))
+        if aw:
+            y_ix, x_ix = np.divmod(y0*N + x0 + step, N)
+        elif self.batch:
+            x_ix, y_ix = np.divmod(x0*N + y0 + step, N)
+        elif self.vector_mode:
+            x_ix, y_ix = np.zeros_like(step), y0 + step
+        else:
+            y_ix, x_ix = np.divmod(y0*N + x0 + step, N)
+        ok = (x_ix < 128) & (y_ix < 128)
+        return codec.encode_frames(0, aw, x_ix[ok], y_ix[ok], values[ok])
+
+    def _start_sparse(self):
+        # one frame per packed pair, the dropped weight is 0
+        self.weights_valid = False
+        self.sparse = True
+        self.weights[:] = 0
+        self.weights_filled = np.zeros((self.N//2, self.N), dtype=bool)
+
+    def _reuse_weights(self):
+        if self.weights_valid:
+            self.weights_filled[:] = True
+            self.acts_only_ops += 1
+            self.state = RECV
+        else:
+            if self.verb:
+                print("EMU: no resident weights, sending WEIGHTS_STALE")
+            self.send(WEIGHTS_STALE)
+
+    def _report_missing(self):
+        wx, wy = np.nonzero(~self.weights_filled)
+        if self.sparse:
+            wx = 2*wx
+        if self.batch or not self.vector_mode:
+            ax, ay = np.nonzero(~self.acts_filled)
+        else:
+            ay = np.flatnonzero(~self.acts_filled)
+            ax = np.zeros_like(ay)
+        aw = np.concatenate([np.ones(len(wx), dtype=np.int64), np.zeros(len(ax), dtype=np.int64)])
+        self.missing_reports += 1
+        if self.verb:
+            print(f"EMU: host asked, {len(aw)} frames missing")
+        self.send(missing_report(aw, np.concatenate([wx, ax]), np.concatenate([wy, ay])))
+
+    def _take_resend_requests(self):
+        # aligned words at the front of the input: leftover 0Cs and
+        # requests for single result cells
+        keys = []
+        while len(self.inbuf) >= 4:
+            word = bytes(self.inbuf[:4])
+            n = int.from_bytes(word, byteorder='little')
+            if word == OK1:
+                pass
+            elif is_resend_request(n):
+                keys.append((n >> 16) & 0x3FFF)
+            else:
+                break
+            del self.inbuf[:4]
+        if not keys:
+            return
+        frames = codec.bytes_to_frames(self.result_bytes)
+        keep = np.isin((frames >> 16) & 0x3FFF, keys)
+        self.frames_resent += int(np.count_nonzero(keep))
+        self.send(self._lossy(codec.frames_to_bytes(frames[keep], codec.RX_DTYPE)))
+
+    def _lossy(self, buf):
+        # drop whole result frames, as a parity error would
+        if not self.frame_loss:
+            return buf
+        frames = codec.bytes_to_frames(buf)
+        keep = self.rng.random(len(frames)) >= self.frame_loss
+        self.frames_dropped += len(frames) - int(np.count_nonzero(keep))
+        return codec.frames_to_bytes(frames[keep], codec.RX_DTYPE)
+
+    def _fill(self, words):
+        if len(words) == 0:
+            return
+        if self.frame_loss:
+            keep = self.rng.random(len(words)) >= self.frame_loss
+            self.frames_dropped += len(words) - int(np.count_nonzero(keep))
+            words = words[keep]
+        self._store(words)
+
+    def _store(self, words):
+        N = self.N
+        msb, aw, x_ix, y_ix, data = codec.decode_frames(words)
+        valid = (msb == 0) & (x_ix < max(N, self.batch)) & (y_ix < N)
+        self.frames_rx += int(np.count_nonzero(valid))
+
+        w = valid & (aw == 1) & (x_ix < N)
+        if self.sparse:
+            # x = 2j + parity tag, the pair's other weight was dropped
+            self.weights[x_ix[w] ^ 1, y_ix[w]] = 0
+            self.weights[x_ix[w], y_ix[w]] = data[w]
+            self.weights_filled[x_ix[w] >> 1, y_ix[w]] = True
+        else:
+            self.weights[x_ix[w], y_ix[w]] = data[w]
+            self.weights_filled[x_ix[w], y_ix[w]] = True
+        a = valid & (aw == 0)
+        if self.batch:
+            a &= (x_ix < self.batch)
+            self.acts[x_ix[a], y_ix[a]] = data[a]
+            self.acts_filled[x_ix[a], y_ix[a]] = True
+        elif self.vector_mode:
+            self.acts[y_ix[a]] = data[a]
+            self.acts_filled[y_ix[a]] = True
+        else:
+            self.acts[x_ix[a], y_ix[a]] = data[a]
+            self.acts_filled[x_ix[a], y_ix[a]] = True
+
+        if self.weights_filled.all() and self.acts_filled.all():
+            self._start_compute()
+
+    def _start_compute(self):
+        if self.verb:
+            print("EMU: payload complete, sending 1C")
+        self.send(OK2)
+        self.weights_valid = True
+        self.result_bytes = self.compute()
+        self.state = COMPUTE
+        self.timer = time.monotonic() + self.compute_latency
+
+    def compute(self):
+        # returns the result frames, as the host expects them on the wire
+        N = self.N
+        if self.batch:
+            res = (self.acts @ self.weights) & ((1 << self.bit_width) - 1)
+            x_ix, y_ix = np.divmod(np.arange(self.batch*N), N)
+            frames = codec.encode_frames(0, 0, x_ix, y_ix, res[x_ix, y_ix])
+            return codec.frames_to_bytes(frames, codec.RX_DTYPE)
+        res = (self.weights.T @ self.acts) & ((1 << self.bit_width) - 1)
+        if self.vector_mode:
+            frames = codec.encode_frames(0, 0, 0, np.arange(N), res)
+        else:
+            y_ix, x_ix = np.divmod(np.arange(N*N), N)
+            frames = codec.encode_frames(0, 0, x_ix, y_ix, res[y_ix, x_ix])
+        return codec.frames_to_bytes(frames, codec.RX_DTYPE)
+
+    def _tick(self, now):
+        if self.timer is None or now < self.timer:
+            return
+        if self.state == COMPUTE:
+            self.state = TX_ALIGN
+            self.timer = now
+        if self.state == TX_ALIGN:
+            self.send(4*DEADBEEF_RX)
+            self.timer = now + self.align_interval
+        elif self.state == TX_RESULTS:
+            # don't pile up repeats if the host isn't reading
+            if not self.outbuf:
+                self.send(self._lossy(self.result_bytes))
+            self.timer = now + self.repeat_interval
+        else:
+            self.timer = None
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve the SA unit UART protocol on a pty")
+    parser.add_argument("--N", type=int, default=8)
+    parser.add_argument("--matrix", action="store_true", help="start in matrix (MMM) mode")
+    parser.add_argument("--bit-width", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.0, help="compute latency in seconds")
+    parser.add_argument("--baudrate", type=int, default=None, help="throttle to this baud rate")
+    parser.add_argument("--legacy", action="store_true", help="no driver extensions, like the plain RTL")
+    parser.add_argument("--frame-loss", type=float, default=0.0, help="fraction of data frames to drop")
+    parser.add_argument("--verb", action="store_true")
+    args = parser.parse_args()
+
+    emu = FPGAEmulator(N=args.N, vector_mode=0 if args.matrix else 1, bit_width=args.bit_width,
+                       compute_latency=args.latency, baudrate=args.baudrate,
+                       caps=0 if args.legacy else ALL_CAPS,
+                       frame_loss=args.frame_loss, verb=args.verb)
+    print("Serving on", emu.start())
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\n{emu.ops} ops served")
+    finally:
+        emu.stop()
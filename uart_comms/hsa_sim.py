@@ -0,0 +1,210 @@
+import numpy as np
+from sparse import pack_columns
+
+# Cycle-accurate model of the arrays in cpp_impl/include, vectorised: one
+# clock() advances every PE of the grid at once, and every PE of a stack of
+# independent problems along a leading batch axis, so thousands of N=32
+# runs are a few thousand array ops:
+#
+#   sim = Hsa(acts, weights, mvm=0, bits=16)   # acts/weights (B, N, N) or (N, N)
+#   sim.run()                                  # clock() until ready
+#   sim.result()                               # (B, N, N), acts @ weights mod 2^bits
+#
+# Arithmetic wraps at `bits` like mac_t_p<BitWidth> (unsigned bitfield), the
+# latches and enables follow the C++ classes:
+#
+#   Hsa    MMM  weights stationary, acts stream in from the left, row i
+#               starting at cycle i, psums flow down, column j of the result
+#               collects under the last row. 3N-2 cycles, acts @ weights.
+#               (MpuHsa is the same dataflow.)
+#          MVM  the vector (last column of acts, as in Hsa.hh) is broadcast,
+#               v[j] to column j in cycle j, psums flow right. N cycles,
+#               weights @ v. (VpuHsa is the same with the flow flipped.)
+#   SpVpu       column-packed weights (values + parity tags, see sparse.py),
+#               packed column j gets v[2j] and v[2j+1] in cycle j and each
+#               SpMac picks one by its tag. N/2 cycles, pruned weights @ v.
+#
+# One difference from Hsa.hh/MpuHsa.hh: there a row's activation queue is
+# shifted once per enabled PE of the row rather than once per cycle, which
+# feeds the wrong values from N=4 up. Here each row sees its column of acts
+# in order, which is what the hardware streams.
+#
+# unit_result() maps SAUnit's convention (the board returns weights.T @ acts)
+# onto these, for golden results against a board run.
+
+
+def _wrap(x, bits):
+    return np.asarray(x).astype(np.int64).astype(np.uint64) & np.uint64((1 << bits) - 1)
+
+
+def _batched(x, ndim):
+    # -> (array with a leading batch axis, whether one was added)
+    x = np.asarray(x)
+    if x.ndim == ndim:
+        return x[None], True
+    return x, False
+
+
+def cycles(N, mvm=0, sparse=0):
+    # clocks until ready
+    if sparse:
+        return N // 2
+    return N if mvm else 3*N - 2
+
+
+class Hsa:
+    def __init__(self, acts, weights, mvm=0, bits=16):
+        # MMM: acts (B, N, N). MVM: acts (B, N) or (B, N, N), then its last
+        # column is the vector. weights (B, N, N); batch axis optional
+        weights, self.single = _batched(weights, 2)
+        self.B, self.N, _ = weights.shape
+        self.bits = bits
+        self.mask = np.uint64((1 << bits) - 1)
+        self.weights = _wrap(weights, bits)
+        acts = np.asarray(acts)
+        if mvm:
+            if acts.ndim == weights.ndim - (1 if self.single else 0):
+                acts = acts[..., -1]
+            acts = acts.reshape(self.B, self.N)
+        else:
+            acts = acts.reshape(self.B, self.N, self.N)
+        self.acts = _wrap(acts, bits)
+        self.reset(mvm)
+
+    def reset(self, mvm=None):
+        if mvm is not None:
+            self.mvm = mvm
+        B, N = self.B, self.N
+        self.counter = 0
+        self.enabled = np.zeros((N, N), dtype=bool)
+        self.right_latches = np.zeros((B, N, N), dtype=np.uint64)
+        self.down_latches = np.zeros((B, N, N), dtype=np.uint64)
+        self.results = np.zeros((B, N, N), dtype=np.uint64)
+        ix = np.arange(N)
+        self.i_ix, self.j_ix = ix[:, None], ix[None, :]
+        if not self.mvm:
+            # stream[b, i, t] is what row i takes in at its t-th active cycle:
+            # column i of acts, last row first (acts_sram[i][N-1] after the
+            # constructor's transpose, then shifting right)
+            self.stream = self.acts.transpose(0, 2, 1)[:, :, ::-1]
+
+    def ready(self):
+        return self.counter >= cycles(self.N, self.mvm)
+
+    def clock(self):
+        N = self.N
+        c = self.counter
+        if self.mvm:
+            # column c gets v[c] broadcast, psum from its left neighbour.
+            # Only that column is enabled, so only it is worked out
+            self.enabled = np.broadcast_to(self.j_ix == c, (N, N))
+            if c < N:
+                cin = self.right_latches[:, :, c-1] if c else 0
+                psum = (self.acts[:, c:c+1] * self.weights[:, :, c] + cin) & self.mask
+                self.right_latches[:, :, c] = psum
+                self.down_latches[:, :, c] = psum
+        else:
+            # PE (i, j) works on the t = c-i-j th value of row i
+            t = c - self.i_ix - self.j_ix
+            enable = (t >= 0) & (t < N)
+            self.enabled = enable
+            a = np.empty_like(self.right_latches)
+            a[:, :, 0] = self.stream[:, np.arange(N), np.clip(c - np.arange(N), 0, N - 1)]
+            a[:, :, 1:] = self.right_latches[:, :, :-1]
+            cin = np.zeros_like(self.down_latches)
+            cin[:, 1:, :] = self.down_latches[:, :-1, :]
+
+            # WsMac: <a, a*w + cin>
+            psum = a * self.weights
+            psum += cin
+            psum &= self.mask
+            np.copyto(self.right_latches, a, where=enable)
+            np.copyto(self.down_latches, psum, where=enable)
+
+        # last row => output generated, shift the column down
+        last = self.enabled[N-1]
+        if last.any():
+            shifted = np.concatenate([self.down_latches[:, N-1:N, :], self.results[:, :-1, :]], axis=1)
+            self.results = np.where(last, shifted, self.results)
+        self.counter += 1
+
+    def run(self):
+        while not self.ready():
+            self.clock()
+        return self.result()
+
+    def result(self):
+        # MMM (B, N, N), MVM (B, N); no batch axis if none was given
+        res = self.right_latches[:, :, -1] if self.mvm else self.results
+        return res[0] if self.single else res
+
+
+class SpVpu:
+    def __init__(self, acts, values, tags, bits=16):
+        # acts (B, N), values/tags (B, N, N/2): row i holds the packed
+        # columns of output i (weights_sram / weight_tags_sram in SpVpu.hh)
+        values, self.single = _batched(values, 2)
+        self.B, self.N, self.PN = values.shape
+        self.bits = bits
+        self.mask = np.uint64((1 << bits) - 1)
+        self.values = _wrap(values, bits)
+        self.tags = np.asarray(tags).reshape(self.B, self.N, self.PN).astype(bool)
+        self.acts = _wrap(np.asarray(acts).reshape(self.B, 2*self.PN), bits)
+        self.reset()
+
+    @classmethod
+    def from_dense(cls, acts, W, bits=16):
+        # W (B, N, N) or (N, N), packed along its columns like the README
+        W, single = _batched(W, 2)
+        values, tags = pack_columns(np.moveaxis(W, -1, 0))     # (N/2, B, N)
+        values, tags = values.transpose(1, 2, 0), tags.transpose(1, 2, 0)
+        if single:
+            values, tags = values[0], tags[0]
+        return cls(acts, values, tags, bits)
+
+    def reset(self):
+        self.counter = 0
+        self.enabled = np.zeros((self.N, self.PN), dtype=bool)
+        self.right_latches = np.zeros((self.B, self.N, self.PN), dtype=np.uint64)
+        # SpMac double pump: a2 if the weight came from an odd column
+        a1 = self.acts[:, None, 0::2]
+        a2 = self.acts[:, None, 1::2]
+        self.selected = np.where(self.tags, a2, a1)
+
+    def ready(self):
+        return self.counter >= self.PN
+
+    def clock(self):
+        c = self.counter
+        # packed column c is enabled, psum from its left neighbour
+        self.enabled = np.broadcast_to(np.arange(self.PN)[None, :] == c, (self.N, self.PN))
+        if c < self.PN:
+            cin = self.right_latches[:, :, c-1] if c else 0
+            self.right_latches[:, :, c] = (self.selected[:, :, c] * self.values[:, :, c] + cin) & self.mask
+        self.counter += 1
+
+    def run(self):
+        while not self.ready():
+            self.clock()
+        return self.result()
+
+    def result(self):
+        res = self.right_latches[:, :, -1]
+        return res[0] if self.single else res
+
+
+def unit_result(acts, weights, vector_mode=1, sparse=0, bits=16):
+    # What a board returns for SAUnit.write_data(acts, weights, ...), i.e.
+    # weights.T @ acts mod 2^bits, worked out on the simulated array.
+    # Batch axis optional
+    weights = np.asarray(weights)
+    wT = np.swapaxes(weights, -1, -2)
+    if sparse:
+        if not vector_mode:
+            raise ValueError("The sparse unit only does MVM")
+        return SpVpu.from_dense(acts, wT, bits).run().astype(np.int64)
+    if vector_mode:
+        return Hsa(acts, wT, mvm=1, bits=bits).run().astype(np.int64)
+    # weights.T @ acts = (acts.T @ weights).T
+    res = Hsa(np.swapaxes(np.asarray(acts), -1, -2), weights, mvm=0, bits=bits).run()
+    return np.swapaxes(res, -1, -2).astype(np.int64)
@@ -0,0 +1,188 @@
+import json
+import math
+import sys
+import threading
+import time
+from collections import defaultdict
+
+# Lightweight counters and latency histograms for the driver hot paths.
+# SAUnit holds NULL_INSTRUMENT by default, whose counters and phases do
+# nothing, so the cost when disabled is one no-op call per event.
+#
+#   instr = Instrument(sinks=[JsonLinesSink("trace.jsonl")])
+#   port = SAUnit("COM35", instrument=instr)
+#   ...
+#   print(instr.report())
+#
+# verb=1 on SAUnit calls turns on per-word protocol trace messages, which
+# go to the sinks like everything else (log events); PrintSink puts them
+# on the console the way the old verb prints did:
+#
+#   port = SAUnit("COM35", instrument=Instrument(sinks=[PrintSink()]))
+#   port.rand_test(verb=1)
+#
+# Without an instrument they still reach the console: NULL_INSTRUMENT
+# hands log events (only ever made with verb set) to a PrintSink.
+
+
+class NullInstrument:
+    enabled = False
+
+    def count(self, name, n=1):
+        pass
+
+    def observe(self, name, seconds):
+        pass
+
+    def log(self, *parts):
+        _CONSOLE.emit({"log": " ".join(str(p) for p in parts)})
+
+    def flush(self):
+        pass
+
+
+NULL_INSTRUMENT = NullInstrument()
+
+
+class Histogram:
+    # Power of two buckets over microseconds: bucket i holds [2^(i-1), 2^i) us
+
+    NBUCKETS = 32
+
+    def __init__(self):
+        self.buckets = [0] * self.NBUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = int(seconds * 1e6)
+        self.buckets[min(us.bit_length(), self.NBUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        # upper edge of the bucket holding the q-th percentile, in seconds
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min((1 << i) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1e3 if self.count else 0.0,
+            "min_ms": self.min * 1e3 if self.count else 0.0,
+            "max_ms": self.max * 1e3,
+            "p50_ms": self.percentile(50) * 1e3,
+            "p99_ms": self.percentile(99) * 1e3,
+        }
+
+
+class Instrument:
+    enabled = True
+
+    def __init__(self, sinks=(), name=None):
+        self.name = name
+        self.sinks = list(sinks)
+        self.counters = defaultdict(int)
+        self.histograms = defaultdict(Histogram)
+        self.lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+        for sink in self.sinks:
+            sink.emit({"t": time.time(), "unit": self.name, "counter": name, "n": n})
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self.histograms[name].add(seconds)
+        for sink in self.sinks:
+            sink.emit({"t": time.time(), "unit": self.name, "phase": name, "s": seconds})
+
+    def log(self, *parts):
+        # joined like print's arguments
+        message = " ".join(str(p) for p in parts)
+        for sink in self.sinks:
+            sink.emit({"t": time.time(), "unit": self.name, "log": message})
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "unit": self.name,
+                "counters": dict(self.counters),
+                "phases": {k: h.summary() for k, h in self.histograms.items()},
+            }
+
+    def report(self):
+        snap = self.snapshot()
+        lines = [f"{k}: {v}" for k, v in sorted(snap["counters"].items())]
+        for k, s in sorted(snap["phases"].items()):
+            lines.append(f"{k}: n={s['count']} mean={s['mean_ms']:.3f}ms "
+                         f"p50<={s['p50_ms']:.3f}ms p99<={s['p99_ms']:.3f}ms max={s['max_ms']:.3f}ms")
+        return "\n".join(lines)
+
+    def flush(self):
+        snap = self.snapshot()
+        for sink in self.sinks:
+            sink.emit({"t": time.time(), "snapshot": snap})
+            sink.flush()
+
+
+class MemorySink:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event):
+        self.events.append(event)
+
+    def flush(self):
+        pass
+
+
+class JsonLinesSink:
+    def __init__(self, path):
+        self.f = open(path, "a")
+        self.lock = threading.Lock()
+
+    def emit(self, event):
+        line = json.dumps(event)
+        with self.lock:
+            self.f.write(line + "\n")
+
+    def flush(self):
+        with self.lock:
+            self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class PrintSink:
+    # log events to a stream, counters and phases only with everything=True
+
+    def __init__(self, stream=None, everything=False):
+        self.stream = stream        # None => sys.stdout at the time
+        self.everything = everything
+
+    def emit(self, event):
+        if "log" in event:
+            prefix = f"[{event['unit']}] " if event.get("unit") else ""
+            print(prefix + event["log"], file=self.stream)
+        elif self.everything:
+            print(json.dumps(event), file=self.stream)
+
+    def flush(self):
+        (sys.stdout if self.stream is None else self.stream).flush()
+
+
+_CONSOLE = PrintSink()
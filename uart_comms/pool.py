@@ -0,0 +1,193 @@
+import queue
+import threading
+import time
+from utility import SAUnit
+from tiling import TiledEngine
+
+# Several boards, each on its own port. One worker thread per board pulls
+# independent tasks from a shared queue, so a slow board simply takes
+# fewer tasks. A task whose write fails after max_resends is handed back
+# to the queue and preferentially picked up by a board that has not tried
+# it yet. Results come back in submission order.
+
+
+class BoardStats:
+    def __init__(self, port):
+        self.port = port
+        self.tasks = 0
+        self.failures = 0
+        self.busy_time = 0.0
+        self.device_time = 0.0
+        self.retired = False
+
+    def utilisation(self, wall_time):
+        return self.busy_time / wall_time if wall_time else 0.0
+
+    def __str__(self):
+        return (f"{self.port}: {self.tasks} tasks, {self.failures} failures, "
+                f"busy: {self.busy_time:.3f}s{' (retired)' if self.retired else ''}")
+
+
+class _Task:
+    def __init__(self, ix, item):
+        self.ix = ix
+        self.item = item
+        self.tried = set()
+        self.attempts = 0
+
+
+class DevicePool:
+    def __init__(self, ports=None, units=None, N=8, baudrate=921600, max_attempts=None,
+                 retire_after=3, verb=0):
+        if units is None:
+            units = [SAUnit(port, N=N, baudrate=baudrate) for port in ports]
+        if not units:
+            raise ValueError("DevicePool needs at least one unit")
+        self.units = list(units)
+        self.N = self.units[0].N
+        # by default every board gets a go at a failing task
+        self.max_attempts = len(self.units) + 1 if max_attempts is None else max_attempts
+        self.retire_after = retire_after
+        self.verb = verb
+        self.stats = [BoardStats(unit.port) for unit in self.units]
+        self.wall_time = 0.0
+        self.lock = threading.Lock()
+
+    def run(self, items, attempt):
+        # attempt(unit, item) -> (ok, result, device_time)
+        tasks = queue.Queue()
+        for ix, item in enumerate(items):
+            tasks.put(_Task(ix, item))
+        results = [None] * len(items)
+        remaining = [len(items)]
+        done = threading.Event()
+        errors = []
+        # a board retired in an earlier run stays out
+        alive = {b for b, s in enumerate(self.stats) if not s.retired}
+        if not items:
+            return results
+        if not alive:
+            raise Exception("All boards in the pool have been retired")
+
+        def finish(task, result=None, error=None):
+            with self.lock:
+                if error is not None:
+                    errors.append(error)
+                    done.set()
+                results[task.ix] = result
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    done.set()
+
+        def worker(b):
+            unit = self.units[b]
+            stats = self.stats[b]
+            consecutive = 0
+            while not done.is_set():
+                try:
+                    task = tasks.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+
+                with self.lock:
+                    others = alive - task.tried - {b}
+                if b in task.tried and others:
+                    # leave it for a board that hasn't failed it yet
+                    tasks.put(task)
+                    time.sleep(0.001)
+                    continue
+
+                busy_start = time.perf_counter()
+                try:
+                    ok, result, device_time = attempt(unit, task.item)
+                except BaseException as e:
+                    finish(task, error=e)
+                    return
+                busy = time.perf_counter() - busy_start
+
+                with self.lock:
+                    stats.busy_time += busy
+                    if ok:
+                        stats.tasks += 1
+                        stats.device_time += device_time
+                    else:
+                        stats.failures += 1
+
+                if ok:
+                    consecutive = 0
+                    finish(task, result)
+                    continue
+
+                if self.verb:
+                    print(f"Task {task.ix} failed on {unit.port}, requeueing")
+                consecutive += 1
+                task.tried.add(b)
+                task.attempts += 1
+                unit.reset(fpga=True)
+
+                if task.attempts >= self.max_attempts:
+                    # fails the whole run, done is set and every worker stops
+                    finish(task, error=Exception(f"Task {task.ix} failed on {task.attempts} attempts"))
+                    continue
+                tasks.put(task)
+
+                if consecutive >= self.retire_after:
+                    with self.lock:
+                        alive.discard(b)
+                        stats.retired = True
+                        if not alive:
+                            errors.append(Exception("All boards in the pool have been retired"))
+                            done.set()
+                    if self.verb:
+                        print(f"Retiring {unit.port} after {consecutive} consecutive failures")
+                    return
+
+        wall_start = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(b,), daemon=True) for b in sorted(alive)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.wall_time = time.perf_counter() - wall_start
+
+        if errors:
+            raise errors[0]
+        return results
+
+    def utilisation(self):
+        return [s.utilisation(self.wall_time) for s in self.stats]
+
+    def close(self):
+        for unit in self.units:
+            unit.close()
+
+
+class PooledEngine(TiledEngine):
+    # TiledEngine whose tiles are sharded over a DevicePool
+
+    def __init__(self, pool, **kwargs):
+        super().__init__(pool.units[0], **kwargs)
+        self.pool = pool
+
+    def run(self, jobs, out, vector_mode):
+        def attempt(unit, job):
+            _, weights, acts = job
+            weight_data, act_data = self.pack_tile(weights, acts, vector_mode, unit)
+            succ, start_time = unit.write_payload(weight_data, act_data,
+                                                  verb=self.verb, max_resends=self.max_resends)
+            if not succ:
+                return (False, None, 0.0)
+            result, end_time = unit.read_data(vector_mode=vector_mode, verb=self.verb, bulk=self.bulk)
+            return (True, self.decode_result(result), end_time - start_time)
+
+        before = [(s.tasks, s.failures, s.busy_time, s.device_time) for s in self.pool.stats]
+        results = self.pool.run(jobs, attempt)
+        for (out_ix, _, _), result in zip(jobs, results):
+            out[out_ix] += result
+
+        for s, (tasks, failures, busy, device) in zip(self.pool.stats, before):
+            self.stats.tiles += s.tasks - tasks
+            self.stats.failures += s.failures - failures
+            self.stats.device_time += s.device_time - device
+            # boards run concurrently, the busiest one bounds the link time
+            self.stats.link_time = max(self.stats.link_time, s.busy_time - busy)
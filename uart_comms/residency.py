@@ -0,0 +1,77 @@
+import hashlib
+import threading
+
+# Host-side record of which weight tile each board currently holds, keyed
+# by a hash of the packed weight frames. In decode-style MVM the same tile
+# meets thousands of activation vectors, and at N=8 the weights are ~90% of
+# the payload, so on a hit SAUnit sends MAGIC_ACTS_ONLY and the acts only.
+# Boards must advertise CAP_RESIDENT (see codec.CAPS_QUERY); one cache can
+# be shared by every unit of a DevicePool.
+#
+#   cache = ResidencyCache()
+#   port = SAUnit("COM35", residency=cache)
+#   ...
+#   print(cache)
+
+
+class ResidencyCache:
+    def __init__(self):
+        self.resident = {}      # port -> digest of the weights it holds
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0          # hits the board turned down (WEIGHTS_STALE)
+        self.bytes_saved = 0
+
+    @staticmethod
+    def key(weight_data):
+        return hashlib.blake2b(weight_data, digest_size=16).digest()
+
+    def lookup(self, port, key, size=0):
+        with self.lock:
+            if self.resident.get(port) == key:
+                self.hits += 1
+                self.bytes_saved += size
+                return True
+            self.misses += 1
+            return False
+
+    def store(self, port, key):
+        with self.lock:
+            self.resident[port] = key
+
+    def invalidate(self, port=None):
+        with self.lock:
+            if port is None:
+                self.resident.clear()
+            else:
+                self.resident.pop(port, None)
+
+    def reject(self, port, size=0):
+        # board had lost the weights after all, the hit becomes a miss
+        with self.lock:
+            self.resident.pop(port, None)
+            self.stale += 1
+            self.hits -= 1
+            self.misses += 1
+            self.bytes_saved -= size
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": self.hit_rate(),
+                "bytes_saved": self.bytes_saved,
+                "resident": len(self.resident),
+            }
+
+    def __str__(self):
+        s = self.stats()
+        return (f"{s['hits']} hits, {s['misses']} misses ({100*s['hit_rate']:.1f}% hit rate), "
+                f"{s['stale']} stale, {s['bytes_saved']} bytes saved")
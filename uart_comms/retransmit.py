@@ -0,0 +1,76 @@
+import numpy as np
+import codec
+
+# Selective repeat over the UART link, for boards with CAP_NACK (see codec).
+# Instead of resending a whole payload after a fixed 100 ms, SAUnit asks the
+# board which frames it is missing and resends just those, and asks for just
+# the missing result cells instead of waiting for the next full repeat. The
+# timeouts come from a smoothed round trip estimate, as in TCP.
+
+
+class RttEstimator:
+    # Jacobson/Karels (RFC 6298) with exponential backoff on timeouts
+
+    def __init__(self, initial=0.1, min_rto=0.02, max_rto=1.0):
+        self.initial = initial
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self.backoff = 1
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75*self.rttvar + 0.25*abs(self.srtt - rtt)
+            self.srtt = 0.875*self.srtt + 0.125*rtt
+        self.backoff = 1
+
+    def timeout(self):
+        self.backoff = min(2*self.backoff, 64)
+
+    def rto(self):
+        base = self.initial if self.srtt is None else self.srtt + 4*self.rttvar
+        return min(self.max_rto, max(self.min_rto, base) * self.backoff)
+
+
+def frame_keys(words, sparse=0):
+    # (A/W, x, y) of each frame as one int. Packed weights are tracked per
+    # pair on the board, so their parity bit is dropped
+    _, aw, xix, yix, _ = codec.decode_frames(words)
+    if sparse:
+        xix = np.where(aw == 1, xix & 0x7E, xix)
+    return (aw.astype(np.int64) << 14) | (xix.astype(np.int64) << 7) | yix
+
+
+def _missing(words, missing, sparse):
+    return np.isin(frame_keys(words, sparse), frame_keys(missing, sparse))
+
+
+def missing_mask(payload, missing, sparse=0):
+    # which frames of payload the board reported missing
+    return _missing(codec.bytes_to_frames(payload, codec.TX_DTYPE), missing, sparse)
+
+
+def select_frames(payload, missing, sparse=0):
+    # those frames, ready to resend (the payload decoded once)
+    words = codec.bytes_to_frames(payload, codec.TX_DTYPE)
+    return codec.frames_to_bytes(words[_missing(words, missing, sparse)])
+
+
+def missing_report(aw, xix, yix):
+    # board side answer to MISSING_QUERY
+    frames = codec.encode_frames(1, aw, xix, yix, 0)
+    count = len(frames).to_bytes(2, byteorder='big')
+    return codec.MISSING_REPLY + count + codec.frames_to_bytes(frames, codec.RX_DTYPE)
+
+
+def resend_requests(xix, yix):
+    # host side, one request per missing result cell
+    return codec.frames_to_bytes(codec.encode_frames(1, 1, xix, yix, codec.RESEND_DATA))
+
+
+def is_resend_request(word):
+    return (word >> 30) == 3 and (word & 0xFFFF) == codec.RESEND_DATA
@@ -0,0 +1,104 @@
+import os
+import serial
+
+# Receive buffer for SAUnit.read_data. Bytes are read in whatever chunks
+# the port has into one preallocated bytearray, the DEADBEEF sync is found
+# at any byte offset with bytearray.find over the unconsumed region, and
+# whole frames are handed out as memoryviews of the buffer, so nothing is
+# allocated per word:
+#
+#   rx = RxBuffer(ser)
+#   rx.fill(4)                      # what's waiting, at least 4 bytes
+#   rx.sync(codec.DEADBEEF_RX)      # -> bytes skipped before it, or None
+#   codec.bytes_to_frames(rx.frames())
+#
+# The buffer is linear rather than wrapping: when a read would run off the
+# end the few unconsumed bytes (a partial word at most, in practice) move
+# to the front, so a frame never straddles the end. A view from frames()
+# is only good until the next fill().
+#
+# pyserial's readinto() is read() plus a copy, so on POSIX ports the bytes
+# already waiting are read straight into the buffer with os.readv.
+
+RX_SIZE = 1 << 16
+
+
+class RxBuffer:
+    def __init__(self, ser, size=RX_SIZE):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0      # first unconsumed byte
+        self.end = 0        # one past the last byte read
+        self.attach(ser)
+
+    def attach(self, ser):
+        # (re)point at a port, e.g. a wrapper around the one we had
+        self.ser = ser
+        self.fd = None
+        if hasattr(os, 'readv') and type(ser).readinto is serial.SerialBase.readinto:
+            try:
+                self.fd = ser.fileno()
+            except (AttributeError, OSError, ValueError):
+                self.fd = None
+
+    def __len__(self):
+        return self.end - self.start
+
+    def clear(self):
+        self.start = self.end = 0
+
+    def _compact(self):
+        n = self.end - self.start
+        if self.start:
+            self.buf[:n] = bytes(self.view[self.start:self.end])
+        self.start, self.end = 0, n
+
+    def fill(self, want=4):
+        # read everything waiting, blocking (up to the port timeout) until
+        # `want` bytes are buffered -> bytes read
+        waiting = self.ser.in_waiting
+        n = max(waiting, want - len(self))
+        if n <= 0:
+            return 0
+        if self.end + n > len(self.buf):
+            self._compact()
+            n = min(n, len(self.buf) - self.end)
+            if n == 0:
+                raise Exception(f"Receive buffer full ({len(self.buf)} bytes unconsumed)")
+        dest = self.view[self.end:self.end + n]
+        if self.fd is not None and n <= waiting:
+            try:
+                got = os.readv(self.fd, [dest])
+            except BlockingIOError:
+                got = 0
+        else:
+            got = self.ser.readinto(dest)
+        self.end += got
+        return got
+
+    def find(self, pattern):
+        # offset of pattern from the first unconsumed byte, -1 if not in yet
+        at = self.buf.find(pattern, self.start, self.end)
+        return at - self.start if at >= 0 else -1
+
+    def consume(self, n):
+        self.start = min(self.start + n, self.end)
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def sync(self, pattern):
+        # drop everything up to and including pattern -> bytes skipped
+        # before it, or None (keeping a possible partial pattern at the end)
+        at = self.find(pattern)
+        if at < 0:
+            self.consume(max(0, len(self) - len(pattern) + 1))
+            return None
+        self.consume(at + len(pattern))
+        return at
+
+    def frames(self, size=4):
+        # every whole frame buffered, as a view, consumed
+        n = len(self) - len(self) % size
+        view = self.view[self.start:self.start + n]
+        self.consume(n)
+        return view
@@ -0,0 +1,178 @@
+import threading
+import time
+from collections import deque
+from costmodel import CostModel, BITS_PER_BYTE
+
+# Mode-aware scheduling in front of one SAUnit. switch_mode resets the
+# board's FSM (and drops resident weights), so a mixed prefill (MMM) +
+# decode (MVM) stream sent in arrival order pays a switch and a realign
+# almost every op. Here ops queue up per mode and the unit stays in its
+# current mode until either that queue runs dry or the oldest op of the
+# other mode would miss its latency budget, using the cost model for the
+# time the next op and the switch will take:
+#
+#   sched = ModeScheduler(unit, budget=0.05)
+#   a = sched.submit(acts, weights, vector_mode=0)
+#   b = sched.submit(vec, weights, vector_mode=1)
+#   sched.run()                     # -> results in submission order
+#   a.result, sched.stats           # switches made / avoided
+#
+# budget is the longest an op should wait between submit and being sent.
+# Not thread safe beyond submit(), one thread should call step()/run().
+
+
+class SchedStats:
+    def __init__(self):
+        self.ops = {0: 0, 1: 0}         # by vector_mode
+        self.switches = 0
+        self.naive_switches = 0         # what arrival order would have cost
+        self.budget_misses = 0
+        self.failures = 0
+        self.switch_time = 0.0
+        self.wait_time = 0.0
+        self.switch_cost = 0.0          # model's estimate per switch
+
+    def avoided(self):
+        return max(0, self.naive_switches - self.switches)
+
+    def saved_s(self):
+        return self.avoided() * self.switch_cost
+
+    def __str__(self):
+        total = self.ops[0] + self.ops[1]
+        return (f"{total} ops ({self.ops[0]} MMM, {self.ops[1]} MVM), {self.switches} switches, "
+                f"{self.avoided()} avoided (~{1e3*self.saved_s():.1f} ms), "
+                f"{self.budget_misses} over budget, {self.failures} failed sends, "
+                f"mean wait {1e3*self.wait_time/total if total else 0.0:.2f} ms")
+
+
+class Op:
+    def __init__(self, ix, acts, weights, vector_mode, sparse):
+        self.ix = ix
+        self.acts = acts
+        self.weights = weights
+        self.vector_mode = vector_mode
+        self.sparse = sparse
+        self.submitted = time.perf_counter()
+        self.result = None
+        self.done = False
+
+
+class ModeScheduler:
+    def __init__(self, unit, model=None, budget=0.05, mode=None, bulk=1, max_resends=5,
+                 max_retries=3, verb=0):
+        self.unit = unit
+        self.model = CostModel(N=unit.N, baudrate=unit.baudrate) if model is None else model
+        self.budget = budget
+        self.mode = mode            # None => unknown, the first op switches
+        self.bulk = bulk
+        self.max_resends = max_resends
+        self.max_retries = max_retries
+        self.verb = verb
+        self.queues = {0: deque(), 1: deque()}
+        self.ops = []
+        self.last_submitted = mode
+        self.lock = threading.Lock()
+        self.stats = SchedStats()
+        self.stats.switch_cost = self.switch_cost()
+
+    def switch_cost(self):
+        # control word, a realign and, with a residency cache, resending
+        # the weights the switch threw away
+        model = self.model
+        cost = model.host_overhead + 4 * BITS_PER_BYTE / model.baudrate
+        if getattr(self.unit, 'residency', None) is not None:
+            cost += self.unit.N**2 * 4 * BITS_PER_BYTE * model.link_factor / model.baudrate
+        return cost
+
+    def op_cost(self, op):
+        mode = 'mmm' if not op.vector_mode else 'sparse' if op.sparse else 'mvm'
+        return self.model.estimate(mode)["latency_s"]
+
+    def submit(self, acts, weights, vector_mode=1, sparse=0):
+        if sparse and not vector_mode:
+            raise ValueError("The sparse unit only does MVM")
+        with self.lock:
+            op = Op(len(self.ops), acts, weights, vector_mode, sparse)
+            self.ops.append(op)
+            self.queues[vector_mode].append(op)
+            if vector_mode != self.last_submitted:
+                self.stats.naive_switches += 1
+                self.last_submitted = vector_mode
+        return op
+
+    def pending(self):
+        return len(self.queues[0]) + len(self.queues[1])
+
+    def next_mode(self, now=None):
+        # stay unless the current queue is empty or the other mode's oldest
+        # op can't wait for one more op here plus the switch. Only an op
+        # that arrived before the current head can force a switch, so when
+        # everything is late this falls back to arrival order rather than
+        # flipping every op
+        now = time.perf_counter() if now is None else now
+        with self.lock:
+            if self.mode is None or not self.queues[self.mode]:
+                for mode in (self.mode, 0, 1):
+                    if mode is not None and self.queues[mode]:
+                        return mode
+                return None
+            other = self.queues[1 - self.mode]
+            if not other:
+                return self.mode
+            head = self.queues[self.mode][0]
+            if other[0].ix > head.ix:
+                return self.mode
+            waited = now - other[0].submitted
+            ahead = self.op_cost(head) + self.switch_cost()
+            return 1 - self.mode if waited + ahead > self.budget else self.mode
+
+    def step(self):
+        # run one op, False once nothing is queued
+        mode = self.next_mode()
+        if mode is None:
+            return False
+        if mode != self.mode:
+            start = time.perf_counter()
+            # no reset() after: dropping the output buffer can lose the
+            # switch word itself, and the board resets its FSM anyway
+            self.unit.switch_mode(mode)
+            self.mode = mode
+            self.stats.switches += 1
+            self.stats.switch_time += time.perf_counter() - start
+            if self.verb:
+                print(f"[{self.unit.port}] switched to {'MVM' if mode else 'MMM'}")
+        with self.lock:
+            op = self.queues[mode].popleft()
+
+        waited = time.perf_counter() - op.submitted
+        self.stats.wait_time += waited
+        if waited > self.budget:
+            self.stats.budget_misses += 1
+        op.result = self._send(op)
+        op.done = True
+        self.stats.ops[mode] += 1
+        return True
+
+    def _send(self, op):
+        unit = self.unit
+        for _ in range(self.max_retries):
+            succ, _ = unit.write_data(op.acts, op.weights, vector_mode=op.vector_mode, verb=self.verb,
+                                      max_resends=self.max_resends, sparse=op.sparse)
+            if not succ:
+                self.stats.failures += 1
+                unit.reset(fpga=True)   # keeps the mode
+                continue
+            result, _ = unit.read_data(vector_mode=op.vector_mode, verb=self.verb, bulk=self.bulk)
+            return result
+        raise Exception(f"Op {op.ix} failed after {self.max_retries} attempts on port {unit.port}")
+
+    def run(self):
+        # drain the queues, results in submission order
+        while self.step():
+            pass
+        with self.lock:
+            ops, self.ops = self.ops, []
+        if self.verb:
+            print(self.stats)
+        return [op.result for op in ops]
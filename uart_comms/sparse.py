@@ -0,0 +1,77 @@
+import numpy as np
+import codec
+
+# Host side of the adjacent-column packing from the README ("Sparsity:
+# Column packing and tagging"). Each pair of adjacent reduction indices
+# (2j, 2j+1) keeps only its larger weight plus a one bit parity tag, so an
+# N x N tile goes over the wire as N x N/2 frames.
+#
+# Same orientation as SAUnit.write_data: the device computes weights.T @ acts,
+# so the reduction index is the first axis of `weights` and the pairs run
+# along it (README's W is weights.T, where they are adjacent columns).
+#
+# A packed frame reuses the dense layout, the x field carries the original
+# index 2j + tag, so the device derives j = x >> 1 and tag = x & 1:
+#
+#   values, tags = pack_columns(W)              # both (N/2, N)
+#   weight_data = pack_sparse_matrix(W)         # N*N/2 frames
+#   port.write_data(acts, W, sparse=1)          # same thing through SAUnit
+
+
+def pack_columns(mat):
+    # -> (values, tags), both (K/2, M). Compared by magnitude so a pruned
+    # signed matrix keeps its nonzero, ties go to the even index like the
+    # README (mymatmul in accuracy_computation sends them odd)
+    W = np.asarray(mat)
+    K = W.shape[0]
+    if K % 2:
+        raise ValueError(f"Need an even number of rows to pack, got {K}")
+    pairs = W.reshape(K//2, 2, *W.shape[1:])
+    tags = (np.abs(pairs[:, 1]) > np.abs(pairs[:, 0])).astype(np.uint8)
+    values = np.where(tags, pairs[:, 1], pairs[:, 0])
+    return values, tags
+
+
+def unpack_columns(values, tags):
+    # dense equivalent of a packed tile, the dropped weights become 0
+    values = np.asarray(values)
+    tags = np.asarray(tags).astype(bool)
+    dense = np.zeros((2*values.shape[0],) + values.shape[1:], dtype=values.dtype)
+    dense[0::2] = np.where(tags, 0, values)
+    dense[1::2] = np.where(tags, values, 0)
+    return dense
+
+
+def prune_columns(mat):
+    # what the sparse unit actually multiplies with
+    return unpack_columns(*pack_columns(mat))
+
+
+def sparse_frames(values, tags):
+    # y outer, j inner, like codec.matrix_frames
+    values = np.asarray(values)
+    PN, M = values.shape
+    y_ix, j_ix = np.divmod(np.arange(PN*M), PN)
+    x_ix = 2*j_ix + np.asarray(tags)[j_ix, y_ix]
+    return codec.encode_frames(0, 1, x_ix, y_ix, values[j_ix, y_ix])
+
+
+def pack_sparse_matrix(mat):
+    return codec.frames_to_bytes(sparse_frames(*pack_columns(mat)))
+
+
+def unpack_sparse_matrix(buf, N):
+    # -> (values, tags) from packed weight frames, out of range frames dropped
+    msb, aw, x_ix, y_ix, data = codec.decode_frames(codec.bytes_to_frames(buf, codec.TX_DTYPE))
+    valid = (msb == 0) & (aw == 1) & (x_ix < N) & (y_ix < N)
+    values = np.zeros((N//2, N), dtype=np.int64)
+    tags = np.zeros((N//2, N), dtype=np.uint8)
+    values[x_ix[valid] >> 1, y_ix[valid]] = data[valid]
+    tags[x_ix[valid] >> 1, y_ix[valid]] = x_ix[valid] & 1
+    return values, tags
+
+
+def densify_payload(buf, N):
+    # packed weight frames -> dense frames of the pruned tile, for boards
+    # without CAP_SPARSE (same result, twice the bytes)
+    return codec.pack_matrix(unpack_columns(*unpack_sparse_matrix(buf, N)))
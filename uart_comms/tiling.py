@@ -0,0 +1,153 @@
+import time
+import numpy as np
+import codec
+
+# Host side tiling for problems larger than the N x N systolic array.
+#
+# The unit computes result = weights.T @ acts on N x N operands, so for
+# Y = W @ X we send weights = W[i, k].T and acts = X[k, j] and add the
+# (16 bit, wrapped) partial result into Y[i, j] with 64 bit integers.
+#
+# The board must already be in the right mode (see SAUnit.switch_mode),
+# same as for rand_test.
+
+
+class TileStats:
+    def __init__(self):
+        self.tiles = 0
+        self.failures = 0
+        self.device_time = 0.0  # payload ack -> first result word, as rand_test's fpga_delta
+        self.link_time = 0.0    # total time spent inside write_data/read_data
+        self.host_time = 0.0    # padding, slicing, accumulation (wall - link)
+        self.wall_time = 0.0
+
+    def tiles_per_sec(self):
+        return self.tiles / self.wall_time if self.wall_time else 0.0
+
+    def __str__(self):
+        return (f"{self.tiles} tiles ({self.failures} failed sends), "
+                f"wall: {self.wall_time:.3f}s, link: {self.link_time:.3f}s, "
+                f"device: {self.device_time:.5f}s, host: {self.host_time:.3f}s, "
+                f"{self.tiles_per_sec():.1f} tiles/s")
+
+
+class TiledEngine:
+    def __init__(self, unit, bulk=1, signed=0, max_resends=5, max_retries=3, verb=0):
+        self.unit = unit
+        self.N = unit.N
+        self.bulk = bulk
+        self.signed = signed
+        self.max_resends = max_resends
+        self.max_retries = max_retries
+        self.verb = verb
+        self.stats = TileStats()
+
+    def gemm(self, W, X):
+        # (M, K) x (K, P) -> (M, P)
+        W = np.asarray(W)
+        X = np.asarray(X)
+        if W.ndim != 2 or X.ndim != 2 or W.shape[1] != X.shape[0]:
+            raise ValueError(f"Cannot multiply shapes {W.shape} and {X.shape}")
+        return self._run_problem(W, X, vector_mode=0)
+
+    def gemv(self, W, x):
+        # (M, K) x (K,) -> (M,)
+        W = np.asarray(W)
+        x = np.asarray(x)
+        if W.ndim != 2 or x.ndim != 1 or W.shape[1] != x.shape[0]:
+            raise ValueError(f"Cannot multiply shapes {W.shape} and {x.shape}")
+        return self._run_problem(W, x, vector_mode=1)
+
+    def _run_problem(self, W, X, vector_mode):
+        self.stats = TileStats()
+        wall_start = time.perf_counter()
+
+        out, jobs = self.tile_jobs(W, X, vector_mode)
+        self.run(jobs, out, vector_mode)
+
+        M = W.shape[0]
+        out = out[:M] if vector_mode else out[:M, :X.shape[1]]
+        self.stats.wall_time = time.perf_counter() - wall_start
+        self.stats.host_time = self.stats.wall_time - self.stats.link_time
+        if self.verb:
+            print(self.stats)
+        return out
+
+    def tile_jobs(self, W, X, vector_mode):
+        # Pad to multiples of N and return the (padded) output plus a list
+        # of (out_index, weights, acts) jobs. k is iterated before j so the
+        # same weight tile is used by consecutive jobs.
+        N = self.N
+        Mt = -(-W.shape[0] // N)
+        Kt = -(-W.shape[1] // N)
+        Wp = np.zeros((Mt*N, Kt*N), dtype=np.int64)
+        Wp[:W.shape[0], :W.shape[1]] = W
+
+        if vector_mode:
+            Xp = np.zeros(Kt*N, dtype=np.int64)
+            Xp[:X.shape[0]] = X
+            out = np.zeros(Mt*N, dtype=np.int64)
+        else:
+            Pt = -(-X.shape[1] // N)
+            Xp = np.zeros((Kt*N, Pt*N), dtype=np.int64)
+            Xp[:X.shape[0], :X.shape[1]] = X
+            out = np.zeros((Mt*N, Pt*N), dtype=np.int64)
+
+        jobs = []
+        for i in range(Mt):
+            rows = slice(i*N, (i+1)*N)
+            for k in range(Kt):
+                red = slice(k*N, (k+1)*N)
+                weights = Wp[rows, red].T
+                if vector_mode:
+                    jobs.append(((rows,), weights, Xp[red]))
+                else:
+                    for j in range(Pt):
+                        cols = slice(j*N, (j+1)*N)
+                        jobs.append(((rows, cols), weights, Xp[red, cols]))
+        return out, jobs
+
+    def run(self, jobs, out, vector_mode):
+        # Sequential reference loop, one tile at a time
+        for out_ix, weights, acts in jobs:
+            out[out_ix] += self.run_tile(weights, acts, vector_mode)
+
+    def run_tile(self, weights, acts, vector_mode, unit=None):
+        unit = self.unit if unit is None else unit
+        payload = self.pack_tile(weights, acts, vector_mode, unit)
+        return self.decode_result(self.send_tile(payload, vector_mode, unit))
+
+    def pack_tile(self, weights, acts, vector_mode, unit=None):
+        unit = self.unit if unit is None else unit
+        weight_data = unit.pack_matrix(weights)
+        if vector_mode:
+            act_data = unit.pack_vector(acts)
+        else:
+            act_data = unit.pack_matrix(acts, is_weights=0)
+        return (weight_data, act_data)
+
+    def send_tile(self, payload, vector_mode, unit=None):
+        # Push a packed tile through the unit, returns the raw result
+        unit = self.unit if unit is None else unit
+        weight_data, act_data = payload
+        for _ in range(self.max_retries):
+            link_start = time.perf_counter()
+            succ, start_time = unit.write_payload(weight_data, act_data,
+                                                  verb=self.verb, max_resends=self.max_resends)
+            if not succ:
+                self.stats.link_time += time.perf_counter() - link_start
+                self.stats.failures += 1
+                unit.reset(fpga=True)
+                continue
+            result, end_time = unit.read_data(vector_mode=vector_mode, verb=self.verb, bulk=self.bulk)
+            self.stats.link_time += time.perf_counter() - link_start
+            self.stats.device_time += end_time - start_time
+            self.stats.tiles += 1
+            return result
+        raise Exception(f"Tile failed after {self.max_retries} attempts on port {unit.port}")
+
+    def decode_result(self, result):
+        result = np.asarray(result, dtype=np.int64)
+        if self.signed:
+            result = codec.to_signed(result)
+        return result
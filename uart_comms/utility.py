@@ -1,10 +1,19 @@
+import atexit
 import serial
+import threading
 import time
 import numpy as np
 import random
+import codec
+from sparse import pack_sparse_matrix, densify_payload
+from instrument import NULL_INSTRUMENT
+from retransmit import RttEstimator, missing_mask, select_frames, resend_requests
+from compact import pack_blocks, BLOCK_MAX
+from rxbuf import RxBuffer
 
 class SAUnit:
-    def __init__(self, port, N=8, baudrate=921600, timeout=1):
+    def __init__(self, port, N=8, baudrate=921600, timeout=1, instrument=None, residency=None, compact=0,
+                 settle=2, probe=1):
         self.ser = serial.Serial(
             port=port,
             baudrate=baudrate,
@@ -18,22 +27,40 @@ class SAUnit:
         self.timeout = timeout
         self.port = port
         self.N = N
+        self.phases = {}    # per-phase timings (s) of the last write/read
+        self.instr = NULL_INSTRUMENT if instrument is None else instrument
+        self.residency = residency  # ResidencyCache, None => always send weights
+        self.caps = None            # extension mask, probed on first use
+        self.compact = compact      # block framing if the board has CAP_COMPACT
+        self.rtt = RttEstimator(initial=0.1)    # resend timeout, was a fixed 100 ms
+        self.rx = RxBuffer(self.ser)            # result path reads, see rxbuf.py
+        self.aligned = False        # board past DEADBEEF, waiting for a magic
+
+        if not self.ser.is_open:
+            raise Exception(f"Unable to open port {port}")
 
-        time.sleep(2)   # Stabilise
-
-        if self.ser.is_open:
+        if probe:
+            # done as soon as the board answers, rather than a blind wait
+            if not self.wait_ready(timeout=settle):
+                print(f"WARN: no answer from {port} after {settle}s, carrying on")
+        else:
+            time.sleep(settle)   # Stabilise
             self.reset()
-        else:   
-            raise Exception(f"Unable to open port {port}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def switch_mode(self, vector_mode):
-        if vector_mode:     # switch to vector mode
-            self.ser.write(bytes([0xFE]*4))
-        else:
-            self.ser.write(bytes([0xFD]*4))
+        self.instr.count('mode_switches')
+        self.invalidate_weights()   # mode switch resets the FPGA
+        self.aligned = False
+        self.ser.write(codec.TO_VECTOR if vector_mode else codec.TO_MATRIX)
         self.ser.flush()
 
-    def rand_test(self, vector_mode=1, verb=0):
+    def rand_test(self, vector_mode=1, verb=0, bulk=0):
         N = self.N
         if vector_mode:
             acts = [random.randint(0, 100) for i in range(N)]
@@ -49,7 +76,7 @@ class SAUnit:
         sys_start = time.time()
         succ, start_time = self.write_data(acts, weights, vector_mode=vector_mode, verb=verb, max_resends=5)
 
-        result, end_time = self.read_data(vector_mode=vector_mode, verb=verb)
+        result, end_time = self.read_data(vector_mode=vector_mode, verb=verb, bulk=bulk)
         sys_end = time.time()
         
         fpga_delta = end_time - start_time
@@ -60,51 +87,64 @@ class SAUnit:
         return (correct, fpga_delta, sys_delta)
     
     def reset(self, fpga=False):
+        self.rx.clear()
         self.ser.reset_input_buffer()
         self.ser.reset_output_buffer()
         if fpga:
+            self.instr.count('fpga_resets')
+            self.invalidate_weights()
+            self.aligned = False
             for _ in range(5):
                 self.ser.write(bytes([0xFF]*4))
             self.ser.flush()
 
-    def read_data(self, vector_mode=1, verb=0):
+    def read_data(self, vector_mode=1, verb=0, bulk=0, batch=0):
         if vector_mode:
             result = [None for i in range(self.N)]
         else:
             result = [[None for i in range(self.N)] for j in range(self.N)]
 
         # Note: removed saturating counter, trust UART...
-        mis_align = 0
+        rx = self.rx
+        skipped = 0
         ret_time = 0
         set_time = False
+        read_start = time.perf_counter()
         
         while True:
-            if self.ser.in_waiting >= 4:
-                if not set_time:
-                    ret_time = time.time()
-                    set_time = True
-                word = self.ser.read(4)
-                if verb:
-                    print("Received:", word.hex())
-                
-                curr_misal = 0
-                for i in range(4):
-                    if word.hex() == 'deadbeef':
-                        break
-                    word = word[3:4] + word[0:3]
-                    curr_misal += 1
-
-                if curr_misal == 4:
-                    print("ERR: extraneous", word.hex())
-                else:
-                    mis_align = curr_misal
-                    # Fix misalignment:
-                    self.ser.read(4-mis_align)
-                    break
+            # blocks (up to timeout) for a word, then takes all that's in
+            rx.fill(4)
+            if not len(rx):
+                continue
+            if not set_time:
+                ret_time = time.time()
+                set_time = True
+                first_data = time.perf_counter()
+                self.set_phase('compute', first_data - read_start)
+            if verb:
+                self.instr.log("Received:", rx.view[rx.start:rx.end].hex())
+
+            # DEADBEEF at any byte offset, what follows it is aligned
+            before = len(rx)
+            at = rx.sync(codec.DEADBEEF_RX)
+            if at is None:
+                skipped += before - len(rx)
+                continue
+            skipped += at
+            break
+
+        mis_align = skipped % 4
+        if skipped >= 4:
+            if verb:
+                self.instr.log(f"{skipped} extraneous bytes before DEADBEEF")
+            self.instr.count('extraneous_words', skipped // 4)
+        if mis_align:
+            self.instr.count('misalignment_corrections')
+        self.instr.count('dropped_bytes', skipped)
 
         if verb:
-            print("Asserted misalignment =", mis_align, "dropped", 4-mis_align, "to correct")
-            print("Ready to receive data")
+            self.instr.log("Asserted misalignment =", mis_align, "dropped", skipped, "to correct")
+            self.instr.log("Ready to receive data")
 
         # Send 5 to make sure FPGA catches 1
         for i in range(5):
@@ -113,23 +153,31 @@ class SAUnit:
         self.ser.flush()
 
         if verb:
-            print("Sent the 1st OK (0C), waiting for valid messages...") 
+            self.instr.log("Sent the 1st OK (0C), waiting for valid messages...") 
+
+        if bulk or batch:
+            result = self.read_results_bulk(vector_mode, verb, batch)
+            self.set_phase('readback', time.perf_counter() - first_data)
+            return (result, ret_time)
 
         while True:
-            if self.ser.in_waiting >= 4:
-                word = self.ser.read(4)
+            rx.fill(4)
+            words = rx.frames()
+            for i in range(0, len(words), 4):
+                word = words[i:i+4]
                 n = self.bytes_to_num(word)
                 msb = self.get_bit(n, 31)
                 if msb:
                     if verb:
-                        print("Extraneous message recvd", word.hex())
+                        self.instr.log("Extraneous message recvd", word.hex())
+                    self.instr.count('extraneous_words')
                     continue
                 
                 x_ix = self.get_bit_slice(n, 29, 23)
                 y_ix = self.get_bit_slice(n, 22, 16)
                 data = self.get_bit_slice(n, 15, 0)
                 if verb:
-                    print(f"Received result ({word.hex()}) for posn ({x_ix}, {y_ix}), data = {data}")
+                    self.instr.log(f"Received result ({word.hex()}) for posn ({x_ix}, {y_ix}), data = {data}")
 
                 if vector_mode:
                     result[y_ix] = data
@@ -138,11 +186,167 @@ class SAUnit:
 
                 if not self.has_nones(result, vector_mode):
                     if verb:
-                        print("Finished receiving, sending 2nd OK (1C)")
+                        self.instr.log("Finished receiving, sending 2nd OK (1C)")
                     self.ser.write(bytes([0x1C]*4))
                     self.ser.flush()
+                    # the rest are repeats, as when they were left on the port
+                    rx.clear()
+                    self.set_phase('readback', time.perf_counter() - first_data)
                     return (result, ret_time)
 
+    def read_results_bulk(self, vector_mode=1, verb=0, batch=0):
+        # Drain whatever is buffered in one read and decode all complete
+        # frames at once, straight out of the receive buffer. A bitmap of
+        # filled cells replaces has_nones so the 2nd OK goes out as soon as
+        # the last cell lands.
+        # batch=B reads B result vectors, indexed [x][y] (see mvm_batch)
+        N = self.N
+        if batch:
+            shape = (batch, N)
+        else:
+            shape = (N,) if vector_mode else (N, N)
+        result = np.zeros(shape, dtype=np.int64)
+        filled = np.zeros(shape, dtype=bool)
+        rx = self.rx
+        nack = self.caps is not None and self.caps & codec.CAP_NACK
+        deadline = time.perf_counter() + self.rtt.rto()
+
+        while True:
+            if nack and len(rx) < 4 and not self.ser.in_waiting:
+                # quiet for a round trip: ask for the missing cells only
+                # instead of waiting for the next full repeat
+                if time.perf_counter() > deadline:
+                    self.request_missing(filled, vector_mode, batch, verb)
+                    deadline = time.perf_counter() + self.rtt.rto()
+                time.sleep(0.0005)
+                continue
+            # blocks (up to timeout) until at least one full word is in
+            rx.fill(4)
+            words = rx.frames()
+            n = len(words)
+            if n == 0:
+                continue
+
+            msb, _, x_ix, y_ix, data = codec.decode_frames(codec.bytes_to_frames(words))
+            # msb set => deadbeef/handshake leftovers, drop out of range too
+            valid = (msb == 0) & (y_ix < N)
+            if batch:
+                valid &= (x_ix < batch)
+                ix = (x_ix[valid], y_ix[valid])
+            elif vector_mode:
+                ix = (y_ix[valid],)
+            else:
+                valid &= (x_ix < N)
+                ix = (y_ix[valid], x_ix[valid])
+            result[ix] = data[valid]
+            filled[ix] = True
+            if nack and valid.any():
+                deadline = time.perf_counter() + self.rtt.rto()
+            if self.instr.enabled:
+                self.instr.count('extraneous_words', n//4 - int(np.count_nonzero(valid)))
+
+            if verb:
+                self.instr.log(f"Decoded {n//4} words ({np.count_nonzero(valid)} results),",
+                               f"{filled.size - np.count_nonzero(filled)} cells missing")
+
+            if filled.all():
+                if verb:
+                    self.instr.log("Finished receiving, sending 2nd OK (1C)")
+                self.ser.write(bytes([0x1C]*4))
+                self.ser.flush()
+                rx.clear()
+                return result.tolist()
+
+    def probe_caps(self, timeout=0.05, verb=0):
+        # Only valid right after the 1st OK: the RTL skips anything but the
+        # magic there, so a board without extensions just never answers
+        self.ser.write(codec.CAPS_QUERY)
+        self.ser.flush()
+        self.caps = 0
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.ser.in_waiting >= 4:
+                word = self.ser.read(4)
+                if word[:2] == codec.CAPS_REPLY:
+                    self.caps = int.from_bytes(word[2:], byteorder='big')
+                    break
+            else:
+                time.sleep(0.001)
+        if verb:
+            self.instr.log(f"Board capabilities: {self.caps:#06x}")
+        return self.caps
+
+    def wait_ready(self, timeout=2, verb=0):
+        # Readiness probe: align until the 1st OK and read the caps while
+        # we are there. The board is left waiting for a magic (aligned), so
+        # the next write_payload skips its own alignment; the RTL goes back
+        # to idle after every 1C, so later ops still align. Nothing is
+        # reset, a board left mid-op by an earlier run won't answer until
+        # reset(fpga=True). False if it never answered (timeout None =>
+        # wait forever)
+        if self.aligned:
+            return True
+        start = time.time()
+        self.reset()
+        buf = b""
+        while timeout is None or time.time() - start < timeout:
+            self.ser.write(4*codec.DEADBEEF_TX)
+            self.ser.flush()
+            sent = time.time()
+            while time.time() - sent < 0.01:
+                if self.ser.in_waiting:
+                    buf = buf[-3:] + self.ser.read(self.ser.in_waiting)
+                    if codec.OK1 in buf:
+                        break
+                else:
+                    time.sleep(0.0005)
+            if codec.OK1 in buf:
+                self.probe_caps(verb=verb)
+                self.aligned = True
+                if verb:
+                    self.instr.log(f"Board on {self.port} ready after {time.time() - start:.3f}s")
+                return True
+        self.reset()
+        return False
+
+    def query_caps(self, verb=0):
+        # For callers that have to pick a protocol before the handshake
+        if self.caps is None:
+            self.wait_ready(timeout=None, verb=verb)
+        return self.caps
+
+    def invalidate_weights(self):
+        if self.residency is not None:
+            self.residency.invalidate(self.port)
+
+    def request_missing(self, filled, vector_mode=1, batch=0, verb=0):
+        # result cells back to the (x, y) the board sends them with
+        if batch:
+            x_ix, y_ix = np.nonzero(~filled)
+        elif vector_mode:
+            y_ix = np.flatnonzero(~filled)
+            x_ix = np.zeros_like(y_ix)
+        else:
+            y_ix, x_ix = np.nonzero(~filled)
+        if verb:
+            self.instr.log(f"Asking for {len(x_ix)} missing results")
+        self.instr.count('result_nacks')
+        self.ser.write(resend_requests(x_ix, y_ix))
+        self.ser.flush()
+
+    def poll_word(self, timeout):
+        # next 4 bytes once they are in, None if not within timeout
+        deadline = time.perf_counter() + timeout
+        while self.ser.in_waiting < 4:
+            if time.perf_counter() >= deadline:
+                return None
+            time.sleep(0.0005)
+        return self.ser.read(4)
+
+    def set_phase(self, name, seconds):
+        self.phases[name] = seconds
+        self.instr.observe(name, seconds)
+
     def has_nones(self, res, vector_mode):
         if vector_mode:
             for e in res:
@@ -168,88 +372,243 @@ class SAUnit:
         return (n & ((1<<(hi+1))-1)&~((1<<lo)-1))>>lo
  
 
-    def write_data(self, acts, weights, vector_mode=1, verb=0, max_resends=3):
+    def write_data(self, acts, weights, vector_mode=1, verb=0, max_resends=3, sparse=0):
+        if sparse:
+            weight_data = self.pack_sparse_matrix(weights)
+        else:
+            weight_data = self.pack_matrix(weights)
+
+        if vector_mode:
+            act_data = self.pack_vector(acts)
+        else:
+            act_data = self.pack_matrix(acts, is_weights=0) 
+
+        return self.write_payload(weight_data, act_data, verb=verb, max_resends=max_resends, sparse=sparse)
+
+    def write_payload(self, weight_data, act_data, verb=0, max_resends=3, sparse=0, batch=0):
+        # Same as write_data, for payloads already built by pack_matrix/pack_vector
+        # (or pack_sparse_matrix with sparse=1, codec.pack_batch with batch=B)
         if verb:
-            print("Beginning alignment procedure for writing")
+            self.instr.log("Beginning alignment procedure for writing")
 
+        self.phases = {}
+        phase_start = time.perf_counter()
+        key = None
+        acts_only = False
         while True:
-            msg = b'\xde\xad\xbe\xef'
-            self.ser.write(4*msg[::-1])   # little end
-            self.ser.flush()
-            if verb:
-                print("Sent", msg.hex())
-            time.sleep(0.01)
+            if self.aligned:
+                # wait_ready left the board waiting for a magic
+                self.aligned = False
+                word = codec.OK1
+            else:
+                msg = b'\xde\xad\xbe\xef'
+                self.ser.write(4*msg[::-1])   # little end
+                self.ser.flush()
+                if verb:
+                    self.instr.log("Sent", msg.hex())
 
-            if self.ser.in_waiting >= 4:
-                word = self.ser.read(4)
+                # the 0C as soon as it is in, another burst after 10 ms
+                self.instr.count('align_attempts')
+                word = self.poll_word(0.01)
+
+            if word is not None:
                 if verb:
-                    print("Received:", word.hex())
-                if word.hex() == '0c0c0c0c':
+                    self.instr.log("Received:", word.hex())
+                if word.hex() != '0c0c0c0c':
+                    self.instr.count('extraneous_words')
+                else:
                     if verb:
-                        print("Received 1st acknowledgement")
+                        self.instr.log("Received 1st acknowledgement")
+                    if self.caps is None:
+                        self.probe_caps(verb=verb)
+                    if sparse and not self.caps & codec.CAP_SPARSE:
+                        # plain board: send the pruned tile dense, same result
+                        weight_data = densify_payload(weight_data, self.N)
+                        sparse = 0
+                        self.instr.count('sparse_fallbacks')
+                    if self.residency is not None and self.caps & codec.CAP_RESIDENT:
+                        key = self.residency.key(weight_data)
+                        acts_only = self.residency.lookup(self.port, key, len(weight_data))
+                        if acts_only:
+                            self.instr.count('residency_hits')
                     magic = b'\xda\x22\x1d\x06'
-                    self.ser.write(magic[::-1])
+                    # packed weights need their x, so those stay as frames
+                    use_compact = self.compact and self.caps & codec.CAP_COMPACT and not sparse
+                    prefix = codec.COMPACT_PREFIX if use_compact else b""
+                    if batch:
+                        if not self.caps & codec.CAP_BATCH:
+                            raise Exception(f"Board on {self.port} does not take batches")
+                        full_magic = prefix + codec.MAGIC_BATCH + codec.batch_header(batch, sparse=sparse)
+                        lean_magic = prefix + codec.MAGIC_BATCH + codec.batch_header(batch, resident=1)
+                    else:
+                        full_magic = prefix + (codec.MAGIC_SPARSE if sparse else magic[::-1])
+                        lean_magic = prefix + codec.MAGIC_ACTS_ONLY
+                    self.ser.write(lean_magic if acts_only else full_magic)
                     self.ser.flush()
                     if verb:
-                        print("Sent magic", magic.hex())
+                        self.instr.log("Sent magic", magic.hex(), "(weights resident)" if acts_only else "(sparse)" if sparse else "")
                     break
 
         if verb:
-            print("Beginning to send data payload")
+            self.instr.log("Beginning to send data payload")
 
-        weight_data = self.pack_matrix(weights)
-
-        if vector_mode:
-            act_data = self.pack_vector(acts)
-        else:
-            act_data = self.pack_matrix(acts, is_weights=0) 
+        now = time.perf_counter()
+        self.set_phase('align', now - phase_start)
+        phase_start = first_resend = now
 
-        self.ser.write(weight_data)
-        self.ser.write(act_data)
+        payload = act_data if acts_only else weight_data + act_data
+        wire = pack_blocks(payload) if use_compact else payload
+        self.ser.write(wire)
         self.ser.flush()
+        sent_at = time.perf_counter()
 
         if verb:
-            print("Sent two packs")
-        time.sleep(0.01)
-        last_contact = time.time()
+            self.instr.log("Sent acts only" if acts_only else "Sent two packs")
+        nack = self.caps is not None and self.caps & codec.CAP_NACK
+        if not nack:
+            time.sleep(0.01)
+        deadline = time.perf_counter() + self.rtt.rto()
         num_times = 1
+        strikes = 1     # timeouts since the board last made progress
+        least_missing = None
+        block_max = BLOCK_MAX
+        clean = True    # Karn: only time round trips that had no repeats
+        query_at = None
         while True:
             if self.ser.in_waiting >= 4:
                 word = self.ser.read(4)
-                if word.hex() == '1c1c1c1c':
+                done = word.hex() == '1c1c1c1c'
+                if nack and not done:
+                    # 1C lost but the board has everything: it says so, or
+                    # has already moved on to sending results (DEADBEEF)
+                    done = word == codec.MISSING_REPLY + bytes(2) or word in 2*codec.DEADBEEF_RX
+                if done:
                     if verb:
-                        print("\nReceived 2nd acknowledgment, stopping sending")
+                        self.instr.log("Received 2nd acknowledgment, stopping sending")
+                    if key is not None:
+                        self.residency.store(self.port, key)
+                    now = time.perf_counter()
+                    if clean:
+                        self.rtt.sample(now - sent_at)
+                    else:
+                        self.rtt.backoff = 1    # delivered, next op starts fresh
+                    self.set_phase('transmit', first_resend - phase_start if num_times > 1 else now - phase_start)
+                    self.set_phase('resend', now - first_resend if num_times > 1 else 0.0)
                     return (True, time.time())
+                if acts_only and word == codec.WEIGHTS_STALE:
+                    # board lost its weights (power cycle, stray reset...),
+                    # it is still waiting for a magic so send everything
+                    if verb:
+                        self.instr.log("Weights not resident, sending full payload")
+                    self.residency.reject(self.port, len(weight_data))
+                    self.instr.count('residency_stale')
+                    acts_only = False
+                    payload = weight_data + act_data
+                    wire = pack_blocks(payload) if use_compact else payload
+                    self.ser.write(full_magic + wire)
+                    self.ser.flush()
+                    clean = False
+                    deadline = time.perf_counter() + self.rtt.rto()
+                    continue
+                if nack and word[:2] == codec.MISSING_REPLY:
+                    if query_at is not None:
+                        # a reply names its query, so this one is unambiguous
+                        self.rtt.sample(time.perf_counter() - query_at)
+                        query_at = None
+                    count = int.from_bytes(word[2:], byteorder='big')
+                    if least_missing is None or count < least_missing:
+                        least_missing = count
+                        strikes = 1
+                    if count == codec.MISSING_ALL:
+                        # magic never arrived, start over
+                        resend = (lean_magic if acts_only else full_magic) + wire
+                    else:
+                        missing = codec.bytes_to_frames(self.ser.read(4*count))
+                        if use_compact:
+                            # a block is lost if any word is, so go smaller
+                            # each round on a link that keeps losing them
+                            block_max = max(2, block_max // 2)
+                            resend = pack_blocks(payload, missing_mask(payload, missing, sparse), block_max)
+                        else:
+                            resend = select_frames(payload, missing, sparse)
+                    if verb:
+                        self.instr.log(f"Board is missing {count} frames, resending {len(resend)} bytes")
+                    self.instr.count('selective_resends')
+                    self.instr.count('resent_frames', len(payload)//4 if count == codec.MISSING_ALL else count)
+                    self.ser.write(resend)
+                    self.ser.flush()
+                    deadline = time.perf_counter() + self.rtt.rto()
+                    continue
+                self.instr.count('extraneous_words')
 
-            if time.time() - last_contact > 0.1:
-                if num_times == max_resends:
+            if time.perf_counter() > deadline:
+                if strikes == max_resends:
                     if verb:
-                        print("Timeout, max resends reached. Abort.")
+                        self.instr.log("Timeout, max resends reached. Abort.")
+                    self.instr.count('write_failures')
+                    self.invalidate_weights()
                     return (False, 0)
-                if verb:
-                    print("Timeout... resending")
-                self.ser.write(weight_data)
-                self.ser.write(act_data)
-                self.ser.flush() 
-                time.sleep(0.01)
+                if num_times == 1:
+                    first_resend = time.perf_counter()
+                clean = False
+                self.rtt.timeout()
+                if nack:
+                    if verb:
+                        self.instr.log("Timeout... asking for missing frames")
+                    self.instr.count('missing_queries')
+                    self.ser.write(codec.MISSING_QUERY)
+                    self.ser.flush()
+                    query_at = time.perf_counter()
+                else:
+                    if verb:
+                        self.instr.log("Timeout... resending")
+                    self.instr.count('resends')
+                    self.ser.write(wire)
+                    self.ser.flush()
+                    time.sleep(0.01)
                 num_times += 1
-        
+                strikes += 1
+                deadline = time.perf_counter() + self.rtt.rto()
+
     def pack_matrix(self, mat, is_weights=1):
-        ret = b""
-        for y_ix in range(self.N):
-            for x_ix in range(self.N):
-                data = mat[x_ix][y_ix]
-                data_frame = self.build_dataframe(0,is_weights,x_ix,y_ix,data)
-                ret += data_frame
-        return ret
+        return codec.pack_matrix(np.asarray(mat)[:self.N, :self.N], is_weights)
 
     def pack_vector(self, vec):
-        ret = b""
-        for y_ix in range(self.N):
-            data = vec[y_ix]
-            data_frame = self.build_dataframe(0,0,0,y_ix,data)
-            ret += data_frame
-        return ret
+        return codec.pack_vector(np.asarray(vec)[:self.N])
+
+    def mvm_batch(self, acts, weights, verb=0, max_resends=3, sparse=0):
+        # (B, N) act vectors against one weight tile -> (B, N) results.
+        # Boards with CAP_BATCH take up to codec.BATCH_MAX vectors per
+        # handshake, others fall back to one handshake per vector.
+        acts = np.asarray(acts)[:, :self.N]
+        B = acts.shape[0]
+        out = np.zeros((B, self.N), dtype=np.int64)
+        if sparse:
+            weight_data = self.pack_sparse_matrix(weights)
+        else:
+            weight_data = self.pack_matrix(weights)
+
+        if not self.query_caps(verb) & codec.CAP_BATCH:
+            for b in range(B):
+                succ, _ = self.write_payload(weight_data, self.pack_vector(acts[b]), verb=verb,
+                                             max_resends=max_resends, sparse=sparse)
+                if not succ:
+                    raise Exception(f"Write to {self.port} failed at vector {b}")
+                out[b], _ = self.read_data(vector_mode=1, verb=verb, bulk=1)
+            return out
+
+        for start in range(0, B, codec.BATCH_MAX):
+            chunk = acts[start:start + codec.BATCH_MAX]
+            succ, _ = self.write_payload(weight_data, codec.pack_batch(chunk), verb=verb,
+                                         max_resends=max_resends, sparse=sparse, batch=len(chunk))
+            if not succ:
+                raise Exception(f"Batch write to {self.port} failed at vector {start}")
+            out[start:start + len(chunk)], _ = self.read_data(verb=verb, batch=len(chunk))
+            self.instr.count('batched_vectors', len(chunk))
+        return out
+
+    def pack_sparse_matrix(self, mat):
+        return pack_sparse_matrix(np.asarray(mat)[:self.N, :self.N])
 
     def build_dataframe(self, msb, weight, xix, yix, data):
         xix  = self.get_bit_slice(xix,   6, 0)
@@ -263,5 +622,46 @@ class SAUnit:
 
     def close(self):
         if self.ser and self.ser.is_open:
+            if self.aligned:
+                # don't leave the board waiting for a magic that never comes
+                self.ser.write(codec.RESET)
+                self.ser.flush()
             self.ser.close()
             print(f"\nClosed port {self.port}") 
+
+
+# Open units by port, so repeated jobs in one process (notebooks, sweeps,
+# servers) reuse an open, already probed link instead of reopening it:
+#
+#   port = get_unit("COM35", N=8)    # same object on every call
+#
+# The first op on a fresh unit skips alignment (see wait_ready), the RTL
+# drops back to idle after each op so every later op aligns again. Asking
+# for a port that is open with other settings is an error, close_units()
+# (or the unit's close()) first.
+_units = {}
+_units_lock = threading.Lock()
+
+
+def get_unit(port, N=8, baudrate=921600, **kwargs):
+    config = dict(N=N, baudrate=baudrate, **kwargs)
+    with _units_lock:
+        entry = _units.get(port)
+        if entry is not None and entry[0].ser.is_open:
+            unit, open_config = entry
+            if open_config != config:
+                raise ValueError(f"{port} is already open with {open_config}, asked for {config}")
+            return unit
+        unit = SAUnit(port, N=N, baudrate=baudrate, **kwargs)
+        _units[port] = (unit, config)
+        return unit
+
+
+def close_units():
+    with _units_lock:
+        for unit, _ in _units.values():
+            unit.close()
+        _units.clear()
+
+
+atexit.register(close_units)
@@ -0,0 +1,172 @@
+import queue
+import random
+import threading
+import numpy as np
+from tiling import TiledEngine
+
+# Probabilistic checking of device results off the critical path. A tile
+# result R = weights.T @ acts (mod 2^16, as it comes off the wire) is
+# checked with Freivalds' trick: for random vectors r,
+#
+#   R @ r == weights.T @ (acts @ r)     (mod 2^16)
+#
+# which is O(N^2) per vector instead of the O(N^3) reference matmul. A
+# wrong tile slips through one vector with probability at most 1/2 (errors
+# that are all multiples of 2^15), ~2^-16 for a typical corrupted word, so
+# `rounds` vectors bound it by 2^-rounds. MVM tiles have nothing to gain
+# from a projection (the check costs as much as the product), so they are
+# checked exactly; `rate` samples which tiles get checked at all.
+#
+#   engine = VerifiedEngine(unit, rate=0.25)
+#   Y = engine.gemm(W, X)       # failed tiles are re-sent before returning
+#   print(engine.vstats)
+
+
+def freivalds_check(weights, acts, result, rounds=2, bits=16, rng=None):
+    mask = (1 << bits) - 1
+    weights = np.asarray(weights, dtype=np.int64)
+    acts = np.asarray(acts, dtype=np.int64)
+    result = np.asarray(result, dtype=np.int64) & mask
+    if acts.ndim == 1:
+        return np.array_equal((weights.T @ acts) & mask, result)
+    rng = np.random.default_rng() if rng is None else rng
+    r = rng.integers(0, 1 << bits, size=(acts.shape[1], rounds), dtype=np.int64)
+    # int64 wraparound is harmless, 2^bits divides 2^64
+    lhs = ((result @ r) & mask)
+    rhs = (weights.T @ ((acts @ r) & mask)) & mask
+    return np.array_equal(lhs, rhs)
+
+
+class VerifyStats:
+    def __init__(self):
+        self.submitted = 0
+        self.checked = 0
+        self.failed = 0
+        self.requeued = 0
+
+    def __str__(self):
+        return (f"{self.checked}/{self.submitted} tiles checked, {self.failed} failed, "
+                f"{self.requeued} re-sent")
+
+
+class Verifier:
+    # Background thread checking (key, weights, acts, result) items. Keys
+    # of failed items are collected for the caller to re-queue. The thread
+    # starts with the first submit and stops at close(), which can be
+    # followed by more submits
+
+    def __init__(self, rate=1.0, rounds=2, bits=16, seed=None):
+        self.rate = rate
+        self.rounds = rounds
+        self.bits = bits
+        self.sampler = random.Random(seed)
+        self.rng = np.random.default_rng(seed)
+        self.stats = VerifyStats()
+        self.failures = []
+        self.lock = threading.Lock()
+        self.items = queue.Queue()
+        self.error = None
+        self.thread = None
+
+    def submit(self, key, weights, acts, result, force=False):
+        # returns whether the item will be checked
+        self.stats.submitted += 1
+        if not force and self.sampler.random() >= self.rate:
+            return False
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._worker, daemon=True)
+            self.thread.start()
+        self.items.put((key, weights, acts, result))
+        return True
+
+    def _worker(self):
+        while True:
+            item = self.items.get()
+            try:
+                if item is None:
+                    return
+                key, weights, acts, result = item
+                ok = freivalds_check(weights, acts, result, self.rounds, self.bits, self.rng)
+                with self.lock:
+                    self.stats.checked += 1
+                    if not ok:
+                        self.stats.failed += 1
+                        self.failures.append(key)
+            except BaseException as e:
+                self.error = e
+            finally:
+                self.items.task_done()
+
+    def drain(self):
+        # wait for everything submitted so far, -> keys that failed since
+        # the last drain
+        self.items.join()
+        if self.error is not None:
+            raise self.error
+        with self.lock:
+            failed, self.failures = self.failures, []
+        return failed
+
+    def close(self):
+        # failures nobody drained (a run that raised) go with the thread
+        if self.thread is None:
+            return
+        self.items.put(None)
+        self.thread.join()
+        self.thread = None
+        self.failures = []
+        self.error = None
+
+
+class VerifiedEngine(TiledEngine):
+    # TiledEngine whose tile results are accumulated right away and checked
+    # on a Verifier thread meanwhile. Once every tile is sent, the failed
+    # ones are backed out of the output, re-sent and checked again (always,
+    # whatever the rate), up to max_requeues rounds. The checking thread
+    # only lives for the length of a run
+
+    def __init__(self, unit, rate=1.0, rounds=2, max_requeues=3, seed=None, **kwargs):
+        super().__init__(unit, **kwargs)
+        self.verifier = Verifier(rate=rate, rounds=rounds, seed=seed)
+        self.max_requeues = max_requeues
+        self.vstats = self.verifier.stats
+
+    def run(self, jobs, out, vector_mode):
+        try:
+            results = {}
+            for ix, (out_ix, weights, acts) in enumerate(jobs):
+                raw = self.send_tile(self.pack_tile(weights, acts, vector_mode), vector_mode)
+                results[ix] = self.decode_result(raw)
+                out[out_ix] += results[ix]
+                self.verifier.submit(ix, weights, acts, raw)
+
+            for _ in range(self.max_requeues):
+                failed = self.verifier.drain()
+                if not failed:
+                    return
+                if self.verb:
+                    print(f"[{self.unit.port}] {len(failed)} tiles failed verification, re-sending")
+                for ix in failed:
+                    out_ix, weights, acts = jobs[ix]
+                    out[out_ix] -= results[ix]
+                    raw = self.send_tile(self.pack_tile(weights, acts, vector_mode), vector_mode)
+                    results[ix] = self.decode_result(raw)
+                    out[out_ix] += results[ix]
+                    self.vstats.requeued += 1
+                    self.verifier.submit(ix, weights, acts, raw, force=True)
+
+            failed = self.verifier.drain()
+            if failed:
+                raise Exception(f"{len(failed)} tiles still wrong after {self.max_requeues} re-sends "
+                                f"on port {self.unit.port}")
+        finally:
+            self.verifier.close()
+
+    def close(self):
+        self.verifier.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()